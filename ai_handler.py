@@ -1,52 +1,273 @@
-from groq import Groq
+from groq import Groq, RateLimitError, InternalServerError, APIConnectionError, APITimeoutError
 import os
 import json
-import base64
 from PIL import Image
 from concurrent.futures import ThreadPoolExecutor
 import threading
 import queue
-import chromadb
-from chromadb.config import Settings
-from fashion_clip.fashion_clip import FashionCLIP
 import numpy as np
 import datetime
 import random
+import logging
+import time
+from contextlib import nullcontext
+from encoders import create_encoder
+from vector_store import create_backend, user_category_collection, parse_collection_name, APPAREL_TYPES
+from catalog import CatalogIndex
+from local_tagger import ZeroShotTagger
+from image_io import ImageInput, as_image_input
+from result_cache import LRUCache, normalize_text, file_version
+import metrics
+import metadata_store
+import log_config
+import rate_limit
+import deadlines
+import pairing_graph
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+VECTOR_DB_DIR = "./vector_db"
+# "chroma" (HNSW, default) or "numpy" (exact cosine search, suited to small wardrobes)
+VECTOR_BACKEND = os.environ.get("WEARWIZ_VECTOR_BACKEND", "chroma")
+# Storage precision for embeddings: "float32", "float16" or "int8" (scalar-quantized)
+EMBEDDING_DTYPE = os.environ.get("WEARWIZ_EMBEDDING_DTYPE", "float32")
+# "per_user" (one collection per user and category) or "shared" (one collection
+# per category for all users, filtered by the username metadata)
+COLLECTION_LAYOUT = os.environ.get("WEARWIZ_COLLECTION_LAYOUT", "per_user")
+# Store one vector per unique image across all users instead of per-user copies
+SHARED_CATALOG = os.environ.get("WEARWIZ_SHARED_CATALOG", "0") == "1"
+# FashionCLIP checkpoint; recorded on every item so tools/reindex.py can find
+# embeddings produced by an older checkpoint
+EMBEDDING_MODEL = os.environ.get("WEARWIZ_EMBEDDING_MODEL", "fashion-clip")
+# FashionCLIP runtime: "torch" (fp32 PyTorch), or "onnx" / "onnx-int8" to run
+# the graphs exported by tools/export_onnx.py into WEARWIZ_ONNX_DIR
+ENCODER = os.environ.get("WEARWIZ_ENCODER", "torch")
+ONNX_DIR = os.environ.get("WEARWIZ_ONNX_DIR", "./models/onnx")
+ENCODER_THREADS = int(os.environ.get("WEARWIZ_ENCODER_THREADS", "0")) or None
+# Text-recommendation caches (entries, seconds); a size of 0 disables caching
+RECOMMENDATION_CACHE_SIZE = int(os.environ.get("WEARWIZ_RECOMMENDATION_CACHE_SIZE", "1024"))
+RECOMMENDATION_CACHE_TTL = float(os.environ.get("WEARWIZ_RECOMMENDATION_CACHE_TTL", "3600"))
+# Admission control for Groq: requests per minute shared by all calls of every
+# process using GROQ_LIMIT_DB (empty: a quota per process; RPM 0 disables),
+# burst size, and how long each priority may queue
+GROQ_REQUESTS_PER_MINUTE = float(os.environ.get("WEARWIZ_GROQ_RPM", "30"))
+GROQ_BURST = int(os.environ.get("WEARWIZ_GROQ_BURST", "5"))
+GROQ_LIMIT_DB = os.environ.get("WEARWIZ_GROQ_LIMIT_DB", "./groq_limit.db")
+GROQ_QUEUE_TIMEOUTS = {
+    rate_limit.INTERACTIVE: float(os.environ.get("WEARWIZ_GROQ_INTERACTIVE_TIMEOUT", "30")),
+    rate_limit.INGEST: float(os.environ.get("WEARWIZ_GROQ_INGEST_TIMEOUT", "600")),
+    rate_limit.PREFETCH: float(os.environ.get("WEARWIZ_GROQ_PREFETCH_TIMEOUT", "60")),
+}
+GROQ_MAX_ATTEMPTS = int(os.environ.get("WEARWIZ_GROQ_MAX_ATTEMPTS", "4"))
+# Seconds of a recommendation's budget kept back from the LLM call, so that
+# when Groq is slow there is still time to match on embeddings alone
+FALLBACK_RESERVE = float(os.environ.get("WEARWIZ_FALLBACK_RESERVE", "1.0"))
+# How ingest describes and categorizes items: "vision" (Groq vision model),
+# "local" (FashionCLIP zero-shot tagging, enriched later by tools/enrich.py) or
+# "auto" (vision, falling back to local tagging when Groq fails)
+INGEST_MODE = os.environ.get("WEARWIZ_INGEST_MODE", "vision")
+# Items removed per step of a deletion job (one metadata write per batch)
+DELETE_BATCH_SIZE = int(os.environ.get("WEARWIZ_DELETE_BATCH_SIZE", "100"))
+# Near-duplicate uploads: a new image at least DUPLICATE_THRESHOLD cosine-similar
+# to one of the user's items reuses that item's annotations instead of calling
+# the vision model. DUPLICATE_ACTION "flag" keeps the upload marked as a possible
+# duplicate, "merge" drops it in favour of the existing item, "off" disables the check
+DUPLICATE_THRESHOLD = float(os.environ.get("WEARWIZ_DUPLICATE_THRESHOLD", "0.95"))
+DUPLICATE_ACTION = os.environ.get("WEARWIZ_DUPLICATE_ACTION", "flag")
+# Pairing-aware retrieval: the top PAIRING_CANDIDATES matches for an item gain
+# PAIRING_WEIGHT * log(1 + times worn with it), halved every PAIRING_HALF_LIFE_DAYS
+# since last worn (0 disables; a negative weight favours combinations not worn yet)
+PAIRING_WEIGHT = float(os.environ.get("WEARWIZ_PAIRING_WEIGHT", "0.02"))
+PAIRING_HALF_LIFE_DAYS = float(os.environ.get("WEARWIZ_PAIRING_HALF_LIFE_DAYS", "30"))
+PAIRING_CANDIDATES = int(os.environ.get("WEARWIZ_PAIRING_CANDIDATES", "5"))
 
 # Initialize clients and models
-client = Groq(api_key="")
-fclip = FashionCLIP('fashion-clip')
-chroma_client = chromadb.Client(Settings(
-    persist_directory="./vector_db",
-    is_persistent=True
-))
+# GROQ_BASE_URL can point at a compatible local server (see benchmarks/fake_groq.py)
+# Retries are handled by groq_chat so they go through the shared rate limiter
+client = Groq(api_key=os.environ.get("GROQ_API_KEY", ""), base_url=os.environ.get("GROQ_BASE_URL") or None,
+              max_retries=0)
+groq_limiter = rate_limit.FairTokenBucket(
+    GROQ_REQUESTS_PER_MINUTE / 60, GROQ_BURST,
+    shared=rate_limit.SharedTokens(GROQ_LIMIT_DB) if GROQ_LIMIT_DB and GROQ_REQUESTS_PER_MINUTE > 0 else None
+)
+fclip = create_encoder(ENCODER, EMBEDDING_MODEL, onnx_dir=ONNX_DIR, threads=ENCODER_THREADS)
+vector_backend = create_backend(VECTOR_BACKEND, VECTOR_DB_DIR, dtype=EMBEDDING_DTYPE)
+catalog_index = CatalogIndex(vector_backend, VECTOR_DB_DIR) if SHARED_CATALOG else None
+local_tagger = ZeroShotTagger(fclip)
+pairings = pairing_graph.PairingGraph()
+
+# Finished text recommendations keyed on (username, prompt, wardrobe version), and
+# the wardrobe-independent first step (bottom description + embedding) shared by all users
+text_recommendation_cache = LRUCache(RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL)
+bottom_suggestion_cache = LRUCache(RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL)
 
 # Initialize thread pool executor and processing queue
 executor = ThreadPoolExecutor(max_workers=3)
 processing_queue = queue.Queue()
 
-def get_user_collection(username):
-    """Get or create user-specific ChromaDB collection"""
-    collection_name = f"fashion_items_{username}"
+def groq_chat(call, **kwargs):
+    """Run a Groq chat completion, recording its latency under ``call``.
+
+    Every attempt waits for the shared rate limiter under the caller's
+    rate_limit.scope. A 429 pauses admission for everyone for the provider's
+    Retry-After; 5xx and connection errors back off exponentially. Raises
+    rate_limit.AdmissionTimeout once the priority's queue deadline passes.
+
+    Within a request budget (see deadlines), admission, retries and the HTTP
+    timeout of each attempt are all bounded by what is left of it.
+    """
+    user, priority = rate_limit.current_scope()
+    deadline = time.monotonic() + GROQ_QUEUE_TIMEOUTS.get(priority, GROQ_QUEUE_TIMEOUTS[rate_limit.INTERACTIVE])
+    if deadlines.expires_at() is not None:
+        deadline = min(deadline, deadlines.expires_at())
+    for attempt in range(1, GROQ_MAX_ATTEMPTS + 1):
+        deadlines.check(f"groq_{call}")
+        groq_limiter.acquire(user, priority, deadline)
+        if deadlines.remaining() is not None:
+            kwargs['timeout'] = max(deadlines.remaining(), 0.001)
+        try:
+            with metrics.timed("wearwiz_groq_request_seconds", call=call):
+                return client.chat.completions.create(**kwargs)
+        except (RateLimitError, InternalServerError, APIConnectionError) as e:
+            delay = rate_limit.retry_after(e) or min(2 ** (attempt - 1), 30)
+            if attempt == GROQ_MAX_ATTEMPTS or time.monotonic() + delay > deadline:
+                raise
+            logger.warning("Groq %s call failed (%s), retrying in %.1fs (attempt %d/%d)",
+                           call, e.__class__.__name__, delay, attempt, GROQ_MAX_ATTEMPTS)
+            if isinstance(e, RateLimitError):
+                groq_limiter.pause(delay)
+            else:
+                time.sleep(delay)
+
+def groq_first_line(call, **kwargs):
+    """Stream a completion and stop reading at the end of its first non-empty line.
+
+    The text prompts ask for a single-line answer, so anything after the
+    first newline is discarded anyway; closing the stream there saves the
+    rest of the generation time.
+    """
+    stream = groq_chat(call, stream=True, **kwargs)
+    text = ''
     try:
-        return chroma_client.get_collection(name=collection_name)
-    except ValueError:
-        return chroma_client.create_collection(
-            name=collection_name,
-            metadata={"hnsw:space": "cosine", "username": username}
-        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            text += chunk.choices[0].delta.content or ''
+            if '\n' in text.lstrip():
+                break
+            deadlines.check(f"groq_{call}")
+    finally:
+        stream.close()
+    return text.strip().split('\n')[0].strip()
 
-def get_user_category_collection(username, category):
-    """Get or create user and category specific ChromaDB collection"""
-    collection_name = f"fashion_items_{username}_{category}"
+def suggest_description(call, prompt, fallback, first_line=False):
+    """The LLM's one-line suggestion for ``prompt``, or ``fallback`` if the budget can't fit it.
+
+    Returns (description, degraded). The LLM gets the request's budget minus
+    FALLBACK_RESERVE; when that is too little, or Groq can't answer within
+    it, the ``fallback`` description is embedded and matched instead, so the
+    recommendation degrades to an embedding-only match rather than failing.
+    Without a request budget (ingest, prefetch) failures raise as usual.
+    """
+    remaining = deadlines.remaining()
+    if remaining is not None and remaining <= FALLBACK_RESERVE:
+        metrics.inc("wearwiz_degraded_responses_total", reason="no_llm_budget")
+        logger.warning("No budget left for the %s call, matching on embeddings only", call)
+        return fallback, True
+    request = dict(model="llama-3.2-90b-text-preview", messages=[{"role": "user", "content": prompt}])
     try:
-        return chroma_client.get_collection(name=collection_name)
-    except Exception as e:
-        print(f"Collection {collection_name} not found.. creating the collection")
-        return chroma_client.create_collection(
-            name=collection_name,
-            metadata={"hnsw:space": "cosine", "username": username, "category": category}
+        with deadlines.budget(remaining - FALLBACK_RESERVE) if remaining is not None else nullcontext():
+            if first_line:
+                return groq_first_line(call, **request), False
+            return groq_chat(call, **request).choices[0].message.content.strip(), False
+    except (deadlines.DeadlineExceeded, rate_limit.AdmissionTimeout, APITimeoutError) as e:
+        if remaining is None:
+            raise
+        metrics.inc("wearwiz_degraded_responses_total", reason="llm_timeout")
+        logger.warning("Groq %s call did not finish in budget (%s), matching on embeddings only",
+                       call, e.__class__.__name__)
+        return fallback, True
+
+def embed_text(text):
+    """Encode a description into an L2-normalized FashionCLIP text embedding"""
+    deadlines.check("text_embedding")
+    with metrics.stage("text_embedding"):
+        text_embedding = fclip.encode_text([text], batch_size=1)[0]
+        return text_embedding/np.linalg.norm(text_embedding)
+
+def get_user_collection(username):
+    """Get or create user-specific vector collection"""
+    return vector_backend.get_or_create_collection(
+        f"fashion_items_{username}",
+        metadata={"hnsw:space": "cosine", "username": username}
+    )
+
+def get_user_category_collection(username, category):
+    """Get or create user and category specific vector collection"""
+    return user_category_collection(vector_backend, username, category, COLLECTION_LAYOUT)
+
+def pairing_boost(stats):
+    """Ranking bonus for a candidate worn ``(count, last_used)`` with the base item"""
+    return pairing_graph.boost(stats, PAIRING_WEIGHT, PAIRING_HALF_LIFE_DAYS)
+
+def find_best_match(metadata, username, category, embedding, base_id=None):
+    """Query a user's category collection and resolve the top hit to its metadata item.
+
+    With ``base_id``, the top PAIRING_CANDIDATES hits are re-ranked by how
+    often and how recently each was worn with that item (see pairing_boost).
+    """
+    deadlines.check("vector_query")
+    partners = None
+    if base_id is not None and PAIRING_WEIGHT and PAIRING_CANDIDATES > 1:
+        with metrics.stage("pairing_lookup"):
+            partners = user_pairings(username).partners(username, base_id)
+    if catalog_index is not None:
+        return find_best_catalog_match(metadata, username, category, embedding, partners)
+
+    collection = get_user_category_collection(username, category)
+    with metrics.stage("vector_query"):
+        results = collection.query(
+            query_embeddings=[embedding.tolist()],
+            n_results=max(1, min(PAIRING_CANDIDATES, collection.count())) if partners else 1,
+            include=['metadatas', 'documents', 'distances']
         )
+    if not results['metadatas'][0]:
+        return None, None
+
+    hits = results['metadatas'][0]
+    scores = [
+        1 - distance + pairing_boost(partners.get(str(hit['image_id'])) if partners else None)
+        for hit, distance in zip(hits, results['distances'][0])
+    ]
+    best_match_metadata = hits[int(np.argmax(scores))]
+    best_match = next(
+        (item for item in metadata if str(item['image_id']) == str(best_match_metadata['image_id'])),
+        None
+    )
+    return best_match_metadata, best_match
+
+def find_best_catalog_match(metadata, username, category, embedding, partners=None):
+    """Shared-catalog variant of find_best_match restricted to the user's items"""
+    with metrics.stage("vector_query"):
+        hits = catalog_index.query(embedding, n_results=PAIRING_CANDIDATES if partners else 1,
+                                   username=username, category=category)
+    if not hits:
+        return None, None
+
+    user_items = catalog_index.user_items(username, category)
+    if partners:
+        hash_boosts = {}
+        for image_id, item_hash in user_items.items():
+            boost = pairing_boost(partners.get(str(image_id)))
+            hash_boosts[item_hash] = max(hash_boosts.get(item_hash, 0.0), boost, key=abs)
+        best_hash = max(hits, key=lambda hit: hit[1] + hash_boosts.get(hit[0], 0.0))[0]
+    else:
+        best_hash = hits[0][0]
+    image_ids = {image_id for image_id, item_hash in user_items.items() if item_hash == best_hash}
+    best_match = next((item for item in metadata if str(item['image_id']) in image_ids), None)
+    best_match_metadata = {"content_hash": best_hash, "image_ids": sorted(image_ids)}
+    return best_match_metadata, best_match
 
 def generate_embeddings(image_path, description):
     """Generate embeddings for both image and text"""
@@ -68,27 +289,14 @@ def generate_embeddings(image_path, description):
             'timestamp': str(datetime.datetime.now())
         }
     except Exception as e:
-        print(f"Error generating embeddings: {e}")
+        logger.error("Error generating embeddings: %s", e)
         return None
 
 def store_embeddings(username, image_id, embeddings, description, filename, category):
-    """Store embeddings in user's category-specific ChromaDB collection"""
+    """Store embeddings in user's category-specific vector collection"""
     try:
         # Get or create category-specific collection
-        collection_name = f"fashion_items_{username}_{category}"
-        try:
-            collection = chroma_client.get_collection(name=collection_name)
-            print(f"Collection {collection_name} already exists")
-        except Exception as e:
-            print(f"Creating new collection for user {username} and category {category}")
-            collection = chroma_client.create_collection(
-                name=collection_name,
-                metadata={
-                    "hnsw:space": "cosine", 
-                    "username": username,
-                    "category": category
-                }
-            )
+        collection = get_user_category_collection(username, category)
         
         # Store embeddings with metadata
         collection.add(
@@ -103,22 +311,171 @@ def store_embeddings(username, image_id, embeddings, description, filename, cate
             }],
             ids=[f"{username}_{category}_{image_id}"]
         )
-        print(f"Stored embeddings for image {image_id} in collection {collection_name}")
+        logger.debug("Stored embeddings for image %s in collection %s", image_id, collection.name)
         return True
     except Exception as e:
-        print(f"Error storing embeddings: {e}")
+        logger.error("Error storing embeddings: %s", e)
         return False
 
+def embed_images(image_paths, batch_size=16):
+    """Encode a batch of images into L2-normalized FashionCLIP embeddings"""
+    images = [Image.open(path).convert('RGB') for path in image_paths]
+    embeddings = np.asarray(fclip.encode_images(images, batch_size=batch_size))
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def index_item_embedding(username, image_id, filename, description, category, embedding,
+                         item_hash=None, previous_category=None, replace=False):
+    """Write an item's image embedding to the vector store.
+
+    Moves the vector out of ``previous_category``'s collection when the item
+    was re-categorized; ``replace`` overwrites a shared-catalog vector that was
+    produced by another checkpoint.
+    """
+    if catalog_index is not None:
+        catalog_index.add_item(item_hash, embedding, description, category, replace=replace)
+        catalog_index.add_member(item_hash, username, image_id, category)
+        return
+
+    if previous_category and previous_category != category:
+        old_collection = get_user_category_collection(username, previous_category)
+        old_collection.delete(ids=[f"{username}_{previous_category}_{image_id}"])
+
+    collection = get_user_category_collection(username, category)
+    collection.upsert(
+        embeddings=[np.asarray(embedding, dtype=np.float32).tolist()],  # Store normalized image embedding
+        documents=[description],
+        metadatas=[{
+            "image_id": image_id,
+            "filename": filename,
+            "timestamp": str(datetime.datetime.now()),
+            "username": username,
+            "category": category
+        }],
+        ids=[f"{username}_{category}_{image_id}"]
+    )
+
+def index_item_embeddings(username, items, embeddings):
+    """Bulk index_item_embedding for items embedded elsewhere (e.g. an imported
+    archive): one upsert per category collection, or one catalog write.
+
+    Each vector goes to the item's ``indexed_category``.
+    """
+    if not items:
+        return
+    if catalog_index is not None:
+        catalog_index.add_items([item['content_hash'] for item in items], embeddings,
+                                [item['description'] for item in items],
+                                [item.get('indexed_category', item['apparel_type']) for item in items])
+        catalog_index.add_members(username, {
+            item['image_id']: (item['content_hash'], item.get('indexed_category', item['apparel_type']))
+            for item in items
+        })
+        return
+
+    groups = {}
+    for item, embedding in zip(items, embeddings):
+        groups.setdefault(item.get('indexed_category', item['apparel_type']), []).append((item, embedding))
+    timestamp = str(datetime.datetime.now())
+    for category, rows in groups.items():
+        get_user_category_collection(username, category).upsert(
+            embeddings=[np.asarray(embedding, dtype=np.float32).tolist() for _, embedding in rows],
+            documents=[item['description'] for item, _ in rows],
+            metadatas=[{
+                "image_id": item['image_id'],
+                "filename": item['filename'],
+                "timestamp": timestamp,
+                "username": username,
+                "category": category
+            } for item, _ in rows],
+            ids=[f"{username}_{category}_{item['image_id']}" for item, _ in rows]
+        )
+
+def remove_item_vectors(username, items):
+    """Delete items' vectors from every category collection they could be in.
+
+    With the shared catalog, drops the user's memberships and then the
+    vectors of content no user owns any more.
+    """
+    if not items:
+        return
+    if catalog_index is not None:
+        hashes = [entry['hash'] for entry in
+                  (catalog_index.remove_member(username, item['image_id']) for item in items) if entry]
+        catalog_index.remove_unowned(hashes)
+        return
+    for category in APPAREL_TYPES:
+        collection = get_user_category_collection(username, category)
+        collection.delete(ids=[f"{username}_{category}_{item['image_id']}" for item in items])
+
+def mark_for_deletion(username, image_ids=None):
+    """Hide items (all if ``image_ids`` is None) ahead of their background deletion; returns the IDs marked"""
+    marked = []
+    with metadata_store.update(username) as metadata:
+        for item in metadata:
+            if image_ids is None or str(item['image_id']) in image_ids:
+                item['processing_status'] = 'deleting'
+                marked.append(str(item['image_id']))
+    return marked
+
+def delete_items(username, image_ids, clear=False, on_progress=None):
+    """Delete items' vectors, image files and metadata rows in batches.
+
+    Vectors go first, so deleted items stop being matched before their
+    metadata disappears; pairings pointing at them are dropped with them.
+    Image files are content-addressed and only removed once no remaining
+    item uses them. ``clear`` also drops the user's emptied per-user
+    collections and any image files no item refers to.
+    """
+    image_ids = [str(image_id) for image_id in image_ids]
+    upload_dir = os.path.join('static', 'uploads', username)
+    removed = {"items": 0, "files": 0}
+    for start in range(0, len(image_ids), DELETE_BATCH_SIZE):
+        batch = set(image_ids[start:start + DELETE_BATCH_SIZE])
+        items = [item for item in metadata_store.load(username) if str(item['image_id']) in batch]
+        with metrics.stage("delete_vectors"):
+            remove_item_vectors(username, items)
+        user_pairings(username).remove_items(username, batch)
+
+        with metrics.stage("delete_metadata_write"):
+            with metadata_store.update(username) as metadata:
+                metadata[:] = [item for item in metadata if str(item['image_id']) not in batch]
+                for item in metadata:
+                    if item.get('pairs'):
+                        item['pairs'] = [pair for pair in item['pairs'] if pair not in batch]
+                live_files = {item['filename'] for item in metadata}
+
+        for filename in {item['filename'] for item in items} - live_files:
+            try:
+                os.remove(os.path.join(upload_dir, filename))
+                removed["files"] += 1
+            except FileNotFoundError:
+                pass
+        removed["items"] += len(items)
+        if on_progress:
+            on_progress(f"deleted {min(start + DELETE_BATCH_SIZE, len(image_ids))}/{len(image_ids)}")
+
+    if clear:
+        if catalog_index is None and COLLECTION_LAYOUT == 'per_user' and not metadata_store.load(username):
+            for name in vector_backend.list_collection_names():
+                if parse_collection_name(name)[0] == username:
+                    vector_backend.delete_collection(name)
+        live_files = {item['filename'] for item in metadata_store.load(username)}
+        if os.path.exists(upload_dir):
+            for filename in set(os.listdir(upload_dir)) - live_files:
+                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
+                    os.remove(os.path.join(upload_dir, filename))
+                    removed["files"] += 1
+    logger.info("Deleted %d items and %d files for %s", removed["items"], removed["files"], username)
+    return removed
+
 def get_user_metadata_path(username):
     """Get path to user's metadata file"""
-    metadata_dir = 'user_metadata'
-    os.makedirs(metadata_dir, exist_ok=True)
-    return os.path.join(metadata_dir, f'{username}_metadata.json')
+    return metadata_store.metadata_path(username)
 
 def find_image_owner(image_id: str):
     """Find which user owns a specific image"""
     metadata_dir = 'user_metadata'
-    print(f"Searching for owner of image {image_id}")
+    logger.debug("Searching for owner of image %s", image_id)
     
     if os.path.exists(metadata_dir):
         for metadata_file in os.listdir(metadata_dir):
@@ -127,7 +484,7 @@ def find_image_owner(image_id: str):
             
             username = metadata_file.replace('_metadata.json', '')
             metadata_path = os.path.join(metadata_dir, metadata_file)
-            print(f"Checking metadata file: {metadata_path}")
+            logger.debug("Checking metadata file: %s", metadata_path, extra={'sample': 'owner_scan'})
             
             try:
                 with open(metadata_path, 'r') as f:
@@ -136,310 +493,578 @@ def find_image_owner(image_id: str):
                         # Check both username and image_id
                         if (str(item.get('image_id')) == str(image_id) and 
                             item.get('username') == username):
-                            print(f"Found owner {username} for image {image_id}")
+                            logger.debug("Found owner %s for image %s", username, image_id)
                             return username
             except (json.JSONDecodeError, FileNotFoundError) as e:
-                print(f"Error reading metadata file {metadata_path}: {e}")
+                logger.error("Error reading metadata file %s: %s", metadata_path, e)
                 continue
-    print(f"No owner found for image {image_id}")
+    logger.warning("No owner found for image %s", image_id)
     return None
 
 def encode_image(image_path):
-    """Encode image to base64 string"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    """Encode image (a path or an already loaded ImageInput) to base64 string"""
+    return as_image_input(image_path).base64
+
+def _vision_description(image_path):
+    """Describe the item with the vision model; raises on failure"""
+    base64_image = encode_image(image_path)
+
+    chat_completion = groq_chat(
+        "vision_description",
+        model="llama-3.2-90b-vision-preview",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "Provide a one-line, highly detailed description of the apparel that highlights unique features, style, and any distinguishing patterns or colors. Make the description precise and unique enough to easily identify this item among similar apparel. Don't give details that are not visible. Return only the descriptive phrase in one line."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    }
+                ]
+            }
+        ]
+    )
+
+    return chat_completion.choices[0].message.content.strip()
 
 def generate_description(image_path):
     """Generate description using Llama Vision via Groq"""
     try:
-        base64_image = encode_image(image_path)
-        
-        chat_completion = client.chat.completions.create(
-            model="llama-3.2-90b-vision-preview",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Provide a one-line, highly detailed description of the apparel that highlights unique features, style, and any distinguishing patterns or colors. Make the description precise and unique enough to easily identify this item among similar apparel. Don't give details that are not visible. Return only the descriptive phrase in one line."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ]
-        )
-        
-        return chat_completion.choices[0].message.content.strip()
-        
+        return _vision_description(image_path)
     except Exception as e:
-        print(f"Error generating description: {e}")
+        logger.error("Error generating description: %s", e)
         return "Error generating description"
 
 def update_metadata(image_id: str, description: str, filename: str = None):
     """Update metadata in user's file"""
     username = find_image_owner(image_id)
     if not username:
-        print(f"Could not find owner for image {image_id}")
+        logger.warning("Could not find owner for image %s", image_id)
         return False
         
     metadata_path = get_user_metadata_path(username)
-    print(f"Updating metadata at: {metadata_path}")
+    logger.debug("Updating metadata at: %s", metadata_path)
     
     try:
-        # Ensure the file exists with at least an empty array
-        if not os.path.exists(metadata_path):
-            with open(metadata_path, 'w') as f:
-                json.dump([], f)
-        
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
-            
-        found = False
-        for item in metadata:
-            if str(item.get('image_id')) == str(image_id):
-                item['description'] = description
-                item['processing_status'] = 'completed'
-                found = True
-                break
-                
-        if not found:
-            print(f"WARNING: Image {image_id} not found in metadata file")
+        if not metadata_store.update_item(username, image_id, description=description,
+                                          processing_status='completed'):
+            logger.warning("Image %s not found in metadata file", image_id)
             return False
                 
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
-        print(f"Successfully updated metadata for image {image_id}")
+        logger.debug("Successfully updated metadata for image %s", image_id)
         return True
                 
     except Exception as e:
-        print(f"Error updating metadata: {e}")
+        logger.error("Error updating metadata: %s", e)
         return False
 
+def _vision_title(image_path):
+    """Title the item with the vision model; raises on failure"""
+    base64_image = encode_image(image_path)
+
+    chat_completion = groq_chat(
+        "vision_title",
+        model="llama-3.2-90b-vision-preview",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "Give a very short 2-4 word title for this apparel item. Make it concise and descriptive. Return only the title."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    }
+                ]
+            }
+        ]
+    )
+
+    return chat_completion.choices[0].message.content.strip()
+
 def generate_title(image_path):
     """Generate a short title for the apparel"""
     try:
-        base64_image = encode_image(image_path)
-        
-        chat_completion = client.chat.completions.create(
-            model="llama-3.2-90b-vision-preview",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Give a very short 2-4 word title for this apparel item. Make it concise and descriptive. Return only the title."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ]
-        )
-        
-        return chat_completion.choices[0].message.content.strip()
-        
+        return _vision_title(image_path)
     except Exception as e:
-        print(f"Error generating title: {e}")
+        logger.error("Error generating title: %s", e)
         return "Untitled Item"
 
+def _vision_apparel_type(image_path):
+    """Ask the vision model for the apparel type; raises if the call fails"""
+    base64_image = encode_image(image_path)
+
+    chat_completion = groq_chat(
+        "vision_apparel_type",
+        model="llama-3.2-90b-vision-preview",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "What type of apparel is this? Choose exactly one category from: [top, bottom, outerwear, full-body]. Return only the category name in lowercase."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    }
+                ]
+            }
+        ]
+    )
+
+    return chat_completion.choices[0].message.content.strip().lower()
+
 def determine_apparel_type(image_path):
     """Determine the type of apparel from predefined categories"""
     try:
-        base64_image = encode_image(image_path)
-        
-        chat_completion = client.chat.completions.create(
-            model="llama-3.2-90b-vision-preview",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "What type of apparel is this? Choose exactly one category from: [top, bottom, outerwear, full-body]. Return only the category name in lowercase."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ]
-        )
-        
-        apparel_type = chat_completion.choices[0].message.content.strip().lower()
-        valid_types = ['top', 'bottom', 'outerwear', 'full-body']
-        return apparel_type if apparel_type in valid_types else 'top'
-        
+        apparel_type = _vision_apparel_type(image_path)
+        return apparel_type if apparel_type in APPAREL_TYPES else 'top'
     except Exception as e:
-        print(f"Error determining apparel type: {e}")
+        logger.error("Error determining apparel type: %s", e)
         return 'top'
 
-def process_in_background(image_id, filename, image_path):
-    """Background processing function with ordered steps"""
+def describe_with_vision(image_path, image_id, strict=False):
+    """Description, title and apparel type from the vision model.
+
+    With ``strict`` a failed call or an unknown category raises instead of
+    falling back to placeholder text and 'top'.
+    """
+    # Step 1: Generate description
+    logger.debug("Step 1: Generating description for image %s", image_id)
+    with metrics.stage("ingest_description"):
+        description = _vision_description(image_path) if strict else generate_description(image_path)
+    logger.debug("Generated description: %s", description)
+    
+    # Step 2: Generate title
+    logger.debug("Step 2: Generating title for image %s", image_id)
+    with metrics.stage("ingest_title"):
+        title = _vision_title(image_path) if strict else generate_title(image_path)
+    logger.debug("Generated title: %s", title)
+    
+    # Step 3: Determine apparel type/category
+    logger.debug("Step 3: Determining apparel type for image %s", image_id)
+    with metrics.stage("ingest_apparel_type"):
+        apparel_type = _vision_apparel_type(image_path) if strict else determine_apparel_type(image_path)
+    if apparel_type not in APPAREL_TYPES:
+        raise ValueError(f"Unknown apparel type {apparel_type!r}")
+    logger.debug("Determined type: %s", apparel_type)
+    return description, title, apparel_type
+
+def image_embedding_for(image_path, image_id, item_hash):
+    """Normalized image embedding, reused from the shared catalog when the same
+    image has already been indexed for any user"""
+    logger.debug("Step 5: Generating embeddings for image %s", image_id)
+    if catalog_index is not None:
+        embedding = catalog_index.get_embedding(item_hash)
+        metrics.cache_lookup("catalog_embedding", embedding is not None)
+        if embedding is not None:
+            logger.debug("Reusing catalog embedding for image %s (%s)", image_id, item_hash[:12])
+            return embedding
+    with metrics.stage("ingest_image_embedding"):
+        image = as_image_input(image_path).pil()
+        image_embedding = fclip.encode_images([image], batch_size=1)[0]
+        return image_embedding/np.linalg.norm(image_embedding)
+
+def find_near_duplicate(username, image_id, embedding):
+    """The user's finished item most similar to ``embedding``, as (item, similarity),
+    if it reaches DUPLICATE_THRESHOLD; otherwise (None, best similarity seen).
+
+    One nearest-neighbour query per category collection (or one catalog query)
+    against the vectors already stored, so no item is re-encoded.
+    """
+    items = {str(item['image_id']): item for item in metadata_store.load(username)
+             if item.get('processing_status') == 'completed' and str(item['image_id']) != str(image_id)}
+    if not items:
+        return None, 0.0
+    similarities = {}
+    with metrics.stage("ingest_duplicate_check"):
+        if catalog_index is not None:
+            owners = {}
+            for owned_id, item_hash in catalog_index.user_items(username).items():
+                owners.setdefault(item_hash, []).append(owned_id)
+            for item_hash, similarity in catalog_index.query(embedding, n_results=2, username=username):
+                for owned_id in owners.get(item_hash, []):
+                    similarities[str(owned_id)] = similarity
+        else:
+            for category in APPAREL_TYPES:
+                collection = get_user_category_collection(username, category)
+                n_results = min(2, collection.count())
+                if not n_results:
+                    continue
+                results = collection.query(
+                    query_embeddings=[np.asarray(embedding, dtype=np.float32).tolist()],
+                    n_results=n_results,
+                    include=['metadatas', 'distances']
+                )
+                for hit, distance in zip(results['metadatas'][0], results['distances'][0]):
+                    similarities[str(hit['image_id'])] = 1 - distance
+    candidates = [(similarity, hit_id) for hit_id, similarity in similarities.items() if hit_id in items]
+    if not candidates:
+        return None, 0.0
+    similarity, hit_id = max(candidates)
+    if similarity < DUPLICATE_THRESHOLD:
+        return None, float(similarity)
+    # Point at the original rather than at an earlier flagged copy of it
+    item = items[hit_id]
+    return items.get(str(item.get('duplicate_of')), item), float(similarity)
+
+def process_in_background(image_id, filename, image_path, item_hash=None, on_progress=None):
+    """Background processing function with ordered steps.
+
+    ``on_progress(stage)`` is called as the job enters each step
+    ("deduplicating", "describing", "embedding", "indexing"). Returns False on
+    failure; a near-duplicate upload returns ``{"duplicate_of", "similarity", "merged"}``.
+    """
+    path_parts = image_path.split(os.sep)
+    username = path_parts[-2] if len(path_parts) >= 3 else None
+    with log_config.correlation(job_id=f"ingest-{image_id}"), metrics.stage("ingest_total"), \
+            rate_limit.scope(user=username, priority=rate_limit.INGEST):
+        result = _process_image(image_id, filename, image_path, item_hash, on_progress or (lambda stage: None))
+    metrics.inc("wearwiz_ingest_total", result="completed" if result else "error")
+    return result
+
+def _process_image(image_id, filename, image_path, item_hash, on_progress):
     try:
-        print(f"Starting background processing for image {image_id}")
+        logger.info("Starting background processing for image %s", image_id)
         
         # Extract username from image_path
         path_parts = image_path.split(os.sep)
         username = path_parts[-2] if len(path_parts) >= 3 else None
         
         if not username:
-            print(f"ERROR: Could not extract username from path {image_path}")
+            logger.error("Could not extract username from path %s", image_path)
             return False
             
-        print(f"Found username from path: {username}")
+        logger.debug("Found username from path: %s", username)
         
-        # Step 1: Generate description
-        print(f"Step 1: Generating description for image {image_id}")
-        description = generate_description(image_path)
-        print(f"Generated description: {description}")
-        
-        # Step 2: Generate title
-        print(f"Step 2: Generating title for image {image_id}")
-        title = generate_title(image_path)
-        print(f"Generated title: {title}")
-        
-        # Step 3: Determine apparel type/category
-        print(f"Step 3: Determining apparel type for image {image_id}")
-        apparel_type = determine_apparel_type(image_path)
-        print(f"Determined type: {apparel_type}")
+        # Read the file once; every step below works from these bytes. The
+        # upload handler already hashed the content while saving it.
+        image = ImageInput(image_path)
+        item_hash = item_hash or image.content_hash
+
+        # A re-photographed garment takes the annotations of the item it
+        # duplicates, before any Groq call is spent on it
+        normalized_image_embedding = None
+        duplicate = None
+        if DUPLICATE_ACTION in ('flag', 'merge'):
+            on_progress("deduplicating")
+            normalized_image_embedding = image_embedding_for(image, image_id, item_hash)
+            duplicate, similarity = find_near_duplicate(username, image_id, normalized_image_embedding)
+            if duplicate is not None:
+                duplicate_id = str(duplicate['image_id'])
+                logger.info("Image %s is a near-duplicate of %s (%.3f)", image_id, duplicate_id, similarity)
+                metrics.inc("wearwiz_ingest_duplicates_total", action=DUPLICATE_ACTION)
+                if DUPLICATE_ACTION == 'merge':
+                    delete_items(username, [image_id])
+                    return {"duplicate_of": duplicate_id, "similarity": round(similarity, 4), "merged": True}
+
+        # Steps 1-3: describe, title and categorize the item, with the vision
+        # model or (local mode, or auto mode when Groq fails) by zero-shot tagging
+        on_progress("describing")
+        ingest_source = 'vision'
+        tag_confidence = None
+        if duplicate is not None:
+            description, title, apparel_type = duplicate['description'], duplicate['title'], duplicate['apparel_type']
+            ingest_source = duplicate.get('ingest_source', 'vision')
+            tag_confidence = duplicate.get('tag_confidence')
+        elif INGEST_MODE == 'vision':
+            description, title, apparel_type = describe_with_vision(image, image_id)
+        else:
+            apparel_type = None
+            if INGEST_MODE == 'auto':
+                try:
+                    description, title, apparel_type = describe_with_vision(image, image_id, strict=True)
+                except Exception as e:
+                    logger.warning("Vision model unavailable for image %s (%s), tagging locally", image_id, e)
+            if apparel_type is None:
+                if normalized_image_embedding is None:
+                    normalized_image_embedding = image_embedding_for(image, image_id, item_hash)
+                with metrics.stage("ingest_local_tagging"):
+                    tags = local_tagger.tag(normalized_image_embedding)
+                description, title, apparel_type = tags['description'], tags['title'], tags['apparel_type']
+                ingest_source = 'local'
+                tag_confidence = tags['confidence']
+                logger.debug("Tagged image %s locally as %s (%.2f)", image_id, apparel_type, tag_confidence)
         
-        # Step 4: Update metadata with generated information
-        metadata_path = get_user_metadata_path(username)
+        # Step 4: Update metadata with generated information (only this item's
+        # fields, under the user's lock, so concurrent ingests don't clobber each other)
         try:
-            with open(metadata_path, 'r') as f:
-                metadata = json.load(f)
-                
-            for item in metadata:
-                if str(item.get('image_id')) == str(image_id):
-                    item['description'] = description
-                    item['title'] = title
-                    item['apparel_type'] = apparel_type
-                    item['processing_status'] = 'processing_embeddings'
-                    break
-                    
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
+            fields = {
+                'description': description,
+                'title': title,
+                'apparel_type': apparel_type,
+                'processing_status': 'processing_embeddings',
+                'ingest_source': ingest_source
+            }
+            if tag_confidence is not None:
+                fields['tag_confidence'] = tag_confidence
+            if duplicate is not None:
+                fields['duplicate_of'] = duplicate_id
+                fields['duplicate_similarity'] = round(similarity, 4)
+            with metrics.stage("ingest_metadata_write"):
+                metadata_store.update_item(username, image_id, **fields)
                 
-            print(f"Successfully updated metadata for image {image_id}")
-            
-            # Step 5: Generate embeddings
-            print(f"Step 5: Generating embeddings for image {image_id}")
-            image = Image.open(image_path)
-            image_embedding = fclip.encode_images([image], batch_size=1)[0]
-            normalized_image_embedding = image_embedding/np.linalg.norm(image_embedding)
+            logger.debug("Successfully updated metadata for image %s", image_id)
             
+            # Step 5: Generate embeddings (unless the duplicate check or local tagging already did)
+            on_progress("embedding")
+            if normalized_image_embedding is None:
+                normalized_image_embedding = image_embedding_for(image, image_id, item_hash)
+
             # Step 6: Store embeddings in category-specific collection
-            print(f"Step 6: Storing embeddings in {apparel_type} collection")
-            collection = get_user_category_collection(username, apparel_type)
-            print("Created!")
-            collection.add(
-                embeddings=[normalized_image_embedding.tolist()],  # Store normalized image embedding
-                documents=[description],
-                metadatas=[{
-                    "image_id": image_id,
-                    "filename": filename,
-                    "timestamp": str(datetime.datetime.now()),
-                    "username": username,
-                    "category": apparel_type
-                }],
-                ids=[f"{username}_{apparel_type}_{image_id}"]
-            )
+            logger.debug("Step 6: Storing embeddings in %s collection", apparel_type)
+            on_progress("indexing")
+            with metrics.stage("ingest_vector_store"):
+                index_item_embedding(username, image_id, filename, description, apparel_type,
+                                     normalized_image_embedding, item_hash)
             
             # Update processing status to completed
-            for item in metadata:
-                if str(item.get('image_id')) == str(image_id):
-                    item['processing_status'] = 'completed'
-                    break
-                    
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
+            with metrics.stage("ingest_metadata_write"):
+                still_exists = metadata_store.update_item(
+                    username, image_id,
+                    processing_status='completed',
+                    content_hash=item_hash,
+                    embedding_model=EMBEDDING_MODEL,
+                    indexed_category=apparel_type
+                )
+            if not still_exists:
+                # Deleted while we were processing it; don't leave its vector behind
+                remove_item_vectors(username, [{'image_id': image_id}])
+                logger.info("Image %s was deleted during processing", image_id)
                 
-            print(f"Successfully completed processing for image {image_id}")
+            logger.info("Successfully completed processing for image %s", image_id)
+            if duplicate is not None:
+                return {"duplicate_of": duplicate_id, "similarity": round(similarity, 4), "merged": False}
             return True
             
         except Exception as e:
-            print(f"Error updating metadata: {e}")
+            logger.error("Error updating metadata: %s", e)
             return False
             
     except Exception as e:
-        print(f"Error in background processing for image {image_id}: {e}")
+        logger.exception("Error in background processing for image %s: %s", image_id, e)
         return False
 
-# def find_similar_items(username, image_path, limit=5):
-#     """Find similar items in user's collection"""
-#     try:
-#         # Generate query image embeddings
-#         image = Image.open(image_path)
-#         query_embedding = fclip.encode_images([image])[0].tolist()
-        
-#         # Query user's collection
-#         collection = get_user_collection(username)
-#         results = collection.query(
-#             query_embeddings=[query_embedding],
-#             n_results=limit,
-#             include=['metadatas', 'documents', 'distances']
-#         )
-        
-#         # Format results
-#         similar_items = []
-#         for i in range(len(results['ids'][0])):
-#             similar_items.append({
-#                 'image_id': results['metadatas'][0][i]['image_id'],
-#                 'filename': results['metadatas'][0][i]['filename'],
-#                 'description': results['documents'][0][i],
-#                 'similarity': 1 - results['distances'][0][i]
-#             })
-        
-#         return similar_items
-#     except Exception as e:
-#         print(f"Error finding similar items: {e}")
-#         return []
+def stored_item_embeddings(username, items):
+    """Indexed items' embeddings read back from the vector store, in order
+    (None for items without one); one lookup per category collection"""
+    if catalog_index is not None:
+        hashes = [item.get('content_hash') for item in items]
+        result = catalog_index.collection.get(ids=[h for h in set(hashes) if h], include=['embeddings'])
+        found = dict(zip(result['ids'], result['embeddings'])) if result['ids'] else {}
+        return [None if found.get(item_hash) is None else np.asarray(found[item_hash], dtype=np.float32)
+                for item_hash in hashes]
+
+    keys = []
+    for item in items:
+        category = item.get('indexed_category', item.get('apparel_type'))
+        keys.append((category, f"{username}_{category}_{item['image_id']}"))
+    found = {}
+    for category in {category for category, _ in keys if category in APPAREL_TYPES}:
+        result = get_user_category_collection(username, category).get(
+            ids=[key for key_category, key in keys if key_category == category], include=['embeddings']
+        )
+        if result['ids']:
+            found.update(zip(result['ids'], result['embeddings']))
+    return [None if found.get(key) is None else np.asarray(found[key], dtype=np.float32) for _, key in keys]
+
+def stored_item_embedding(username, item):
+    """An indexed item's embedding read back from the vector store, or None"""
+    return stored_item_embeddings(username, [item])[0]
+
+def find_similar_items(username, image_id=None, image=None, limit=10, offset=0, category=None):
+    """A page of the user's items most similar to one of their items or to a query image.
+
+    An indexed item's stored vector is reused, so the search costs at most
+    one image encode (``image`` is a path or ImageInput). Each category
+    collection (or just ``category``) is queried once for enough neighbours
+    to fill the page, and the hits are merged by similarity.
+    """
+    items = {str(item['image_id']): item for item in metadata_store.load(username)
+             if item.get('processing_status') != 'deleting'}
+    exclude = set()
+    embedding = None
+    if image_id is not None:
+        item = items.get(str(image_id))
+        if item is None:
+            return {"status": "error", "error": "Selected item not found"}
+        exclude.add(str(image_id))
+        embedding = stored_item_embedding(username, item)
+        metrics.cache_lookup("similar_item_embedding", embedding is not None)
+        if embedding is None:
+            image = os.path.join('static', 'uploads', username, item['filename'])
+    if embedding is None:
+        image = as_image_input(image)
+        embedding = image_embedding_for(image, image_id, image.content_hash)
+
+    # One extra neighbour tells whether there is a next page
+    wanted = offset + limit + 1 + len(exclude)
+    similarities = {}
+    with metrics.stage("similar_vector_query"):
+        if catalog_index is not None:
+            owners = {}
+            for owned_id, item_hash in catalog_index.user_items(username, category).items():
+                owners.setdefault(item_hash, []).append(owned_id)
+            for item_hash, similarity in catalog_index.query(embedding, n_results=wanted,
+                                                             username=username, category=category):
+                for owned_id in owners.get(item_hash, []):
+                    similarities[owned_id] = similarity
+        else:
+            for name in [category] if category else APPAREL_TYPES:
+                collection = get_user_category_collection(username, name)
+                n_results = min(wanted, collection.count())
+                if not n_results:
+                    continue
+                results = collection.query(
+                    query_embeddings=[np.asarray(embedding, dtype=np.float32).tolist()],
+                    n_results=n_results,
+                    include=['metadatas', 'distances']
+                )
+                for hit, distance in zip(results['metadatas'][0], results['distances'][0]):
+                    similarities[str(hit['image_id'])] = 1 - distance
+
+    ranked = sorted(
+        ((similarity, hit_id) for hit_id, similarity in similarities.items()
+         if hit_id in items and hit_id not in exclude),
+        reverse=True
+    )
+    return {
+        "status": "success",
+        "items": [
+            dict(outfit_item(username, items[hit_id]), image_id=hit_id, similarity=round(float(similarity), 4))
+            for similarity, hit_id in ranked[offset:offset + limit]
+        ],
+        "offset": offset,
+        "limit": limit,
+        "has_more": len(ranked) > offset + limit
+    }
 
 # Add these to initialize at startup
 def init_vector_db():
     """Initialize vector database directory"""
-    os.makedirs('./vector_db', exist_ok=True)
-    print("Vector database initialized")
+    os.makedirs(VECTOR_DB_DIR, exist_ok=True)
+    logger.info("Vector database initialized")
 
 # Call this when starting the application
 init_vector_db()
 
-def generate_outfit_recommendation(username):
+def user_pairings(username):
+    """The pairing graph, with the user's legacy ``pairs`` arrays imported on first use"""
+    if not pairings.seeded(username):
+        path = get_user_metadata_path(username)
+        when = os.path.getmtime(path) if os.path.exists(path) else time.time()
+        pairings.seed(username, metadata_store.load(username), when)
+    return pairings
+
+def record_outfit(username, base_id, match_id):
+    """Count two items as worn together; one upsert, the metadata file is not rewritten"""
+    with metrics.stage("pairing_record"):
+        user_pairings(username).record(username, base_id, match_id)
+
+def save_pairing(username, base_id, match_id):
+    """Record a pairing computed earlier; False if either item no longer exists"""
+    items = {str(item['image_id']): item for item in metadata_store.load(username)}
+    if any(image_id not in items or items[image_id].get('processing_status') == 'deleting'
+           for image_id in (base_id, match_id)):
+        return False
+    record_outfit(username, base_id, match_id)
+    return True
+
+def outfit_item(username, item):
+    """The fields of a wardrobe item shown on the recommendations page"""
+    return {
+        "image_url": f"/static/uploads/{username}/{item['filename']}",
+        "description": item['description'],
+        "title": item['title'],
+        "type": item['apparel_type']
+    }
+
+def cached_outfit(username, image_id=None):
+    """A previously recorded outfit, served when a request's budget ran out.
+
+    With ``image_id``, that item and one of its recorded partners; otherwise
+    one of the user's most worn combinations. Reads only the metadata file and
+    the pairing graph, so it is fast enough to answer after the deadline has passed.
+    """
+    items = {str(item['image_id']): item for item in metadata_store.load(username)
+             if item.get('processing_status') != 'deleting'}
+    graph = user_pairings(username)
+    if image_id is not None:
+        pairs = [(str(image_id), partner) for partner in graph.partners(username, image_id)]
+    else:
+        pairs = [(item_a, item_b) for item_a, item_b, _, _ in graph.most_worn(username, limit=20)]
+    pairs = [(items[first], items[second]) for first, second in pairs if first in items and second in items]
+    if not pairs:
+        return {"status": "error", "error": "Recommendation timed out, please try again"}
+    base, match = random.choice(pairs)
+    if image_id is None and base.get('apparel_type') != 'bottom' and match.get('apparel_type') == 'bottom':
+        base, match = match, base
+    metrics.inc("wearwiz_degraded_responses_total", reason="cached_outfit")
+    return {
+        "status": "success",
+        "base_item": outfit_item(username, base),
+        "recommended_item": outfit_item(username, match),
+        "degraded": True
+    }
+
+def pairing_summary(username, limit=10):
+    """The user's most worn combinations and the items never recommended together with anything"""
+    items = {str(item['image_id']): item for item in metadata_store.load(username)
+             if item.get('processing_status') != 'deleting'}
+    graph = user_pairings(username)
+    most_worn = [
+        {
+            "items": [dict(outfit_item(username, items[item_a]), image_id=item_a),
+                      dict(outfit_item(username, items[item_b]), image_id=item_b)],
+            "count": count,
+            "last_used": datetime.datetime.fromtimestamp(last_used).isoformat()
+        }
+        for item_a, item_b, count, last_used in graph.most_worn(username, limit)
+        if item_a in items and item_b in items
+    ]
+    paired = graph.paired_items(username)
+    never_paired = [dict(outfit_item(username, item), image_id=image_id)
+                    for image_id, item in items.items() if image_id not in paired]
+    return {"status": "success", "most_worn": most_worn, "never_paired": never_paired}
+
+def generate_outfit_recommendation(username, record_pairing=True):
     """Generate outfit recommendation starting with a random bottom"""
     try:
-        print(f"Generating outfit recommendation for user {username}")
+        logger.info("Generating outfit recommendation for user %s", username)
         
         # Get user's metadata
         metadata_path = get_user_metadata_path(username)
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
+        with metrics.stage("recommend_metadata_load"):
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
             
         if not metadata:
             return {"status": "error", "error": "No items found"}
             
         # Filter bottoms only
-        bottom_items = [item for item in metadata if item['apparel_type'] == 'bottom']
+        bottom_items = [item for item in metadata
+                        if item['apparel_type'] == 'bottom' and item.get('processing_status') != 'deleting']
         if not bottom_items:
             return {"status": "error", "error": "No bottom apparel found"}
             
         # 1. Select random bottom item
         selected_bottom = random.choice(bottom_items)
         bottom_description = selected_bottom['description']
-        print(f"Selected bottom description: {bottom_description}")
+        logger.debug("Selected bottom description: %s", bottom_description)
 
         # 2. Generate compatible top description using LLM
         prompt = f"""Given this bottom apparel: "{bottom_description}"
@@ -447,82 +1072,55 @@ def generate_outfit_recommendation(username):
         Consider color coordination, style matching, and overall aesthetic harmony.
         Return only a single-line detailed description of the ideal top piece."""
 
-        chat_completion = client.chat.completions.create(
-            model="llama-3.2-90b-text-preview",
-            messages=[{"role": "user", "content": prompt}]
+        generated_top_description, degraded = suggest_description(
+            "text_top_suggestion", prompt, f"a top that goes well with {bottom_description}"
         )
-        generated_top_description = chat_completion.choices[0].message.content.strip()
-        print(f"Generated top description: {generated_top_description}")
+        logger.debug("Generated top description: %s", generated_top_description)
 
         # Convert text description to embedding and query TOP collection
-        text_embedding = fclip.encode_text([generated_top_description], batch_size=1)[0]
-        normalized_embedding = text_embedding/np.linalg.norm(text_embedding)
+        normalized_embedding = embed_text(generated_top_description)
         
         # Query TOP collection with embedding (since we started with bottom)
-        tops_collection = get_user_category_collection(username, 'top')  # Explicitly query tops
-        results = tops_collection.query(
-            query_embeddings=[normalized_embedding.tolist()],
-            n_results=1,
-            include=['metadatas', 'documents']
+        best_match_metadata, best_match = find_best_match(
+            metadata, username, 'top', normalized_embedding, base_id=selected_bottom['image_id']
         )
 
-        if not results['metadatas'][0]:
+        if not best_match_metadata:
             return {"status": "error", "error": "No matching top found"}
 
-        best_match_metadata = results['metadatas'][0][0]
-        best_match = next(
-            (item for item in metadata if str(item['image_id']) == str(best_match_metadata['image_id'])), 
-            None
-        )
-
         if not best_match:
             return {"status": "error", "error": "Could not find matching item metadata"}
 
-        # 4. Update pairs arrays in metadata
-        if 'pairs' not in selected_bottom:
-            selected_bottom['pairs'] = []
-        if 'pairs' not in best_match:
-            best_match['pairs'] = []
+        # 4. Record the pairing (prefetched results are recorded when served;
+        # embedding-only matches are not recorded as outfits)
+        if record_pairing and not degraded:
+            record_outfit(username, str(selected_bottom['image_id']), str(best_match['image_id']))
 
-        # Add new pairing
-        if str(best_match['image_id']) not in selected_bottom['pairs']:
-            selected_bottom['pairs'].append(str(best_match['image_id']))
-        if str(selected_bottom['image_id']) not in best_match['pairs']:
-            best_match['pairs'].append(str(selected_bottom['image_id']))
-
-        # Save updated metadata
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
-
-        return {
+        result = {
             "status": "success",
-            "base_item": {
-                "image_url": f"/static/uploads/{username}/{selected_bottom['filename']}",
-                "description": selected_bottom['description'],
-                "title": selected_bottom['title'],
-                "type": selected_bottom['apparel_type']
-            },
-            "recommended_item": {
-                "image_url": f"/static/uploads/{username}/{best_match['filename']}",
-                "description": best_match['description'],
-                "title": best_match['title'],
-                "type": best_match['apparel_type']
-            }
+            "base_item": outfit_item(username, selected_bottom),
+            "recommended_item": outfit_item(username, best_match)
         }
+        if degraded:
+            result["degraded"] = True
+        elif not record_pairing:
+            result["pairing"] = [str(selected_bottom['image_id']), str(best_match['image_id'])]
+        return result
         
     except Exception as e:
-        print(f"Error generating recommendation: {e}")
+        logger.error("Error generating recommendation: %s", e)
         return {"status": "error", "error": str(e)}
 
-def generate_outfit_recommendation_for_apparel(username, image_id, description, apparel_type):
+def generate_outfit_recommendation_for_apparel(username, image_id, description, apparel_type, record_pairing=True):
     """Generate outfit recommendation based on specific apparel"""
     try:
-        print(f"Generating recommendation for {apparel_type} item: {image_id}")
+        logger.info("Generating recommendation for %s item: %s", apparel_type, image_id)
         
         # Get user's metadata
         metadata_path = get_user_metadata_path(username)
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
+        with metrics.stage("recommend_metadata_load"):
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
             
         if not metadata:
             return {"status": "error", "error": "No items found"}
@@ -542,180 +1140,180 @@ def generate_outfit_recommendation_for_apparel(username, image_id, description,
         Return only a single-line detailed description of the ideal {target_category} piece."""
         
         # Get suggestion from LLM
-        chat_completion = client.chat.completions.create(
-            model="llama-3.2-90b-text-preview",
-            messages=[{"role": "user", "content": prompt}]
+        suggested_description, degraded = suggest_description(
+            "text_complement_suggestion", prompt, f"a {target_category} that goes well with {description}"
         )
-        
-        suggested_description = chat_completion.choices[0].message.content.strip()
-        print(f"Generated {target_category} description: {suggested_description}")
-        print(f"Target category: {target_category}")
-        print(f"Base item: {apparel_type}")
+        logger.debug("Generated %s description: %s", target_category, suggested_description)
+        logger.debug("Target category: %s", target_category)
+        logger.debug("Base item: %s", apparel_type)
         
         # Convert suggested description to embedding
-        text_embedding = fclip.encode_text([suggested_description], batch_size=1)[0]
-        normalized_embedding = text_embedding/np.linalg.norm(text_embedding)
+        normalized_embedding = embed_text(suggested_description)
         
         # Query complementary category collection
-        complementary_collection = get_user_category_collection(username, target_category)  # Explicitly query complementary category
-        results = complementary_collection.query(
-            query_embeddings=[normalized_embedding.tolist()],
-            n_results=1,
-            include=['metadatas', 'documents']
+        recommended_metadata, recommended_item = find_best_match(
+            metadata, username, target_category, normalized_embedding, base_id=base_item['image_id']
         )
         
-        if not results['metadatas'][0]:
+        if not recommended_metadata:
             return {
                 "status": "error", 
                 "error": f"No matching {target_category} found in your wardrobe"
             }
 
-        recommended_metadata = results['metadatas'][0][0]
-        recommended_item = next(
-            (item for item in metadata if str(item['image_id']) == str(recommended_metadata['image_id'])), 
-            None
-        )
-
         if not recommended_item:
             return {"status": "error", "error": "Could not find matching item metadata"}
         
-        # Update pairs in metadata
-        if 'pairs' not in base_item:
-            base_item['pairs'] = []
-        if 'pairs' not in recommended_item:
-            recommended_item['pairs'] = []
-
-        # Add new pairing
-        if str(recommended_item['image_id']) not in base_item['pairs']:
-            base_item['pairs'].append(str(recommended_item['image_id']))
-        if str(base_item['image_id']) not in recommended_item['pairs']:
-            recommended_item['pairs'].append(str(base_item['image_id']))
-
-        # Save updated metadata
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        # Record the pairing (prefetched results are recorded when served;
+        # embedding-only matches are not recorded as outfits)
+        if record_pairing and not degraded:
+            record_outfit(username, str(base_item['image_id']), str(recommended_item['image_id']))
         
-        return {
+        result = {
             "status": "success",
-            "base_item": {
-                "image_url": f"/static/uploads/{username}/{base_item['filename']}",
-                "description": base_item['description'],
-                "title": base_item['title'],
-                "type": base_item['apparel_type']
-            },
-            "recommended_item": {
-                "image_url": f"/static/uploads/{username}/{recommended_item['filename']}",
-                "description": recommended_item['description'],
-                "title": recommended_item['title'],
-                "type": recommended_item['apparel_type']
-            }
+            "base_item": outfit_item(username, base_item),
+            "recommended_item": outfit_item(username, recommended_item)
         }
+        if degraded:
+            result["degraded"] = True
+        elif not record_pairing:
+            result["pairing"] = [str(base_item['image_id']), str(recommended_item['image_id'])]
+        return result
         
     except Exception as e:
-        print(f"Error generating recommendation: {e}")
+        logger.error("Error generating recommendation: %s", e)
         return {"status": "error", "error": str(e)}
 
-def generate_outfit_recommendation_based_on_text(username, input_text):
-    """Generate outfit recommendation based on input text"""
+def suggest_bottom_for_text(input_text):
+    """LLM bottom description for a prompt and its text embedding, cached across users.
+
+    Returns (description, embedding, degraded); a degraded suggestion embeds
+    the prompt itself and is not cached.
+    """
+    key = normalize_text(input_text)
+    cached = bottom_suggestion_cache.get(key)
+    metrics.cache_lookup("text_bottom_suggestion", cached is not None)
+    if cached is not None:
+        return (*cached, False)
+
+    # Generate bottom description using LLM
+    prompt = f"""Given this user requirement: "{input_text}"
+    Suggest a bottom apparel description that matches this requirement.
+    Return only a single-line description of the ideal bottom piece."""
+    
+    bottom_description, degraded = suggest_description(
+        "text_bottom_suggestion", prompt, f"bottom apparel for {input_text}", first_line=True
+    )
+    logger.debug("Generated bottom description: %s", bottom_description)
+
+    # Convert bottom description to embedding for the BOTTOM collection query
+    suggestion = (bottom_description, embed_text(bottom_description))
+    if not degraded:
+        bottom_suggestion_cache.set(key, suggestion)
+    return (*suggestion, degraded)
+
+def stream_outfit_recommendation_based_on_text(username, input_text):
+    """Yield a text-based recommendation as events, as soon as each part is ready.
+
+    Emits ``{"event": "base_item", "item": ...}`` once the bottom is matched,
+    then ``{"event": "recommended_item", "item": ...}``; an ``error`` event
+    ends the stream early. Events matched on embeddings alone because the
+    request's budget ran short carry ``"degraded": true``.
+    """
     try:
-        print(f"Generating recommendation based on text for user {username}")
+        logger.info("Generating recommendation based on text for user %s", username)
         
         # Get user's metadata
         metadata_path = get_user_metadata_path(username)
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
+        # Any upload, edit, ingest or clear rewrites the metadata file and so
+        # changes its version, and any recorded or removed pairing (which
+        # re-ranks matches) bumps the graph's; either retires older cached results
+        cache_key = (username, normalize_text(input_text), file_version(metadata_path),
+                     user_pairings(username).version(username))
+        cached = text_recommendation_cache.get(cache_key)
+        metrics.cache_lookup("text_recommendation", cached is not None)
+        if cached is not None:
+            yield {"event": "base_item", "item": cached["base_item"]}
+            yield {"event": "recommended_item", "item": cached["recommended_item"]}
+            return
+
+        with metrics.stage("recommend_metadata_load"):
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
             
         if not metadata:
-            return {"status": "error", "error": "No items found"}
+            yield {"event": "error", "error": "No items found"}
+            return
         
-        # Generate bottom description using LLM
-        prompt = f"""Given this user requirement: "{input_text}"
-        Suggest a bottom apparel description that matches this requirement.
-        Return only a single-line description of the ideal bottom piece."""
-        
-        chat_completion = client.chat.completions.create(
-            model="llama-3.2-90b-text-preview",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        bottom_description = chat_completion.choices[0].message.content.strip()
-        print(f"Generated bottom description: {bottom_description}")
-
-        # Convert bottom description to embedding and query BOTTOM collection
-        bottom_embedding = fclip.encode_text([bottom_description], batch_size=1)[0]
-        normalized_bottom_embedding = bottom_embedding/np.linalg.norm(bottom_embedding)
+        bottom_description, normalized_bottom_embedding, bottom_degraded = suggest_bottom_for_text(input_text)
         
         # Query BOTTOM collection with embedding
-        bottoms_collection = get_user_category_collection(username, 'bottom')  # Explicitly query bottoms
-        bottom_results = bottoms_collection.query(
-            query_embeddings=[normalized_bottom_embedding.tolist()],
-            n_results=1,
-            include=['metadatas', 'documents']
+        best_bottom_metadata, best_bottom = find_best_match(
+            metadata, username, 'bottom', normalized_bottom_embedding
         )
 
-        if not bottom_results['metadatas'][0]:
-            return {"status": "error", "error": "No matching bottom found"}
-
-        best_bottom_metadata = bottom_results['metadatas'][0][0]
-        best_bottom = next(
-            (item for item in metadata if str(item['image_id']) == str(best_bottom_metadata['image_id'])), 
-            None
-        )
+        if not best_bottom_metadata:
+            yield {"event": "error", "error": "No matching bottom found"}
+            return
 
         if not best_bottom:
-            return {"status": "error", "error": "Could not find matching bottom metadata"}
+            yield {"event": "error", "error": "Could not find matching bottom metadata"}
+            return
+
+        base_item = outfit_item(username, best_bottom)
+        base_event = {"event": "base_item", "item": base_item}
+        if bottom_degraded:
+            base_event["degraded"] = True
+        yield base_event
 
         # Generate top description using LLM
         prompt = f"""Given this user requirement: "{input_text}" and bottom item: "{best_bottom['description']}"
         Suggest a compatible top apparel description that matches this bottom item.
         Return only a single-line description of the ideal top piece."""
         
-        chat_completion = client.chat.completions.create(
-            model="llama-3.2-90b-text-preview",
-            messages=[{"role": "user", "content": prompt}]
+        top_description, top_degraded = suggest_description(
+            "text_top_suggestion", prompt, f"a top that goes well with {best_bottom['description']}", first_line=True
         )
-        top_description = chat_completion.choices[0].message.content.strip()
-        print(f"Generated top description: {top_description}")
+        logger.debug("Generated top description: %s", top_description)
 
         # Convert top description to embedding and query TOP collection
-        top_embedding = fclip.encode_text([top_description], batch_size=1)[0]
-        normalized_top_embedding = top_embedding/np.linalg.norm(top_embedding)
+        normalized_top_embedding = embed_text(top_description)
         
         # Query TOP collection with embedding
-        tops_collection = get_user_category_collection(username, 'top')  # Explicitly query tops
-        top_results = tops_collection.query(
-            query_embeddings=[normalized_top_embedding.tolist()],
-            n_results=1,
-            include=['metadatas', 'documents']
+        best_top_metadata, best_top = find_best_match(
+            metadata, username, 'top', normalized_top_embedding, base_id=best_bottom['image_id']
         )
 
-        if not top_results['metadatas'][0]:
-            return {"status": "error", "error": "No matching top found"}
-
-        best_top_metadata = top_results['metadatas'][0][0]
-        best_top = next(
-            (item for item in metadata if str(item['image_id']) == str(best_top_metadata['image_id'])), 
-            None
-        )
+        if not best_top_metadata:
+            yield {"event": "error", "error": "No matching top found"}
+            return
 
         if not best_top:
-            return {"status": "error", "error": "Could not find matching top metadata"}
+            yield {"event": "error", "error": "Could not find matching top metadata"}
+            return
 
-        return {
+        recommended_item = outfit_item(username, best_top)
+        if bottom_degraded or top_degraded:
+            yield {"event": "recommended_item", "item": recommended_item, "degraded": True}
+            return
+        text_recommendation_cache.set(cache_key, {
             "status": "success",
-            "base_item": {
-                "image_url": f"/static/uploads/{username}/{best_bottom['filename']}",
-                "description": best_bottom['description'],
-                "title": best_bottom['title'],
-                "type": best_bottom['apparel_type']
-            },
-            "recommended_item": {
-                "image_url": f"/static/uploads/{username}/{best_top['filename']}",
-                "description": best_top['description'],
-                "title": best_top['title'],
-                "type": best_top['apparel_type']
-            }
-        }
+            "base_item": base_item,
+            "recommended_item": recommended_item
+        })
+        yield {"event": "recommended_item", "item": recommended_item}
         
     except Exception as e:
-        print(f"Error generating recommendation based on text: {e}")
-        return {"status": "error", "error": str(e)}
+        logger.error("Error generating recommendation based on text: %s", e)
+        yield {"event": "error", "error": str(e)}
+
+def generate_outfit_recommendation_based_on_text(username, input_text):
+    """Generate outfit recommendation based on input text"""
+    result = {"status": "success"}
+    for event in stream_outfit_recommendation_based_on_text(username, input_text):
+        if event["event"] == "error":
+            return {"status": "error", "error": event["error"]}
+        result[event["event"]] = event["item"]
+        if event.get("degraded"):
+            result["degraded"] = True
+    return result
@@ -1,20 +1,37 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import asyncio
-from typing import Dict, Optional
+import time
+from typing import List, Optional
 import uvicorn
+import uuid
+import contextvars
 from pydantic import BaseModel
 import json
 import os
-from ai_handler import process_in_background, generate_outfit_recommendation, generate_outfit_recommendation_for_apparel, generate_outfit_recommendation_based_on_text
+from ai_handler import process_in_background, generate_outfit_recommendation, generate_outfit_recommendation_for_apparel, generate_outfit_recommendation_based_on_text, stream_outfit_recommendation_based_on_text, save_pairing, cached_outfit, pairing_summary, mark_for_deletion, delete_items, find_similar_items
+from prefetch import RecommendationPrefetcher
 from concurrent.futures import ThreadPoolExecutor
 import logging
+import metrics
+import metadata_store
+import job_store
+import log_config
+import rate_limit
+import deadlines
+from image_io import ImageInput
 
-# Initialize logging
-logging.basicConfig(level=logging.DEBUG)
+# Initialize logging (level, format and sampling come from WEARWIZ_LOG_* env vars)
+log_config.configure_logging("api_service")
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Seconds a request may take when the caller sends no X-Request-Budget-Ms;
+# past it, recommendations are answered in degraded form instead of waiting
+REQUEST_BUDGET = float(os.environ.get("WEARWIZ_REQUEST_BUDGET", "15"))
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -24,9 +41,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global task storage
-processing_tasks: Dict[str, asyncio.Task] = {}
-executor = ThreadPoolExecutor(max_workers=3)
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """Tag every log line of a request with X-Request-ID (generated if absent)"""
+    request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    with log_config.correlation(request_id=request_id):
+        response = await call_next(request)
+    response.headers['X-Request-ID'] = request_id
+    return response
+
+@app.middleware("http")
+async def apply_request_budget(request: Request, call_next):
+    """Bound the request by the caller's remaining budget (or REQUEST_BUDGET)"""
+    budget = deadlines.from_header(request.headers.get(deadlines.HEADER))
+    with deadlines.budget(REQUEST_BUDGET if budget is None else budget):
+        return await call_next(request)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every endpoint by its route template"""
+    if not metrics.METRICS_ENABLED:
+        return await call_next(request)
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    metrics.observe(
+        "wearwiz_http_request_seconds",
+        time.perf_counter() - start,
+        service="api",
+        route=route.path if route else "unmatched",
+        method=request.method,
+        status=str(response.status_code)
+    )
+    return response
+
+# Ingest job status lives in SQLite, so any worker can answer a status poll
+jobs = job_store.JobStore()
+executor = metrics.InstrumentedExecutor(ThreadPoolExecutor(max_workers=3), "api")
+# Background jobs (ingest, deletion) run on their own pool: a job waiting for
+# ingest-priority Groq admission must not hold a thread a user's request needs
+JOB_WORKERS = int(os.environ.get("WEARWIZ_JOB_WORKERS", "3"))
+job_executor = metrics.InstrumentedExecutor(ThreadPoolExecutor(max_workers=JOB_WORKERS), "jobs")
+
+# Speculative recommendations, computed on a separate pool so they never delay
+# requests a user is waiting on. Depth 0 and 0 recent items disable prefetching.
+PREFETCH_DEPTH = int(os.environ.get("WEARWIZ_PREFETCH_DEPTH", "2"))
+PREFETCH_RECENT_ITEMS = int(os.environ.get("WEARWIZ_PREFETCH_RECENT_ITEMS", "2"))
+PREFETCH_TTL = float(os.environ.get("WEARWIZ_PREFETCH_TTL", "600"))
+PREFETCH_WORKERS = int(os.environ.get("WEARWIZ_PREFETCH_WORKERS", "1"))
+# Largest page the similar-items endpoints return
+SIMILAR_MAX_LIMIT = 50
 
 class ProcessingStatus(BaseModel):
     image_id: str
@@ -47,132 +111,312 @@ class TextRecommendationRequest(BaseModel):
     username: str
     input_text: str
 
+class SimilarItemsRequest(BaseModel):
+    username: str
+    image_id: str
+    limit: int = 10
+    offset: int = 0
+    category: Optional[str] = None
+
+class PairingsRequest(BaseModel):
+    username: str
+    limit: int = 10
+
+class DeleteRequest(BaseModel):
+    username: str
+    image_ids: Optional[List[str]] = None  # None clears the whole wardrobe
+
+def run_in_executor(func, *args, user=None):
+    """run_in_executor that carries the request's context (and request ID) into the worker.
+
+    Groq calls made by ``func`` are rate limited as interactive work of ``user``.
+    """
+    with rate_limit.scope(user=user):
+        context = contextvars.copy_context()
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(executor, context.run, func, *args)
+
 def get_user_metadata_path(username):
-    metadata_dir = 'user_metadata'
-    os.makedirs(metadata_dir, exist_ok=True)
-    return os.path.join(metadata_dir, f'{username}_metadata.json')
-
-def find_image_metadata(image_id: str):
-    """Find image metadata in user-specific files"""
-    metadata_dir = 'user_metadata'
-    if os.path.exists(metadata_dir):
-        for metadata_file in os.listdir(metadata_dir):
-            if not metadata_file.endswith('_metadata.json'):
-                continue
-            
-            metadata_path = os.path.join(metadata_dir, metadata_file)
-            try:
-                with open(metadata_path, 'r') as f:
-                    metadata = json.load(f)
-                    for item in metadata:
-                        if str(item.get('image_id')) == str(image_id):
-                            return item, metadata_path
-            except (json.JSONDecodeError, FileNotFoundError):
-                continue
-    return None, None
+    return metadata_store.metadata_path(username)
+
+def load_user_items(username):
+    return metadata_store.load(username)
+
+prefetcher = RecommendationPrefetcher(
+    metrics.InstrumentedExecutor(ThreadPoolExecutor(max_workers=PREFETCH_WORKERS), "prefetch"),
+    generate_outfit_recommendation,
+    generate_outfit_recommendation_for_apparel,
+    load_user_items,
+    depth=PREFETCH_DEPTH,
+    recent_items=PREFETCH_RECENT_ITEMS,
+    ttl=PREFETCH_TTL
+)
+
+async def within_budget(awaitable):
+    """Await ``awaitable`` until the request's budget runs out (raises TimeoutError).
+
+    The worker thread is not interrupted, but the work it runs checks the same
+    deadline between steps and stops at the next one.
+    """
+    return await asyncio.wait_for(awaitable, deadlines.remaining())
+
+async def degraded_response(username, image_id=None):
+    """Answer for a recommendation whose budget ran out: a previously recorded outfit, if any"""
+    logger.warning("Recommendation for %s ran out of budget, serving a cached outfit", username)
+    with deadlines.until(None):
+        return await asyncio.to_thread(cached_outfit, username, image_id)
+
+async def serve_prefetched(future, username):
+    """Result of a prefetched recommendation with its pairing saved, or None to compute afresh"""
+    if future is None:
+        return None
+    try:
+        result = dict(await asyncio.wrap_future(future))
+    except Exception as e:
+        logger.warning("Prefetched recommendation for %s failed: %s", username, e)
+        return None
+    pairing = result.pop('pairing', None)
+    if result.get('status') != 'success' or not pairing:
+        return None
+    # The wardrobe may have changed since the result was computed
+    if not await run_in_executor(save_pairing, username, *pairing):
+        return None
+    return result
+
+def run_job(job_id, func, *args):
+    """Run ``func(*args, on_progress=...)`` on a worker thread, recording its progress
+    and result in the job store; a falsy result marks the job as failed"""
+    jobs.update(job_id, status=job_store.RUNNING)
+    try:
+        result = func(*args, on_progress=lambda stage: jobs.update(job_id, stage=stage))
+    except Exception as e:
+        logger.exception("Job %s failed: %s", job_id, e)
+        jobs.update(job_id, status=job_store.ERROR, error=str(e))
+        return False
+    jobs.update(job_id, status=job_store.COMPLETED if result else job_store.ERROR, result=result)
+    return result
+
+def submit_job(job_id, func, *args):
+    """Start ``run_job(job_id, func, *args)`` on the job pool with the caller's
+    context (and request ID); jobs outlive the request, so not its budget"""
+    with deadlines.until(None):
+        context = contextvars.copy_context()
+    return job_executor.submit(context.run, run_job, job_id, func, *args)
 
 @app.post("/process-image/{image_id}")
-async def process_image(image_id: str, filename: str, image_path: str):
-    """Start async processing of an image"""
-    logging.debug(f"Received request to process image: {image_id}, filename: {filename}, path: {image_path}")
+async def process_image(image_id: str, filename: str, image_path: str, content_hash: Optional[str] = None):
+    """Start async processing of an image (``content_hash`` saves re-hashing it)"""
+    logger.debug("Received request to process image: %s, filename: %s, path: %s", image_id, filename, image_path)
     try:
-        loop = asyncio.get_event_loop()
-        task = loop.run_in_executor(
-            executor,
-            process_in_background,
-            image_id,
-            filename,
-            image_path
-        )
-        
-        processing_tasks[image_id] = task
+        path_parts = image_path.split(os.sep)
+        jobs.create(image_id, 'ingest', username=path_parts[-2] if len(path_parts) >= 3 else None)
+        submit_job(image_id, process_in_background, image_id, filename, image_path, content_hash)
         return {"status": "processing", "image_id": image_id}
     except Exception as e:
-        logging.error(f"Error processing image {image_id}: {e}")
+        logger.error("Error processing image %s: %s", image_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/processing-status/{image_id}")
 async def get_processing_status(image_id: str):
-    """Check the processing status of an image"""
+    """Check the processing status of an image (from any worker)"""
     try:
-        if image_id not in processing_tasks:
-            item, _ = find_image_metadata(image_id)
-            if item:
-                processing_status = item.get('processing_status', 'completed')
-                if processing_status == 'completed':
-                    return {"status": "completed"}
-                elif processing_status == 'error':
-                    return {"status": "error"}
+        job = jobs.get(image_id)
+        if job is None:
             return {"status": "not_found"}
-        
-        task = processing_tasks[image_id]
-        if task.done():
-            del processing_tasks[image_id]
-            try:
-                result = task.result()
-                return {"status": "completed" if result else "error"}
-            except Exception as e:
-                return {"status": "error", "error": str(e)}
-        
-        return {"status": "processing"}
+        if job['status'] in job_store.ACTIVE:
+            return {"status": "processing", "stage": job['stage'] or job['status']}
+        if job['status'] == job_store.COMPLETED:
+            # Near-duplicate uploads report the item they matched
+            return {"status": "completed", **(job['result'] if isinstance(job['result'], dict) else {})}
+        return {"status": "error", "error": job['error']}
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
 @app.post("/generate-recommendation")
 async def generate_recommendation(request: RecommendationRequest):
     """Generate random outfit recommendation"""
-    logging.debug(f"Received request for random recommendation: {request}")
+    logger.debug("Received request for random recommendation: %s", request)
     try:
-        loop = asyncio.get_event_loop()
-        task = loop.run_in_executor(
-            executor,
-            generate_outfit_recommendation,
-            request.username
-        )
-        
-        result = await task
+        try:
+            result = await within_budget(serve_prefetched(prefetcher.take_random(request.username),
+                                                          request.username))
+            if result is None:
+                task = run_in_executor(
+                    generate_outfit_recommendation,
+                    request.username,
+                    user=request.username
+                )
+                result = await within_budget(task)
+        except asyncio.TimeoutError:
+            result = await degraded_response(request.username)
+        prefetcher.fill(request.username)
         return result
     except Exception as e:
-        logging.error(f"Error generating recommendation: {e}")
+        logger.error("Error generating recommendation: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate-recommendation-for-apparel")
 async def generate_recommendation_for_apparel(request: ApparelRecommendationRequest):
     """Generate outfit recommendation based on specific apparel"""
-    logging.debug(f"Received request for apparel recommendation: {request}")
+    logger.debug("Received request for apparel recommendation: %s", request)
     try:
-        loop = asyncio.get_event_loop()
-        task = loop.run_in_executor(
-            executor,
-            generate_outfit_recommendation_for_apparel,
-            request.username,
-            request.image_id,
-            request.description,
-            request.apparel_type
-        )
-        result = await task
+        future = prefetcher.take_apparel(request.username, request.image_id,
+                                         request.description, request.apparel_type)
+        try:
+            result = await within_budget(serve_prefetched(future, request.username))
+            if result is None:
+                task = run_in_executor(
+                    generate_outfit_recommendation_for_apparel,
+                    request.username,
+                    request.image_id,
+                    request.description,
+                    request.apparel_type,
+                    user=request.username
+                )
+                result = await within_budget(task)
+        except asyncio.TimeoutError:
+            result = await degraded_response(request.username, request.image_id)
         return result
     except Exception as e:
-        logging.error(f"Error generating recommendation for apparel: {e}")
+        logger.error("Error generating recommendation for apparel: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate-recommendation-based-on-text")
 async def generate_recommendation_based_on_text(request: TextRecommendationRequest):
     """Generate outfit recommendation based on input text"""
-    logging.debug(f"Received request for text-based recommendation: {request}")
+    logger.debug("Received request for text-based recommendation: %s", request)
     try:
-        loop = asyncio.get_event_loop()
-        task = loop.run_in_executor(
-            executor,
+        task = run_in_executor(
             generate_outfit_recommendation_based_on_text,
             request.username,
-            request.input_text
+            request.input_text,
+            user=request.username
         )
-        result = await task
-        return result
+        try:
+            return await within_budget(task)
+        except asyncio.TimeoutError:
+            metrics.inc("wearwiz_degraded_responses_total", reason="timeout")
+            return {"status": "error", "error": "Recommendation timed out, please try again"}
+    except Exception as e:
+        logger.error("Error generating recommendation based on text: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate-recommendation-based-on-text/stream")
+async def stream_recommendation_based_on_text(request: TextRecommendationRequest):
+    """Stream the text-based recommendation as NDJSON events: base_item as soon as
+    the bottom is matched, then recommended_item (or an error event)"""
+    logger.debug("Received request for streamed text-based recommendation: %s", request)
+    events = stream_outfit_recommendation_based_on_text(request.username, request.input_text)
+    deadline = deadlines.expires_at()
+
+    async def ndjson():
+        # Each step of the generator runs on the worker pool, not the event loop,
+        # under the request's budget even though the body is sent after we return
+        with deadlines.until(deadline):
+            while True:
+                try:
+                    event = await within_budget(run_in_executor(next, events, None, user=request.username))
+                except asyncio.TimeoutError:
+                    metrics.inc("wearwiz_degraded_responses_total", reason="timeout")
+                    event = {"event": "error", "error": "Recommendation timed out, please try again"}
+                if event is None:
+                    break
+                yield json.dumps(event) + "\n"
+                if event["event"] == "error":
+                    break
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+def check_page(limit, offset):
+    if not 1 <= limit <= SIMILAR_MAX_LIMIT or offset < 0:
+        raise HTTPException(status_code=422, detail=f"limit must be 1-{SIMILAR_MAX_LIMIT} and offset >= 0")
+
+@app.post("/similar-items")
+async def similar_items(request: SimilarItemsRequest):
+    """Items in the user's wardrobe most like one of their items, most similar first"""
+    check_page(request.limit, request.offset)
+    try:
+        return await within_budget(run_in_executor(
+            find_similar_items,
+            request.username,
+            request.image_id,
+            None,
+            request.limit,
+            request.offset,
+            request.category,
+            user=request.username
+        ))
+    except asyncio.TimeoutError:
+        return {"status": "error", "error": "Search timed out, please try again"}
+    except Exception as e:
+        logger.error("Error finding items similar to %s: %s", request.image_id, e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/similar-items/by-image")
+async def similar_items_by_image(username: str = Form(...), file: UploadFile = File(...), limit: int = Form(10),
+                                 offset: int = Form(0), category: Optional[str] = Form(None)):
+    """Items in the user's wardrobe most like an uploaded photo (not stored)"""
+    check_page(limit, offset)
+    image = ImageInput(None, data=await file.read())
+    try:
+        await asyncio.to_thread(image.pil)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image")
+    try:
+        return await within_budget(run_in_executor(
+            find_similar_items, username, None, image, limit, offset, category, user=username
+        ))
+    except asyncio.TimeoutError:
+        return {"status": "error", "error": "Search timed out, please try again"}
+    except Exception as e:
+        logger.error("Error finding items similar to an uploaded image: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/pairings")
+async def pairings(request: PairingsRequest):
+    """The user's most worn combinations and never-paired items, from the pairing graph"""
+    check_page(request.limit, 0)
+    try:
+        return await asyncio.to_thread(pairing_summary, request.username, request.limit)
     except Exception as e:
-        logging.error(f"Error generating recommendation based on text: {e}")
+        logger.error("Error summarizing pairings for %s: %s", request.username, e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/delete-items")
+async def delete_wardrobe_items(request: DeleteRequest):
+    """Hide items at once, then delete their vectors, files and metadata in a background job"""
+    image_ids = None if request.image_ids is None else {str(image_id) for image_id in request.image_ids}
+    try:
+        marked = await asyncio.to_thread(mark_for_deletion, request.username, image_ids)
+        if image_ids is not None and not marked:
+            return {"status": "not_found"}
+        job_id = f"delete-{uuid.uuid4().hex[:16]}"
+        jobs.create(job_id, 'delete', username=request.username)
+        submit_job(job_id, delete_items, request.username, marked, image_ids is None)
+        return {"status": "scheduled", "job_id": job_id, "items": len(marked)}
+    except Exception as e:
+        logger.error("Error scheduling deletion for %s: %s", request.username, e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Status, progress and result of a background job (ingest or delete)"""
+    job = jobs.get(job_id)
+    if job is None:
+        return {"status": "not_found"}
+    return {key: job[key] for key in ('job_id', 'kind', 'status', 'stage', 'result', 'error')}
+
+@app.post("/prefetch-recommendations")
+async def prefetch_recommendations(request: RecommendationRequest):
+    """Start computing recommendations the user is likely to ask for next"""
+    prefetcher.fill(request.username)
+    return {"status": "scheduled", "enabled": prefetcher.enabled}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this worker (empty unless WEARWIZ_METRICS=1)"""
+    metrics.set_gauge("wearwiz_processing_tasks", jobs.count())
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
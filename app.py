@@ -1,15 +1,23 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, session, g, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
-import json
 import requests
 import asyncio
 from datetime import datetime
 import numpy as np
 import logging
-
-# Initialize logging
-logging.basicConfig(level=logging.DEBUG)
+import time
+import uuid
+import metrics
+import log_config
+import image_io
+import metadata_store
+import deadlines
+import user_store
+
+# Initialize logging (level, format and sampling come from WEARWIZ_LOG_* env vars)
+log_config.configure_logging("app")
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key'
@@ -17,45 +25,164 @@ app.secret_key = 'your-secret-key'
 # Configuration
 UPLOAD_FOLDER = os.path.join('static', 'uploads')  # Relative to app root
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-API_BASE_URL = "http://localhost:8000"  # FastAPI service URL
+API_BASE_URL = os.environ.get("WEARWIZ_API_URL", "http://localhost:8000")  # FastAPI service URL
+# Seconds each request may take end to end; the remainder is passed to the API,
+# which answers in degraded form rather than exceed it
+REQUEST_BUDGET = float(os.environ.get("WEARWIZ_REQUEST_BUDGET", "15"))
+# Extra seconds to wait for the API's (possibly degraded) answer past the budget
+API_TIMEOUT_GRACE = 2.0
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+@app.before_request
+def start_request_timer():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    log_config.request_id_var.set(g.request_id)
+    deadlines.start(REQUEST_BUDGET)
+    if metrics.METRICS_ENABLED:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if metrics.METRICS_ENABLED and 'request_start' in g:
+        metrics.observe(
+            "wearwiz_http_request_seconds",
+            time.perf_counter() - g.request_start,
+            service="web",
+            route=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=str(response.status_code)
+        )
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def api_headers():
+    """Forward this request's correlation ID so API logs can be joined with ours,
+    and its remaining budget so the API stops in time"""
+    headers = {'X-Request-ID': g.get('request_id', '')}
+    budget = deadlines.to_header()
+    if budget is not None:
+        headers[deadlines.HEADER] = budget
+    return headers
+
+def api_timeout():
+    """requests timeout for an API call: the remaining budget plus a grace period"""
+    remaining = deadlines.remaining()
+    return None if remaining is None else remaining + API_TIMEOUT_GRACE
+
+class HttpApi:
+    """Calls the FastAPI service over HTTP (the two-process deployment).
+
+    ``unified.py`` swaps in ``InProcessApi``, which has the same methods but
+    calls the API handlers directly.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def _post(self, path, payload):
+        response = requests.post(
+            f"{self.base_url}{path}",
+            json=payload,
+            headers={"Content-Type": "application/json", **api_headers()},
+            timeout=api_timeout()
+        )
+        if response.status_code == 422:
+            logger.warning("Validation error: %s", response.json())
+            return {'status': 'error', 'error': 'Invalid request format'}
+        return response.json()
+
+    def process_image(self, image_id, filename, image_path, content_hash):
+        response = requests.post(
+            f"{self.base_url}/process-image/{image_id}",
+            params={"filename": filename, "image_path": image_path, "content_hash": content_hash},
+            headers=api_headers(),
+            timeout=api_timeout()
+        )
+        if response.status_code != 200:
+            logger.warning("Processing request failed with status %s", response.status_code)
+
+    def processing_status(self, image_id):
+        return requests.get(f"{self.base_url}/processing-status/{image_id}", headers=api_headers(),
+                            timeout=api_timeout()).json()
+
+    def prefetch(self, username):
+        requests.post(
+            f"{self.base_url}/prefetch-recommendations",
+            json={"username": username},
+            headers=api_headers(),
+            timeout=1
+        )
+
+    def similar_items(self, username, image_id, limit=10, offset=0):
+        return self._post("/similar-items",
+                          {"username": username, "image_id": image_id, "limit": limit, "offset": offset})
+
+    def pairings(self, username, limit=10):
+        return self._post("/pairings", {"username": username, "limit": limit})
+
+    def delete_items(self, username, image_ids=None):
+        return self._post("/delete-items", {"username": username, "image_ids": image_ids})
+
+    def recommend(self, username):
+        return self._post("/generate-recommendation", {"username": username})
+
+    def recommend_for_apparel(self, username, image_id, description, apparel_type):
+        return self._post("/generate-recommendation-for-apparel", {
+            "username": username,
+            "image_id": image_id,
+            "description": description,
+            "apparel_type": apparel_type
+        })
+
+    def recommend_for_text(self, username, input_text):
+        return self._post("/generate-recommendation-based-on-text",
+                          {"username": username, "input_text": input_text})
+
+    def stream_recommendation_for_text(self, username, input_text):
+        """NDJSON lines of the streamed text recommendation (connects before returning)"""
+        response = requests.post(
+            f"{self.base_url}/generate-recommendation-based-on-text/stream",
+            json={"username": username, "input_text": input_text},
+            headers={"Content-Type": "application/json", **api_headers()},
+            timeout=api_timeout(),
+            stream=True
+        )
+
+        def lines():
+            try:
+                for line in response.iter_lines():
+                    if line:
+                        yield line + b"\n"
+            finally:
+                response.close()
+
+        return lines()
+
+api = HttpApi(API_BASE_URL)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_user_metadata_path(username):
-    # Create a metadata directory if it doesn't exist
-    metadata_dir = 'user_metadata'
-    os.makedirs(metadata_dir, exist_ok=True)
-    return os.path.join(metadata_dir, f'{username}_metadata.json')
+    return metadata_store.metadata_path(username)
 
 def load_clothing_data(username=None):
-        # Load user-specific metadata
-    try:
-        with open(get_user_metadata_path(username), 'r') as f:
-            data = json.load(f)
-            return data if isinstance(data, list) else []
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    # Load user-specific metadata
+    return metadata_store.load(username)
 
 
 def save_clothing_data(data, username=None):
-        # Save to user-specific metadata file
-    with open(get_user_metadata_path(username), 'w') as f:
-        json.dump(data, f, indent=2)
-
+    # Save to user-specific metadata file (atomically, under the user's lock)
+    metadata_store.save(username, data)
 
-def load_users():
-    try:
-        with open('users.json', 'r') as f:
-            return json.load(f)['users']
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
 
-def save_users(users):
-    with open('users.json', 'w') as f:
-        json.dump({'users': users}, f)
+users = user_store.UserStore()
+users.import_legacy()
 
 def get_user_upload_path(username):
     return os.path.join('static', 'uploads', username)
@@ -74,22 +201,23 @@ def upload_file():
 
     if file and allowed_file(file.filename):
         try:
-            filename = secure_filename(file.filename)
-            base, ext = os.path.splitext(filename)
-            counter = 1
+            original_filename = secure_filename(file.filename)
             user_upload_path = get_user_upload_path(session['username'])
-            
-            while os.path.exists(os.path.join(user_upload_path, filename)):
-                filename = f"{base}_{counter}{ext}"
-                counter += 1
 
-            os.makedirs(user_upload_path, exist_ok=True)
+            # Stream to disk in chunks, hashing and reading the image header on
+            # the way; the content hash names the file
+            try:
+                saved = image_io.save_upload(file.stream, user_upload_path,
+                                             os.path.splitext(original_filename)[1].lower())
+            except image_io.UploadTooLarge as e:
+                return jsonify({'error': str(e)}), 413
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            filename = saved['filename']
             file_path = os.path.join(user_upload_path, filename)
-            file.save(file_path)
             
-            # Load user-specific metadata
-            clothing_data = load_clothing_data(session['username'])
-            image_id = str(len(clothing_data) + 1)
+            # IDs are globally unique and never reused, even across workers or after deletions
+            image_id = metadata_store.allocate_image_id()
             
             new_item = {
                 'id': image_id,
@@ -100,24 +228,22 @@ def upload_file():
                 'apparel_type': "Processing...",
                 'description': "Processing...",
                 'processing_status': 'pending',
-                'username': session['username']
+                'username': session['username'],
+                'original_filename': original_filename,
+                'content_hash': saved['content_hash'],
+                'width': saved['width'],
+                'height': saved['height']
             }
             
-            clothing_data.append(new_item)
-            # Save to user-specific metadata file
-            save_clothing_data(clothing_data, session['username'])
+            # Append under the user's lock so parallel uploads don't overwrite each other
+            with metadata_store.update(session['username']) as clothing_data:
+                clothing_data.append(new_item)
             
             # Start async processing
             try:
-                response = requests.post(
-                    f"{API_BASE_URL}/process-image/{image_id}",
-                    params={"filename": filename, "image_path": file_path}
-                )
-                
-                if response.status_code != 200:
-                    print(f"Warning: Processing request failed with status {response.status_code}")
+                api.process_image(image_id, filename, file_path, saved['content_hash'])
             except Exception as e:
-                print(f"Warning: Failed to start processing: {e}")
+                logger.warning("Failed to start processing: %s", e)
                 # Continue anyway since the image is uploaded
             
             return jsonify({
@@ -136,8 +262,7 @@ def upload_file():
 @app.route('/check-processing-status/<image_id>')
 def check_processing_status(image_id):
     try:
-        response = requests.get(f"{API_BASE_URL}/processing-status/{image_id}")
-        return jsonify(response.json())
+        return jsonify(api.processing_status(image_id))
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
@@ -145,33 +270,30 @@ def check_processing_status(image_id):
 def login():
     if 'username' in session:
         return redirect(url_for('gallery'))
-    return render_template('login.html', users=load_users())
+    return render_template('login.html')
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
-        users = load_users()
         username = request.form['username']
+        if not user_store.valid_username(username):
+            flash('Usernames may only use letters, digits, ".", "_" and "-"')
+            return redirect(url_for('register'))
         
-        # Check if username already exists
-        if any(user['username'] == username for user in users):
+        # Create new user (the insert fails if the username already exists)
+        created = users.create(
+            username,
+            request.form['password'],
+            name=request.form['name'],
+            age=request.form['age'],
+            gender=request.form['gender'],
+            country=request.form['country'],
+            occupation=request.form['occupation']
+        )
+        if not created:
             flash('Username already exists')
             return redirect(url_for('register'))
         
-        # Create new user
-        new_user = {
-            'username': username,
-            'password': request.form['password'],  # Added password
-            'name': request.form['name'],
-            'age': request.form['age'],
-            'gender': request.form['gender'],
-            'country': request.form['country'],
-            'occupation': request.form['occupation']
-        }
-        
-        users.append(new_user)
-        save_users(users)
-        
         # Create user's upload directory
         os.makedirs(get_user_upload_path(username), exist_ok=True)
         
@@ -184,10 +306,8 @@ def register():
 def handle_login():
     username = request.form['username']
     password = request.form['password']
-    users = load_users()
     
-    user = next((user for user in users if user['username'] == username), None)
-    if user and user['password'] == password:  # Simple password check
+    if users.authenticate(username, password):
         session['username'] = username
         return redirect(url_for('gallery'))
     
@@ -204,8 +324,9 @@ def gallery():
     if 'username' not in session:
         return redirect(url_for('login'))
     
-    # Load user-specific clothing items
-    user_items = load_clothing_data(session['username'])
+    # Load user-specific clothing items (items being deleted are already gone for the user)
+    user_items = [item for item in load_clothing_data(session['username'])
+                  if item.get('processing_status') != 'deleting']
     return render_template('gallery.html', items=user_items)
 
 @app.route('/clear_all', methods=['POST'])
@@ -213,25 +334,30 @@ def clear_all():
     if 'username' not in session:
         return redirect(url_for('login'))
     
-    username = session['username']
-    
-    # Clear user's metadata file
-    save_clothing_data([], username)
-    
-    # Delete user's images
-    user_uploads_dir = get_user_upload_path(username)
-    if os.path.exists(user_uploads_dir):
-        for filename in os.listdir(user_uploads_dir):
-            if filename.endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                file_path = os.path.join(user_uploads_dir, filename)
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Error deleting {filename}: {e}")
+    # Items disappear at once; files, metadata and vectors are removed by a background job
+    try:
+        result = api.delete_items(session['username'])
+        if result.get('status') != 'scheduled':
+            raise RuntimeError(result.get('detail') or result.get('error') or result)
+    except Exception as e:
+        logger.error("Could not clear wardrobe of %s: %s", session['username'], e)
+        flash('Could not clear your wardrobe, please try again.', 'error')
+        return redirect(url_for('gallery'))
     
     flash('All images and data have been cleared successfully.', 'success')
     return redirect(url_for('gallery'))
 
+@app.route('/delete-item/<image_id>', methods=['POST'])
+def delete_item(image_id):
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    try:
+        return jsonify(api.delete_items(session['username'], [image_id]))
+    except Exception as e:
+        logger.error("Error deleting image %s: %s", image_id, e)
+        return jsonify({'status': 'error', 'error': str(e)})
+
 @app.route('/get-image-data/<image_id>')
 def get_image_data(image_id):
     if 'username' not in session:
@@ -253,6 +379,33 @@ def get_image_data(image_id):
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/similar-items/<image_id>')
+def get_similar_items(image_id):
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    try:
+        return jsonify(api.similar_items(
+            session['username'],
+            image_id,
+            limit=request.args.get('limit', 10, type=int),
+            offset=request.args.get('offset', 0, type=int)
+        ))
+    except Exception as e:
+        logger.error("Error in get_similar_items: %s", e)
+        return jsonify({'status': 'error', 'error': str(e)})
+
+@app.route('/pairings')
+def get_pairings():
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    try:
+        return jsonify(api.pairings(session['username'], limit=request.args.get('limit', 10, type=int)))
+    except Exception as e:
+        logger.error("Error in get_pairings: %s", e)
+        return jsonify({'status': 'error', 'error': str(e)})
+
 @app.route('/uploads/<path:filename>')
 def serve_image(filename):
     return send_from_directory('uploads', filename)
@@ -268,6 +421,11 @@ def recommendations():
     if 'username' not in session:
         return redirect(url_for('login'))
     items = load_clothing_data(session['username'])
+    # Let the API start on the first recommendations while the page renders
+    try:
+        api.prefetch(session['username'])
+    except Exception as e:
+        logger.warning("Could not schedule recommendation prefetch: %s", e)
     return render_template('recommendations.html', items=items)
 
 # Add route for random recommendation API
@@ -277,20 +435,9 @@ def get_random_recommendation():
         return jsonify({'error': 'Not logged in'}), 401
     
     try:
-        # Start async recommendation process
-        response = requests.post(
-            f"{API_BASE_URL}/generate-recommendation",
-            json={"username": session['username']},  # Properly structure the JSON data
-            headers={"Content-Type": "application/json"}
-        )
-        
-        if response.status_code == 422:
-            print(f"Validation error: {response.json()}")
-            return jsonify({'status': 'error', 'error': 'Invalid request format'})
-            
-        return jsonify(response.json())
+        return jsonify(api.recommend(session['username']))
     except Exception as e:
-        print(f"Recommendation error: {e}")
+        logger.error("Recommendation error: %s", e)
         return jsonify({'status': 'error', 'error': str(e)})
 
 # Add this to your startup code
@@ -298,36 +445,25 @@ def get_random_recommendation():
 
 @app.route('/get-recommendation-for-apparel', methods=['POST'])
 def get_recommendation_for_apparel():
-    logging.debug("Received request to get recommendation for apparel")
+    logger.debug("Received request to get recommendation for apparel")
     if 'username' not in session:
         return jsonify({'error': 'Not logged in'}), 401
     
     try:
         data = request.json
-        # Start async recommendation process with specific apparel
-        response = requests.post(
-            f"{API_BASE_URL}/generate-recommendation-for-apparel",
-            json={
-                "username": session['username'],
-                "image_id": data['imageId'],
-                "description": data['description'],
-                "apparel_type": data['apparelType']
-            },
-            headers={"Content-Type": "application/json"}
-        )
-        
-        if response.status_code == 422:
-            logging.error(f"Validation error: {response.json()}")
-            return jsonify({'status': 'error', 'error': 'Invalid request format'})
-            
-        return jsonify(response.json())
+        return jsonify(api.recommend_for_apparel(
+            session['username'],
+            data['imageId'],
+            data['description'],
+            data['apparelType']
+        ))
     except Exception as e:
-        logging.error(f"Error in get_recommendation_for_apparel: {e}")
+        logger.error("Error in get_recommendation_for_apparel: %s", e)
         return jsonify({'status': 'error', 'error': str(e)})
 
 @app.route('/get-recommendation-for-text', methods=['POST'])
 def get_recommendation_for_text():
-    logging.debug("Received request to get recommendation based on text")
+    logger.debug("Received request to get recommendation based on text")
     if 'username' not in session:
         return jsonify({'error': 'Not logged in'}), 401
     
@@ -337,25 +473,29 @@ def get_recommendation_for_text():
         if not input_text:
             return jsonify({'status': 'error', 'error': 'No input text provided'}), 400
         
-        # Start async recommendation process with input text
-        response = requests.post(
-            f"{API_BASE_URL}/generate-recommendation-based-on-text",
-            json={
-                "username": session['username'],
-                "input_text": input_text
-            },
-            headers={"Content-Type": "application/json"}
-        )
-        
-        if response.status_code == 422:
-            logging.error(f"Validation error: {response.json()}")
-            return jsonify({'status': 'error', 'error': 'Invalid request format'})
-            
-        return jsonify(response.json())
+        return jsonify(api.recommend_for_text(session['username'], input_text))
+    except Exception as e:
+        logger.error("Error in get_recommendation_for_text: %s", e)
+        return jsonify({'status': 'error', 'error': str(e)})
+
+@app.route('/get-recommendation-for-text/stream', methods=['POST'])
+def stream_recommendation_for_text():
+    """Relay the API's NDJSON events so the page can show the base item early"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    input_text = (request.json or {}).get('input_text', '')
+    if not input_text:
+        return jsonify({'status': 'error', 'error': 'No input text provided'}), 400
+
+    try:
+        lines = api.stream_recommendation_for_text(session['username'], input_text)
     except Exception as e:
-        logging.error(f"Error in get_recommendation_for_text: {e}")
+        logger.error("Error in stream_recommendation_for_text: %s", e)
         return jsonify({'status': 'error', 'error': str(e)})
 
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
 if __name__ == '__main__':
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     os.makedirs('user_metadata', exist_ok=True)
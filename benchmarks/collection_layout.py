@@ -0,0 +1,136 @@
+"""Per-user vs. shared collection layout at multi-tenant scale.
+
+Builds a synthetic store with --users users x 4 categories x --items vectors
+in each layout (each in its own subprocess, so memory and file handles are
+measured independently), reopens it as a restarted API worker would, and
+reports query latency, open file descriptors and resident memory.
+
+    python -m benchmarks.collection_layout --users 10000 --backend chroma
+    python -m benchmarks.collection_layout --users 1000 --backend numpy
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from vector_store import create_backend, user_category_collection, APPAREL_TYPES, LAYOUTS
+
+
+def open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except FileNotFoundError:
+        return -1
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+def run_layout(args):
+    rng = np.random.default_rng(args.seed)
+    vector_db = tempfile.mkdtemp(prefix=f'wearwiz_layout_{args.child}_')
+
+    start = time.perf_counter()
+    backend = create_backend(args.backend, vector_db)
+    for user in range(args.users):
+        username = f"user{user}"
+        for category in APPAREL_TYPES:
+            collection = user_category_collection(backend, username, category, args.child)
+            vectors = rng.standard_normal((args.items, args.dim)).astype(np.float32)
+            collection.add(
+                ids=[f"{username}_{category}_{i}" for i in range(args.items)],
+                embeddings=vectors.tolist(),
+                documents=[f"item {i}" for i in range(args.items)],
+                metadatas=[{"image_id": str(i), "username": username, "category": category}
+                           for i in range(args.items)]
+            )
+    build_s = time.perf_counter() - start
+    collections = len(backend.list_collection_names())
+    del backend
+
+    # Reopen the store as a fresh worker would, then serve random users
+    baseline_fds, baseline_rss = open_fds(), rss_mb()
+    backend = create_backend(args.backend, vector_db)
+    picker = random.Random(args.seed)
+    latencies = []
+    for _ in range(args.queries):
+        username = f"user{picker.randrange(args.users)}"
+        category = picker.choice(APPAREL_TYPES)
+        query = rng.standard_normal(args.dim).astype(np.float32)
+        start = time.perf_counter()
+        collection = user_category_collection(backend, username, category, args.child)
+        results = collection.query(query_embeddings=[query.tolist()], n_results=1,
+                                   include=['metadatas'])
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert results['metadatas'][0][0]['username'] == username
+
+    print(json.dumps({
+        'layout': args.child,
+        'collections': collections,
+        'build_s': build_s,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'open_fds': open_fds() - baseline_fds,
+        'rss_mb': rss_mb() - baseline_rss,
+    }))
+    shutil.rmtree(vector_db, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--items', type=int, default=8, help='items per user and category')
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--backend', default=os.environ.get("WEARWIZ_VECTOR_BACKEND", "chroma"))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--child', choices=LAYOUTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_layout(args)
+        return
+
+    rows = []
+    for layout in LAYOUTS:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.collection_layout', '--child', layout,
+             '--users', str(args.users), '--items', str(args.items), '--dim', str(args.dim),
+             '--queries', str(args.queries), '--backend', args.backend, '--seed', str(args.seed)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        rows.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{args.users} users x {len(APPAREL_TYPES)} categories x {args.items} items, "
+          f"backend={args.backend}")
+    header = f"{'layout':<9} {'colls':>7} {'build s':>8} {'p50 ms':>7} {'p95 ms':>7} " \
+             f"{'p99 ms':>7} {'+fds':>6} {'+RSS MB':>8}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f"{row['layout']:<9} {row['collections']:>7} {row['build_s']:>8.1f} "
+              f"{row['p50_ms']:>7.2f} {row['p95_ms']:>7.2f} {row['p99_ms']:>7.2f} "
+              f"{row['open_fds']:>6} {row['rss_mb']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
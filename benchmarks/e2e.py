@@ -0,0 +1,313 @@
+"""End-to-end load test of the API service against a local Groq stand-in.
+
+Starts benchmarks/fake_groq.py and api_service.py (pointed at the fake via
+GROQ_BASE_URL) in a scratch working directory, builds synthetic users from
+the images in static/uploads, then drives
+
+  * ingest: /process-image followed by /processing-status polling
+  * /generate-recommendation, /generate-recommendation-for-apparel,
+    /generate-recommendation-based-on-text and its NDJSON /stream variant
+    (timed to the first event and to the end)
+
+with concurrent users, and reports p50/p95/p99 latency and throughput per
+stage. The API runs with WEARWIZ_METRICS=1, and the server-side breakdown
+(vision calls, embeddings, vector queries, metadata writes) is read from its
+/metrics endpoint at the end. The Groq limiter (WEARWIZ_GROQ_RPM) is off by
+default so the hot paths are measured rather than the quota; ``--groq-rpm``
+turns it on.
+
+    python -m benchmarks.e2e --users 20 --concurrency 8 --requests 5
+    python -m benchmarks.e2e --groq-latency-ms 1500 --groq-error-rate 0.05
+    python -m benchmarks.e2e --groq-rpm 30
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_UPLOADS = os.path.join(REPO_ROOT, 'static', 'uploads')
+TEXT_PROMPTS = [
+    "office meeting", "beach party", "casual friday", "wedding guest",
+    "first date dinner", "weekend hike", "job interview", "summer picnic",
+]
+
+
+class Recorder:
+    """Thread-safe collection of per-stage latencies and errors"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, ok=True):
+        with self._lock:
+            self.latencies.setdefault(stage, []).append(seconds * 1000)
+            if not ok:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+            now = time.perf_counter()
+            start, _ = self.spans.get(stage, (now - seconds, now))
+            self.spans[stage] = (min(start, now - seconds), now)
+
+    def report(self):
+        header = f"{'stage':<28} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} " \
+                 f"{'p99 ms':>9} {'req/s':>7}"
+        print(header)
+        print('-' * len(header))
+        for stage, values in self.latencies.items():
+            start, end = self.spans[stage]
+            throughput = len(values) / (end - start) if end > start else 0.0
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            print(f"{stage:<28} {len(values):>6} {self.errors.get(stage, 0):>6} {p50:>9.1f} "
+                  f"{p95:>9.1f} {p99:>9.1f} {throughput:>7.2f}")
+
+
+def print_stage_breakdown(api_url):
+    """Mean time per server-side stage, from the API's Prometheus metrics"""
+    try:
+        text = requests.get(f"{api_url}/metrics", timeout=5).text
+    except requests.RequestException:
+        return
+    totals = {}
+    pattern = re.compile(r'^(wearwiz_stage_seconds|wearwiz_groq_request_seconds)_(sum|count)\{(\w+)="([^"]+)"\} (\S+)$')
+    for line in text.splitlines():
+        match = pattern.match(line)
+        if match:
+            family, field, _, label, value = match.groups()
+            name = ('groq: ' if family.startswith('wearwiz_groq') else 'stage: ') + label
+            totals.setdefault(name, {})[field] = float(value)
+    if not totals:
+        return
+
+    print()
+    header = f"{'server-side':<36} {'count':>7} {'mean ms':>9} {'total s':>9}"
+    print(header)
+    print('-' * len(header))
+    for name, values in sorted(totals.items(), key=lambda entry: -entry[1].get('sum', 0)):
+        count = values.get('count', 0)
+        mean = values.get('sum', 0) / count * 1000 if count else 0.0
+        print(f"{name:<36} {int(count):>7} {mean:>9.1f} {values.get('sum', 0):>9.1f}")
+
+
+def sample_images():
+    return sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(SAMPLE_UPLOADS)
+        for name in files
+        if name.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))
+    )
+
+
+def build_users(workdir, user_count, items_per_user, seed):
+    """Copy sample images into per-user upload dirs with pending metadata rows"""
+    rng = random.Random(seed)
+    images = sample_images()
+    os.makedirs(os.path.join(workdir, 'user_metadata'), exist_ok=True)
+    users = {}
+    for u in range(user_count):
+        username = f"bench{u}"
+        upload_dir = os.path.join(workdir, 'static', 'uploads', username)
+        os.makedirs(upload_dir, exist_ok=True)
+        items = []
+        for n, source in enumerate(rng.sample(images, min(items_per_user, len(images)))):
+            filename = os.path.basename(source)
+            shutil.copyfile(source, os.path.join(upload_dir, filename))
+            image_id = str(u * 1000 + n + 1)  # unique across users
+            items.append({
+                'id': image_id,
+                'image_id': image_id,
+                'filename': filename,
+                'path': f'uploads/{username}/{filename}',
+                'title': "Processing...",
+                'apparel_type': "Processing...",
+                'description': "Processing...",
+                'processing_status': 'pending',
+                'username': username
+            })
+        with open(os.path.join(workdir, 'user_metadata', f'{username}_metadata.json'), 'w') as f:
+            json.dump(items, f, indent=2)
+        users[username] = items
+    return users
+
+
+def wait_for(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_servers(args, workdir):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    fake_env = dict(env,
+                    FAKE_GROQ_VISION_LATENCY_MS=str(args.groq_latency_ms),
+                    FAKE_GROQ_TEXT_LATENCY_MS=str(args.groq_text_latency_ms or args.groq_latency_ms / 2),
+                    FAKE_GROQ_ERROR_RATE=str(args.groq_error_rate))
+    fake = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'benchmarks.fake_groq:app',
+         '--port', str(args.groq_port), '--log-level', 'warning'],
+        cwd=REPO_ROOT, env=fake_env
+    )
+    api_env = dict(env, GROQ_BASE_URL=f"http://127.0.0.1:{args.groq_port}", GROQ_API_KEY="fake",
+                   WEARWIZ_METRICS="1", WEARWIZ_GROQ_RPM=str(args.groq_rpm))
+    api = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'api_service:app',
+         '--port', str(args.api_port), '--log-level', 'warning'],
+        cwd=workdir, env=api_env, stdout=subprocess.DEVNULL
+    )
+    wait_for(f"http://127.0.0.1:{args.groq_port}/stats", 30)
+    wait_for(f"http://127.0.0.1:{args.api_port}/docs", args.startup_timeout)
+    return [fake, api]
+
+
+def ingest(api_url, username, item, recorder, poll_interval):
+    image_path = os.path.join('static', 'uploads', username, item['filename'])
+    start = time.perf_counter()
+    response = requests.post(f"{api_url}/process-image/{item['image_id']}",
+                             params={"filename": item['filename'], "image_path": image_path})
+    recorder.record('ingest: submit', time.perf_counter() - start, response.ok)
+    if not response.ok:
+        return
+
+    status = 'processing'
+    while status in ('processing', 'queued'):
+        time.sleep(poll_interval)
+        poll_start = time.perf_counter()
+        status = requests.get(f"{api_url}/processing-status/{item['image_id']}").json().get('status')
+        recorder.record('ingest: status poll', time.perf_counter() - poll_start)
+    recorder.record('ingest: end-to-end', time.perf_counter() - start, status == 'completed')
+
+
+def recommend_streamed(api_url, username, recorder, rng):
+    """Text recommendation over the NDJSON endpoint, timing the first and last event"""
+    start = time.perf_counter()
+    ok, first = False, None
+    try:
+        with requests.post(f"{api_url}/generate-recommendation-based-on-text/stream",
+                           json={"username": username, "input_text": rng.choice(TEXT_PROMPTS)},
+                           stream=True) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if first is None:
+                    first = time.perf_counter() - start
+                ok = event.get('event') == 'recommended_item'
+    except requests.RequestException:
+        pass
+    if first is not None:
+        recorder.record('recommend: text stream 1st', first, ok)
+    recorder.record('recommend: text stream', time.perf_counter() - start, ok)
+
+
+def recommend(api_url, username, workdir, recorder, requests_per_user, rng):
+    with open(os.path.join(workdir, 'user_metadata', f'{username}_metadata.json')) as f:
+        items = [item for item in json.load(f) if item.get('processing_status') == 'completed']
+
+    for i in range(requests_per_user):
+        kind = i % 4
+        if kind == 3:
+            recommend_streamed(api_url, username, recorder, rng)
+            continue
+        if kind == 0:
+            stage, path, body = 'recommend: random', '/generate-recommendation', {"username": username}
+        elif kind == 1 and items:
+            item = rng.choice(items)
+            stage, path = 'recommend: apparel', '/generate-recommendation-for-apparel'
+            body = {"username": username, "image_id": item['image_id'],
+                    "description": item['description'], "apparel_type": item['apparel_type']}
+        else:
+            stage, path = 'recommend: text', '/generate-recommendation-based-on-text'
+            body = {"username": username, "input_text": rng.choice(TEXT_PROMPTS)}
+
+        start = time.perf_counter()
+        try:
+            response = requests.post(f"{api_url}{path}", json=body)
+            ok = response.ok and response.json().get('status') == 'success'
+        except requests.RequestException:
+            ok = False
+        recorder.record(stage, time.perf_counter() - start, ok)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--items-per-user', type=int, default=6)
+    parser.add_argument('--requests', type=int, default=8, help='recommendations per user')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--groq-latency-ms', type=float, default=800, help='vision call latency')
+    parser.add_argument('--groq-text-latency-ms', type=float, default=None,
+                        help='text call latency (default: half the vision latency)')
+    parser.add_argument('--groq-error-rate', type=float, default=0.0)
+    parser.add_argument('--groq-rpm', type=float, default=0,
+                        help="Groq requests per minute per API process (0: limiter off)")
+    parser.add_argument('--api-port', type=int, default=8800)
+    parser.add_argument('--groq-port', type=int, default=8801)
+    parser.add_argument('--api-url', help='use an already running API whose working directory is --workdir')
+    parser.add_argument('--workdir', help='scratch directory (default: a new temp dir)')
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='wearwiz_e2e_')
+    users = build_users(workdir, args.users, args.items_per_user, args.seed)
+    processes = [] if args.api_url else start_servers(args, workdir)
+    api_url = args.api_url or f"http://127.0.0.1:{args.api_port}"
+    recorder = Recorder()
+    if args.api_url:
+        limiter = "as configured on the running API"
+    else:
+        limiter = f"{args.groq_rpm:g} requests/min per process" if args.groq_rpm > 0 else "off"
+
+    try:
+        print(f"Groq rate limiter: {limiter}")
+        print(f"Ingesting {sum(len(items) for items in users.values())} items for "
+              f"{len(users)} users (concurrency {args.concurrency})")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for future in [pool.submit(ingest, api_url, username, item, recorder, args.poll_interval)
+                           for username, items in users.items() for item in items]:
+                future.result()
+        print(f"Ingest finished in {time.perf_counter() - start:.1f}s")
+
+        print(f"Requesting {args.requests} recommendations per user")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for future in [pool.submit(recommend, api_url, username, workdir, recorder,
+                                       args.requests, random.Random(args.seed + i))
+                           for i, username in enumerate(users)]:
+                future.result()
+        print(f"Recommendations finished in {time.perf_counter() - start:.1f}s\n")
+
+        recorder.report()
+        print(f"\nGroq rate limiter: {limiter}")
+        print_stage_breakdown(api_url)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
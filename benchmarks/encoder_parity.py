@@ -0,0 +1,167 @@
+"""Parity and throughput of the ONNX encoder backends against PyTorch FashionCLIP.
+
+Encodes the images in --images (default ``static/uploads/``) and a fixed set
+of prompts with each backend, each in its own subprocess so resident memory
+is measured independently, and reports images/s, texts/s and RSS. The ONNX
+embeddings are then compared with the torch ones by per-row cosine
+similarity and top-1 text->image retrieval agreement; the run exits
+non-zero if the mean cosine falls below --min-cosine.
+
+    python -m tools.export_onnx --out models/onnx
+    python -m benchmarks.encoder_parity --onnx-dir models/onnx --threads 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from encoders import create_encoder, ENCODERS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+PROMPTS = [
+    "a navy blue denim jacket", "white sneakers", "black slim fit jeans", "a red floral summer dress",
+    "a grey wool sweater", "brown leather boots", "a striped cotton t-shirt", "beige chino trousers",
+    "a formal white shirt", "a green hoodie", "a black leather belt", "a plaid flannel shirt",
+]
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def list_images(directory, limit):
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)[:limit]
+
+
+def run_backend(args):
+    """Child process: encode everything with one backend and save the embeddings"""
+    baseline = rss_mb()
+    start = time.perf_counter()
+    encoder = create_encoder(args.child, args.model, onnx_dir=args.onnx_dir, threads=args.threads)
+    load_seconds = time.perf_counter() - start
+    paths = list_images(args.images, args.limit)
+
+    # Warm up once so lazy initialisation is not counted as throughput
+    encoder.encode_images(paths[:1], batch_size=1)
+    encoder.encode_text(PROMPTS[:1], batch_size=1)
+
+    start = time.perf_counter()
+    image_embeddings = encoder.encode_images(paths, batch_size=args.batch_size)
+    image_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    text_embeddings = encoder.encode_text(PROMPTS * args.text_repeat, batch_size=args.batch_size)
+    text_seconds = time.perf_counter() - start
+
+    np.savez(args.output, images=np.asarray(image_embeddings, dtype=np.float32),
+             texts=np.asarray(text_embeddings, dtype=np.float32)[:len(PROMPTS)])
+    print(json.dumps({
+        'backend': args.child,
+        'images': len(paths),
+        'load_s': load_seconds,
+        'images_per_s': len(paths) / image_seconds if image_seconds else 0.0,
+        'texts_per_s': len(PROMPTS) * args.text_repeat / text_seconds if text_seconds else 0.0,
+        'rss_mb': rss_mb(),
+        'model_rss_mb': rss_mb() - baseline,
+    }))
+
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def compare(reference, candidate):
+    """Mean/min row cosine and how often text->image top-1 matches the reference"""
+    ref_images, cand_images = normalize(reference['images']), normalize(candidate['images'])
+    ref_texts, cand_texts = normalize(reference['texts']), normalize(candidate['texts'])
+    image_cosines = np.sum(ref_images * cand_images, axis=1)
+    text_cosines = np.sum(ref_texts * cand_texts, axis=1)
+    ref_top = np.argmax(ref_texts @ ref_images.T, axis=1)
+    cand_top = np.argmax(cand_texts @ cand_images.T, axis=1)
+    return {
+        'image_cosine_mean': float(image_cosines.mean()),
+        'image_cosine_min': float(image_cosines.min()),
+        'text_cosine_mean': float(text_cosines.mean()),
+        'text_cosine_min': float(text_cosines.min()),
+        'top1_agreement': float(np.mean(ref_top == cand_top)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=list(ENCODERS), choices=ENCODERS,
+                        help='the first backend is the reference')
+    parser.add_argument('--model', default=os.environ.get("WEARWIZ_EMBEDDING_MODEL", "fashion-clip"))
+    parser.add_argument('--onnx-dir', default=os.environ.get("WEARWIZ_ONNX_DIR", "./models/onnx"))
+    parser.add_argument('--images', default=os.path.join(REPO_ROOT, 'static', 'uploads'))
+    parser.add_argument('--limit', type=int, default=256, help='maximum number of images')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--text-repeat', type=int, default=8, help='repeat the prompts for throughput')
+    parser.add_argument('--threads', type=int, help='intra-op threads for the ONNX sessions')
+    parser.add_argument('--min-cosine', type=float, default=0.99,
+                        help='fail if a backend\'s mean image or text cosine is below this')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_backend(args)
+        return
+
+    scratch = tempfile.mkdtemp(prefix='wearwiz_encoder_parity_')
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    results, embeddings = {}, {}
+    for backend in args.backends:
+        output = os.path.join(scratch, f'{backend}.npz')
+        command = [sys.executable, '-m', 'benchmarks.encoder_parity', '--child', backend, '--output', output,
+                   '--model', args.model, '--onnx-dir', args.onnx_dir, '--images', args.images,
+                   '--limit', str(args.limit), '--batch-size', str(args.batch_size),
+                   '--text-repeat', str(args.text_repeat)]
+        if args.threads:
+            command += ['--threads', str(args.threads)]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{backend}: failed\n{completed.stderr[-2000:]}")
+            continue
+        results[backend] = json.loads(completed.stdout.strip().splitlines()[-1])
+        with np.load(output) as data:
+            embeddings[backend] = {'images': data['images'], 'texts': data['texts']}
+
+    print(f"{'backend':<10} {'images':>7} {'load s':>8} {'img/s':>8} {'text/s':>8} {'RSS MB':>8} {'model MB':>9}")
+    for backend, r in results.items():
+        print(f"{backend:<10} {r['images']:>7} {r['load_s']:>8.1f} {r['images_per_s']:>8.1f} "
+              f"{r['texts_per_s']:>8.1f} {r['rss_mb']:>8.0f} {r['model_rss_mb']:>9.0f}")
+
+    reference = args.backends[0]
+    failed = reference not in embeddings or len(results) < len(args.backends)
+    if reference in embeddings:
+        print(f"\nParity against {reference}:")
+        for backend in args.backends[1:]:
+            if backend not in embeddings:
+                continue
+            parity = compare(embeddings[reference], embeddings[backend])
+            ok = min(parity['image_cosine_mean'], parity['text_cosine_mean']) >= args.min_cosine
+            failed = failed or not ok
+            print(f"  {backend:<10} image cos mean {parity['image_cosine_mean']:.4f} "
+                  f"(min {parity['image_cosine_min']:.4f}), text cos mean {parity['text_cosine_mean']:.4f} "
+                  f"(min {parity['text_cosine_min']:.4f}), top-1 agreement {parity['top1_agreement']:.0%}"
+                  f"{'' if ok else '  BELOW THRESHOLD'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
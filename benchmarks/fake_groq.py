@@ -0,0 +1,140 @@
+"""Local stand-in for the Groq chat completions API.
+
+Answers the vision and text prompts used by ai_handler with canned but
+plausible outputs after a configurable delay (streamed word by word when the
+request sets ``stream``), and fails a configurable share
+of requests with 429 (with Retry-After) or 500, so the ingest and
+recommendation paths can be load-tested without a Groq key.
+
+    FAKE_GROQ_LATENCY_MS=800 FAKE_GROQ_ERROR_RATE=0.02 \\
+        uvicorn benchmarks.fake_groq:app --port 8100
+    GROQ_BASE_URL=http://localhost:8100 GROQ_API_KEY=fake uvicorn api_service:app --port 8000
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Mean latency per call, split by model kind, plus uniform jitter (+/- fraction)
+VISION_LATENCY_MS = float(os.environ.get("FAKE_GROQ_VISION_LATENCY_MS",
+                                         os.environ.get("FAKE_GROQ_LATENCY_MS", "800")))
+TEXT_LATENCY_MS = float(os.environ.get("FAKE_GROQ_TEXT_LATENCY_MS",
+                                       os.environ.get("FAKE_GROQ_LATENCY_MS", "400")))
+JITTER = float(os.environ.get("FAKE_GROQ_JITTER", "0.25"))
+ERROR_RATE = float(os.environ.get("FAKE_GROQ_ERROR_RATE", "0"))
+RATE_LIMIT_SHARE = float(os.environ.get("FAKE_GROQ_RATE_LIMIT_SHARE", "0.5"))
+# Share of a call's latency spent before the first streamed token
+TTFT_SHARE = float(os.environ.get("FAKE_GROQ_TTFT_SHARE", "0.3"))
+
+COLORS = ["navy", "black", "white", "olive", "beige", "burgundy", "light blue", "grey"]
+MATERIALS = ["cotton", "denim", "linen", "wool", "polyester", "corduroy"]
+PIECES = {
+    'top': ["crew-neck t-shirt", "button-down shirt", "knitted sweater", "polo shirt"],
+    'bottom': ["slim-fit jeans", "pleated chinos", "tailored trousers", "cargo shorts"],
+    'outerwear': ["bomber jacket", "trench coat", "denim jacket"],
+    'full-body': ["wrap dress", "jumpsuit", "maxi dress"],
+}
+
+app = FastAPI()
+stats = {'requests': 0, 'errors': 0}
+
+
+def describe(category, rng):
+    return (f"A {rng.choice(COLORS)} {rng.choice(MATERIALS)} {rng.choice(PIECES[category])} "
+            f"with a relaxed fit and subtle stitched detailing")
+
+
+def answer(prompt, rng):
+    """Canned reply matching the shape ai_handler expects for each prompt"""
+    lowered = prompt.lower()
+    if "choose exactly one category" in lowered:
+        return rng.choice(list(PIECES))
+    if "title" in lowered:
+        return f"{rng.choice(COLORS).title()} {rng.choice(PIECES['top']).title()}"
+    for category in ('bottom', 'top'):
+        if f"ideal {category}" in lowered:
+            return describe(category, rng)
+    return describe(rng.choice(list(PIECES)), rng)
+
+
+def prompt_text(messages):
+    content = messages[-1]['content']
+    if isinstance(content, str):
+        return content, False
+    text = " ".join(part.get('text', '') for part in content if part.get('type') == 'text')
+    has_image = any(part.get('type') == 'image_url' for part in content)
+    return text, has_image
+
+
+async def stream_chunks(body, content, generation_seconds):
+    """Server-sent chat.completion.chunk events, one word at a time.
+
+    The reply is followed by an explanatory second line, as real models often
+    add one, so clients that stop at the first line save the rest of the time.
+    """
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    words = (content + "\nThis pairing works because the colors and silhouettes balance each other.").split(' ')
+    delay = generation_seconds / max(len(words), 1)
+    for i, word in enumerate(words):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get('model', 'fake'),
+            "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                         "finish_reason": None, "logprobs": None}]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(delay)
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt, has_image = prompt_text(body['messages'])
+    rng = random.Random()
+    stats['requests'] += 1
+
+    mean_ms = VISION_LATENCY_MS if has_image else TEXT_LATENCY_MS
+    latency = max(0.0, mean_ms * (1 + rng.uniform(-JITTER, JITTER))) / 1000
+    await asyncio.sleep(latency * TTFT_SHARE if body.get('stream') else latency)
+
+    if rng.random() < ERROR_RATE:
+        stats['errors'] += 1
+        if rng.random() < RATE_LIMIT_SHARE:
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": "1"},
+                content={"error": {"message": "Rate limit reached", "type": "tokens",
+                                   "code": "rate_limit_exceeded"}}
+            )
+        return JSONResponse(status_code=500, content={"error": {"message": "Internal error"}})
+
+    content = answer(prompt, rng)
+    if body.get('stream'):
+        return StreamingResponse(stream_chunks(body, content, latency * (1 - TTFT_SHARE)),
+                                 media_type="text/event-stream")
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get('model', 'fake'),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+            "logprobs": None
+        }],
+        "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(content.split()),
+                  "total_tokens": len(prompt.split()) + len(content.split())}
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
@@ -0,0 +1,103 @@
+"""Recall vs. memory of quantized embedding storage.
+
+Embeds the sample wardrobes under static/uploads with FashionCLIP, stores them
+in float32, float16 and int8, and measures how often the quantized index
+returns the same top-k as exact float32 search for image and text queries.
+
+    python -m benchmarks.quantization_recall
+    python -m benchmarks.quantization_recall --synthetic 100000   # no model needed
+"""
+import argparse
+import os
+import time
+import numpy as np
+import embedding_codec
+
+UPLOADS_DIR = os.path.join('static', 'uploads')
+TEXT_QUERIES = [
+    "blue denim jeans", "black formal trousers", "white cotton t-shirt",
+    "floral summer dress", "striped button-down shirt", "leather jacket",
+    "beige chinos", "red knitted sweater", "grey hoodie", "pleated skirt",
+]
+
+
+def load_wardrobe_embeddings():
+    from PIL import Image
+    from fashion_clip.fashion_clip import FashionCLIP
+
+    fclip = FashionCLIP('fashion-clip')
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(UPLOADS_DIR)
+        for name in files
+        if name.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))
+    )
+    images = [Image.open(path).convert('RGB') for path in paths]
+    image_embeddings = fclip.encode_images(images, batch_size=16)
+    text_embeddings = fclip.encode_text(TEXT_QUERIES, batch_size=16)
+    print(f"Embedded {len(paths)} images from {UPLOADS_DIR}")
+    # Image queries are the stored items themselves (near-duplicate lookup)
+    return image_embeddings, np.vstack([text_embeddings, image_embeddings])
+
+
+def synthetic_embeddings(count, dim, queries, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((count, dim)).astype(np.float32),
+            rng.standard_normal((queries, dim)).astype(np.float32))
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def top_k(scores, k):
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='use N random vectors instead of embedding static/uploads')
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 5])
+    args = parser.parse_args()
+
+    if args.synthetic:
+        items, queries = synthetic_embeddings(args.synthetic, args.dim, args.queries)
+    else:
+        items, queries = load_wardrobe_embeddings()
+    items, queries = normalize(items), normalize(queries)
+    dim = items.shape[1]
+    ks = [k for k in args.k if k <= len(items)]
+
+    exact = queries @ items.T
+    exact_top = {k: top_k(exact, k) for k in ks}
+    baseline_bytes = embedding_codec.bytes_per_vector('float32', dim)
+
+    header = f"{'dtype':<8} {'bytes/vec':>9} {'GB/1M':>7} {'ratio':>6} {'query ms':>9} " + \
+        " ".join(f"{'recall@' + str(k):>9}" for k in ks)
+    print(header)
+    print('-' * len(header))
+    for dtype in embedding_codec.DTYPES:
+        codes, scales = embedding_codec.encode(items, dtype)
+        start = time.perf_counter()
+        scores = embedding_codec.dot(queries, codes, scales)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        recalls = []
+        for k in ks:
+            approx_top = top_k(scores, k)
+            hits = sum(len(set(a) & set(e)) for a, e in zip(approx_top, exact_top[k]))
+            recalls.append(hits / (k * len(queries)))
+
+        size = embedding_codec.bytes_per_vector(dtype, dim)
+        print(f"{dtype:<8} {size:>9} {size * 1e6 / 1e9:>7.3f} {baseline_bytes / size:>5.1f}x "
+              f"{elapsed_ms:>9.4f} " + " ".join(f"{r:>9.4f}" for r in recalls))
+
+
+if __name__ == '__main__':
+    main()
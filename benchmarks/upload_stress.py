@@ -0,0 +1,157 @@
+"""Concurrency stress test for /upload across several Flask workers.
+
+Starts ``--workers`` independent Flask processes on consecutive ports, all
+sharing one scratch working directory (as several gunicorn workers would),
+logs in ``--users`` users and has ``--concurrency`` threads upload unique
+images round-robin across the workers. Afterwards it checks that
+
+  * every successful upload has exactly one metadata entry,
+  * image IDs are unique across all users,
+  * every metadata entry points at a file on disk,
+
+and exits non-zero on any violation.
+
+    python -m benchmarks.upload_stress --workers 4 --users 3 --uploads 200 --concurrency 16
+
+The API service is not started; the web app logs that processing could not
+be scheduled and keeps the items pending, which does not affect the checks.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from PIL import Image
+from user_store import UserStore
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_image(rng):
+    """A small PNG with random pixels, so every upload has distinct content"""
+    image = Image.new('RGB', (32, 32))
+    image.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(32 * 32)])
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def wait_for(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_workers(workdir, count, base_port):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''),
+               WEARWIZ_LOG_LEVEL='ERROR')
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(base_port + i),
+             '--with-threads'],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for i in range(count)
+    ]
+    for i in range(count):
+        wait_for(f"http://127.0.0.1:{base_port + i}/metrics", 60)
+    return processes
+
+
+def login(base_url, username):
+    session = requests.Session()
+    session.post(f"{base_url}/login", data={'username': username, 'password': 'stress'},
+                 allow_redirects=False)
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='Flask processes')
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--uploads', type=int, default=200, help='total uploads')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--port', type=int, default=8900, help='first worker port')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='wearwiz_upload_stress_')
+    usernames = [f"stress{u}" for u in range(args.users)]
+    registry = UserStore(os.path.join(workdir, 'users.db'))
+    for name in usernames:
+        registry.create(name, 'stress')
+
+    processes = start_workers(workdir, args.workers, args.port)
+    urls = [f"http://127.0.0.1:{args.port + i}" for i in range(args.workers)]
+    sessions = {(url, name): login(url, name) for url in urls for name in usernames}
+    rng = random.Random(args.seed)
+    jobs = [(urls[i % len(urls)], usernames[i % len(usernames)], make_image(rng)) for i in range(args.uploads)]
+
+    accepted = {name: [] for name in usernames}
+    errors = []
+    lock = threading.Lock()
+
+    def upload(job):
+        url, username, data = job
+        response = sessions[(url, username)].post(
+            f"{url}/upload", files={'file': ('stress.png', data, 'image/png')}
+        )
+        with lock:
+            if response.ok and response.json().get('status') == 'success':
+                accepted[username].append(response.json()['image_id'])
+            else:
+                errors.append(f"{username}@{url}: {response.status_code} {response.text[:200]}")
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(upload, jobs))
+        elapsed = time.perf_counter() - start
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    problems = list(errors)
+    seen_ids = {}
+    for username in usernames:
+        with open(os.path.join(workdir, 'user_metadata', f'{username}_metadata.json')) as f:
+            items = json.load(f)
+        if sorted(str(item['image_id']) for item in items) != sorted(accepted[username]):
+            problems.append(f"{username}: {len(accepted[username])} uploads accepted but "
+                            f"{len(items)} metadata entries")
+        for item in items:
+            owner = seen_ids.setdefault(str(item['image_id']), username)
+            if owner != username or sum(str(i['image_id']) == str(item['image_id']) for i in items) > 1:
+                problems.append(f"duplicate image_id {item['image_id']} ({owner}, {username})")
+            if not os.path.exists(os.path.join(workdir, 'static', 'uploads', username, item['filename'])):
+                problems.append(f"{username}: image {item['image_id']} is missing {item['filename']}")
+
+    total = sum(len(ids) for ids in accepted.values())
+    print(f"{total}/{args.uploads} uploads accepted by {args.workers} workers in {elapsed:.1f}s "
+          f"({total / elapsed:.1f} uploads/s)")
+    for problem in problems[:20]:
+        print(f"  {problem}")
+    print("OK: metadata consistent" if not problems else f"FAILED: {len(problems)} problems")
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import os
+import hashlib
+import numpy as np
+from sqlite_store import SQLiteStore, import_legacy_json
+
+CATALOG_COLLECTION = "fashion_catalog"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    username TEXT NOT NULL,
+    image_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    category TEXT NOT NULL,
+    PRIMARY KEY (username, image_id)
+);
+CREATE INDEX IF NOT EXISTS members_category ON members (username, category);
+CREATE INDEX IF NOT EXISTS members_hash ON members (content_hash);
+"""
+
+
+def content_hash(image_path):
+    """SHA-256 of an image file's bytes, used as its catalog key"""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CatalogIndex(SQLiteStore):
+    """Cross-user index holding one vector per unique image content.
+
+    Vectors live in a single ``fashion_catalog`` collection keyed by content
+    hash. Which users own which hash is tracked in a SQLite membership table
+    next to the vector store, one row per ``(username, image_id)``, so storage
+    grows with unique items, each user's category view is an index lookup,
+    and adding or removing an item writes only its own row.
+    """
+
+    SCHEMA = _SCHEMA
+
+    def __init__(self, backend, persist_directory):
+        self.collection = backend.get_or_create_collection(
+            CATALOG_COLLECTION,
+            metadata={"hnsw:space": "cosine"}
+        )
+        self.members_path = os.path.join(persist_directory, 'catalog_members.db')
+        super().__init__(self.members_path)
+        import_legacy_json(os.path.join(persist_directory, 'catalog_members.json'),
+                           self._import_members, 'catalog memberships')
+
+    # -- membership table --------------------------------------------------
+
+    def _import_members(self, data):
+        """Load the JSON membership table of earlier versions"""
+        users = data.get('users', {})
+        for username, items in users.items():
+            self.add_members(username, {
+                image_id: (entry['hash'], entry['category']) for image_id, entry in items.items()
+            }, replace=False)
+        return sum(len(items) for items in users.values())
+
+    def add_member(self, content_hash, username, image_id, category):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO members (username, image_id, content_hash, category) VALUES (?, ?, ?, ?)",
+            (username, str(image_id), content_hash, category)
+        )
+
+    def add_members(self, username, entries, replace=True):
+        """Bulk add_member: ``entries`` maps image_id to (hash, category); one transaction"""
+        with self._transaction() as connection:
+            connection.executemany(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO members "
+                f"(username, image_id, content_hash, category) VALUES (?, ?, ?, ?)",
+                [(username, str(image_id), content_hash, category)
+                 for image_id, (content_hash, category) in entries.items()]
+            )
+
+    def remove_member(self, username, image_id):
+        """Drop one membership row; returns its ``{'hash', 'category'}`` or None"""
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT content_hash, category FROM members WHERE username = ? AND image_id = ?",
+                (username, str(image_id))
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "DELETE FROM members WHERE username = ? AND image_id = ?", (username, str(image_id))
+                )
+        return None if row is None else {'hash': row[0], 'category': row[1]}
+
+    def remove_unowned(self, content_hashes):
+        """Delete the vectors of hashes no user owns any more; returns how many went"""
+        content_hashes = sorted(set(content_hashes))
+        owned = set()
+        for start in range(0, len(content_hashes), 500):
+            batch = content_hashes[start:start + 500]
+            placeholders = ', '.join('?' * len(batch))
+            owned.update(row[0] for row in self._connection().execute(
+                f"SELECT DISTINCT content_hash FROM members WHERE content_hash IN ({placeholders})", batch
+            ))
+        orphans = [content_hash for content_hash in content_hashes if content_hash not in owned]
+        if orphans:
+            self.collection.delete(ids=orphans)
+        return len(orphans)
+
+    def user_items(self, username, category=None):
+        """``{image_id: hash}`` for a user's items, optionally in one category"""
+        if category is None:
+            rows = self._connection().execute(
+                "SELECT image_id, content_hash FROM members WHERE username = ?", (username,)
+            )
+        else:
+            rows = self._connection().execute(
+                "SELECT image_id, content_hash FROM members WHERE username = ? AND category = ?",
+                (username, category)
+            )
+        return dict(rows)
+
+    # -- vectors -----------------------------------------------------------
+
+    def get_embedding(self, content_hash):
+        """Stored embedding for a hash, or None if it has not been indexed yet"""
+        result = self.collection.get(ids=[content_hash], include=['embeddings'])
+        embeddings = result.get('embeddings')
+        if not result['ids'] or embeddings is None or len(embeddings) == 0:
+            return None
+        return embeddings[0]
+
+    def add_item(self, content_hash, embedding, description, category, replace=False):
+        """Index a hash's vector; existing vectors are kept unless ``replace``"""
+        if not replace and self.get_embedding(content_hash) is not None:
+            return
+        self.collection.upsert(
+            embeddings=[np.asarray(embedding, dtype=np.float32).tolist()],
+            documents=[description],
+            metadatas=[{"content_hash": content_hash, "category": category}],
+            ids=[content_hash]
+        )
+
+    def add_items(self, content_hashes, embeddings, descriptions, categories):
+        """Bulk add_item: one upsert of the hashes that are not indexed yet"""
+        existing = set(self.collection.get(ids=list(content_hashes), include=[])['ids'])
+        rows = [row for row in zip(content_hashes, embeddings, descriptions, categories) if row[0] not in existing]
+        if not rows:
+            return
+        self.collection.upsert(
+            embeddings=[np.asarray(embedding, dtype=np.float32).tolist() for _, embedding, _, _ in rows],
+            documents=[description for _, _, description, _ in rows],
+            metadatas=[{"content_hash": content_hash, "category": category} for content_hash, _, _, category in rows],
+            ids=[content_hash for content_hash, _, _, _ in rows]
+        )
+
+    def query(self, embedding, n_results=1, username=None, category=None):
+        """Nearest catalog hashes, optionally restricted to one user's items.
+
+        Returns a list of ``(content_hash, similarity)`` pairs.
+        """
+        where = None
+        if username is not None:
+            hashes = sorted(set(self.user_items(username, category).values()))
+            if not hashes:
+                return []
+            where = {"content_hash": {"$in": hashes}}
+            n_results = min(n_results, len(hashes))
+        elif category is not None:
+            where = {"category": category}
+
+        results = self.collection.query(
+            query_embeddings=[np.asarray(embedding, dtype=np.float32).tolist()],
+            n_results=n_results,
+            where=where,
+            include=['distances']
+        )
+        return [
+            (content_hash, 1 - distance)
+            for content_hash, distance in zip(results['ids'][0], results['distances'][0])
+        ]
@@ -0,0 +1,75 @@
+import time
+import contextvars
+from contextlib import contextmanager
+import metrics
+
+# Remaining budget of the caller in milliseconds. Relative rather than an
+# absolute timestamp, so the web app and API processes need not share a clock.
+HEADER = 'X-Request-Budget-Ms'
+
+# Monotonic time by which the current request must be answered (None: unbounded)
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised at a step boundary once the request's budget is spent"""
+
+
+def start(seconds):
+    """Give the current context a fresh budget of ``seconds`` (None: unbounded)"""
+    _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+
+@contextmanager
+def until(deadline):
+    """Run the block with the absolute monotonic ``deadline`` (None: unbounded)"""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def budget(seconds):
+    """Run the block with at most ``seconds`` more; never extends an outer budget"""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    with until(deadline if current is None else min(deadline, current)):
+        yield
+
+
+def expires_at():
+    return _deadline.get()
+
+
+def remaining():
+    """Seconds left in the current budget, or None if the work is unbounded"""
+    deadline = _deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def check(stage):
+    """Stop stale work: raise DeadlineExceeded if the budget ran out before ``stage``"""
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() >= deadline:
+        metrics.inc("wearwiz_deadline_exceeded_total", stage=stage)
+        raise DeadlineExceeded(f"Request budget exhausted before {stage}")
+
+
+def to_header():
+    """The remaining budget as a HEADER value, or None if unbounded"""
+    left = remaining()
+    return None if left is None else str(int(left * 1000))
+
+
+def from_header(value):
+    """Seconds of budget from a HEADER value; None if absent or malformed"""
+    try:
+        return max(0.0, float(value) / 1000)
+    except (TypeError, ValueError):
+        return None
+
+
+metrics.describe("wearwiz_deadline_exceeded_total", "Work abandoned because its request budget ran out, by stage")
+metrics.describe("wearwiz_degraded_responses_total", "Recommendations served in degraded form, by reason")
@@ -0,0 +1,65 @@
+import numpy as np
+
+# Storage dtype -> (numpy dtype, file suffix). int8 rows carry a float32 scale each.
+DTYPES = {
+    'float32': (np.float32, 'f32'),
+    'float16': (np.float16, 'f16'),
+    'int8': (np.int8, 'i8'),
+}
+
+
+def _check_dtype(dtype):
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown embedding dtype '{dtype}', expected one of {sorted(DTYPES)}")
+
+
+def storage_dtype(dtype):
+    """Numpy dtype used on disk for the given storage dtype name"""
+    _check_dtype(dtype)
+    return DTYPES[dtype][0]
+
+
+def file_suffix(dtype):
+    _check_dtype(dtype)
+    return DTYPES[dtype][1]
+
+
+def bytes_per_vector(dtype, dim):
+    """On-disk / in-memory footprint of one stored vector, including its scale"""
+    size = np.dtype(storage_dtype(dtype)).itemsize * dim
+    return size + (4 if dtype == 'int8' else 0)
+
+
+def encode(vectors, dtype):
+    """Convert float vectors to storage codes.
+
+    Returns ``(codes, scales)``. ``scales`` is a float32 array with one entry
+    per row for symmetric int8 quantization (``x ~= codes * scale``) and None
+    for the float dtypes.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+    return vectors.astype(storage_dtype(dtype)), None
+
+
+def decode(codes, scales=None):
+    """Convert storage codes back to float32 vectors"""
+    vectors = np.asarray(codes).astype(np.float32)
+    if scales is not None:
+        vectors *= np.asarray(scales, dtype=np.float32)[:, None]
+    return vectors
+
+
+def dot(queries, codes, scales=None):
+    """Similarity of float32 ``queries`` against stored rows without decoding them"""
+    queries = np.asarray(queries, dtype=np.float32)
+    if codes.dtype == np.int8:
+        return (queries @ codes.T.astype(np.float32)) * np.asarray(scales, dtype=np.float32)[None, :]
+    return queries @ codes.T.astype(np.float32, copy=False)
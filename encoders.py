@@ -0,0 +1,93 @@
+import os
+import json
+import numpy as np
+from PIL import Image
+
+# Files written by tools/export_onnx.py
+ONNX_FILES = {
+    'onnx': ('image.onnx', 'text.onnx'),
+    'onnx-int8': ('image.int8.onnx', 'text.int8.onnx'),
+}
+
+
+def _load_images(images):
+    return [image if isinstance(image, Image.Image) else Image.open(image) for image in images]
+
+
+class TorchEncoder:
+    """FashionCLIP image and text towers in PyTorch (fp32)"""
+
+    def __init__(self, model_name):
+        from fashion_clip.fashion_clip import FashionCLIP
+        self.model_name = model_name
+        self.fclip = FashionCLIP(model_name)
+
+    def encode_images(self, images, batch_size):
+        return self.fclip.encode_images(images, batch_size=batch_size)
+
+    def encode_text(self, texts, batch_size):
+        return self.fclip.encode_text(texts, batch_size=batch_size)
+
+
+class OnnxEncoder:
+    """FashionCLIP towers exported to ONNX and run with ONNX Runtime on CPU.
+
+    Needs neither torch nor fashion_clip at runtime, which keeps each API
+    worker's resident memory down; the ``onnx-int8`` variant uses dynamically
+    quantized weights for faster matmuls on CPU. Preprocessing uses the
+    CLIPProcessor saved next to the exported graphs, so inputs match the
+    torch path exactly.
+    """
+
+    def __init__(self, model_dir, variant='onnx', threads=None):
+        import onnxruntime
+        from transformers import CLIPProcessor
+
+        image_file, text_file = ONNX_FILES[variant]
+        with open(os.path.join(model_dir, 'export.json')) as f:
+            self.model_name = json.load(f)['model']
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        providers = ['CPUExecutionProvider']
+        self.image_session = onnxruntime.InferenceSession(os.path.join(model_dir, image_file), options,
+                                                          providers=providers)
+        self.text_session = onnxruntime.InferenceSession(os.path.join(model_dir, text_file), options,
+                                                         providers=providers)
+        self.processor = CLIPProcessor.from_pretrained(model_dir)
+
+    def encode_images(self, images, batch_size):
+        images = _load_images(images)
+        embeddings = []
+        for start in range(0, len(images), batch_size):
+            batch = [image.convert('RGB') for image in images[start:start + batch_size]]
+            pixel_values = self.processor(images=batch, return_tensors='np')['pixel_values']
+            embeddings.append(self.image_session.run(None, {'pixel_values': pixel_values.astype(np.float32)})[0])
+        return np.concatenate(embeddings)
+
+    def encode_text(self, texts, batch_size):
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.processor(text=texts[start:start + batch_size], return_tensors='np',
+                                    max_length=77, padding='max_length', truncation=True)
+            embeddings.append(self.text_session.run(None, {
+                'input_ids': inputs['input_ids'].astype(np.int64),
+                'attention_mask': inputs['attention_mask'].astype(np.int64),
+            })[0])
+        return np.concatenate(embeddings)
+
+
+ENCODERS = ('torch', 'onnx', 'onnx-int8')
+
+
+def create_encoder(name, model_name, onnx_dir=None, threads=None):
+    """Instantiate the embedding encoder selected by configuration"""
+    if name == 'torch':
+        return TorchEncoder(model_name)
+    if name in ONNX_FILES:
+        encoder = OnnxEncoder(onnx_dir, variant=name, threads=threads)
+        if encoder.model_name != model_name:
+            raise ValueError(f"ONNX export in {onnx_dir} is of '{encoder.model_name}', not '{model_name}'; "
+                             f"re-run tools/export_onnx.py")
+        return encoder
+    raise ValueError(f"Unknown encoder '{name}', expected one of {list(ENCODERS)}")
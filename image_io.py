@@ -0,0 +1,116 @@
+import io
+import os
+import base64
+import hashlib
+import tempfile
+from PIL import Image, ImageFile
+
+CHUNK_SIZE = 1024 * 1024
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+# Largest accepted upload; the stream is abandoned as soon as it goes past this
+MAX_UPLOAD_BYTES = int(float(os.environ.get("WEARWIZ_MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload is bigger than the allowed size"""
+
+
+def save_upload(stream, directory, fallback_ext, chunk_size=CHUNK_SIZE, max_bytes=MAX_UPLOAD_BYTES):
+    """Stream an uploaded file into ``directory`` under a content-addressed name.
+
+    The SHA-256 and the image header (dimensions, format) are computed in the
+    same pass as the write, so the file is never re-read. Identical content
+    always maps to the same name, which makes the old exists-probe loop for
+    unique names unnecessary. Returns a dict with filename, content_hash,
+    size, width, height, format and whether the file already existed.
+    Raises UploadTooLarge past ``max_bytes`` and ValueError for non-images.
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    parser = ImageFile.Parser()
+    header = None
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(f"Uploaded file is larger than {max_bytes // (1024 * 1024)} MB")
+                if header is None:
+                    parser.feed(chunk)
+                    if parser.image is not None:
+                        header = parser.image.size, parser.image.format
+        if header is None:
+            raise ValueError("Uploaded file is not a readable image")
+
+        (width, height), image_format = header
+        item_hash = digest.hexdigest()
+        filename = f"{item_hash[:20]}{FORMAT_EXTENSIONS.get(image_format, fallback_ext)}"
+        final_path = os.path.join(directory, filename)
+        duplicate = os.path.exists(final_path)
+        # mkstemp creates the file owner-only; uploads are served as static files
+        os.chmod(tmp_path, 0o644)
+        # Same name means same bytes, so replacing an existing file is harmless
+        os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {
+        'filename': filename,
+        'content_hash': item_hash,
+        'size': size,
+        'width': width,
+        'height': height,
+        'format': image_format,
+        'duplicate': duplicate,
+    }
+
+
+class ImageInput:
+    """An image read from disk at most once and shared by every ingest step.
+
+    The vision calls, the content hash and the FashionCLIP embedding all
+    work from the same bytes instead of reopening the file each time.
+    """
+
+    def __init__(self, path, data=None):
+        self.path = path
+        self._data = data
+        self._base64 = None
+        self._hash = None
+        self._image = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            with open(self.path, 'rb') as f:
+                self._data = f.read()
+        return self._data
+
+    @property
+    def base64(self):
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode('utf-8')
+        return self._base64
+
+    @property
+    def content_hash(self):
+        if self._hash is None:
+            self._hash = hashlib.sha256(self.data).hexdigest()
+        return self._hash
+
+    def pil(self):
+        if self._image is None:
+            self._image = Image.open(io.BytesIO(self.data))
+            self._image.load()
+        return self._image
+
+
+def as_image_input(image):
+    """Accept either a path or an ImageInput"""
+    return image if isinstance(image, ImageInput) else ImageInput(image)
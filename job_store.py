@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import sqlite3
+from sqlite_store import SQLiteStore
+
+# Background job state shared by every API worker process on the host
+JOB_DB_PATH = os.environ.get("WEARWIZ_JOB_DB", "./jobs.db")
+# Finished jobs are kept this long (seconds) so late status polls still find them
+JOB_RETENTION = float(os.environ.get("WEARWIZ_JOB_RETENTION", "86400"))
+
+QUEUED = 'queued'
+RUNNING = 'processing'
+COMPLETED = 'completed'
+ERROR = 'error'
+ACTIVE = (QUEUED, RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    username TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    result TEXT,
+    error TEXT,
+    pid INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_updated ON jobs (status, updated_at);
+"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore(SQLiteStore):
+    """Job status, progress and results in SQLite, safe across worker processes.
+
+    Any worker can answer a status poll for a job another worker started, so
+    uvicorn can run with ``--workers N`` without sticky routing. Each thread
+    uses its own connection; WAL mode lets readers proceed during writes.
+    A job whose worker process died is reported as failed rather than
+    running forever.
+    """
+
+    SCHEMA = _SCHEMA
+    ROW_FACTORY = sqlite3.Row
+
+    def __init__(self, path=JOB_DB_PATH, retention=JOB_RETENTION):
+        self.retention = retention
+        super().__init__(path)
+
+    def create(self, job_id, kind, username=None):
+        """Register a queued job, replacing any earlier job with the same ID"""
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, kind, username, status, pid, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (str(job_id), kind, username, QUEUED, os.getpid(), now, now)
+        )
+        connection.execute("DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated_at < ?",
+                           (*ACTIVE, now - self.retention))
+
+    def update(self, job_id, status=None, stage=None, result=None, error=None):
+        fields = {'updated_at': time.time(), 'pid': os.getpid()}
+        if status is not None:
+            fields['status'] = status
+        if stage is not None:
+            fields['stage'] = stage
+        if result is not None:
+            fields['result'] = json.dumps(result)
+        if error is not None:
+            fields['error'] = error
+        self._connection().execute(
+            f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE job_id = ?",
+            (*fields.values(), str(job_id))
+        )
+
+    def get(self, job_id):
+        """The job as a dict, or None if it is unknown or has been pruned"""
+        row = self._connection().execute("SELECT * FROM jobs WHERE job_id = ?", (str(job_id),)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        if job['status'] in ACTIVE and not _pid_alive(job['pid']):
+            job.update(status=ERROR, error=f"worker {job['pid']} exited before the job finished")
+        return job
+
+    def count(self, *statuses):
+        statuses = statuses or ACTIVE
+        return self._connection().execute(
+            f"SELECT COUNT(*) FROM jobs WHERE status IN ({', '.join('?' * len(statuses))})", statuses
+        ).fetchone()[0]
@@ -0,0 +1,78 @@
+import threading
+import numpy as np
+
+# Garment prompts per category; an image's category is the category of its
+# best-matching garment, which is more reliable than one prompt per category.
+GARMENTS = {
+    'top': ['t-shirt', 'shirt', 'blouse', 'polo shirt', 'sweater', 'hoodie', 'tank top', 'crop top'],
+    'bottom': ['jeans', 'trousers', 'chinos', 'shorts', 'skirt', 'leggings', 'joggers'],
+    'outerwear': ['jacket', 'coat', 'blazer', 'cardigan', 'parka', 'vest'],
+    'full-body': ['dress', 'jumpsuit', 'romper', 'overalls', 'suit'],
+}
+COLORS = ['black', 'white', 'grey', 'navy', 'blue', 'light blue', 'red', 'burgundy', 'pink',
+          'green', 'olive', 'yellow', 'orange', 'beige', 'brown', 'purple']
+PATTERNS = ['solid', 'striped', 'checked', 'plaid', 'floral', 'polka dot', 'graphic print',
+            'camouflage', 'denim wash']
+
+# FashionCLIP logit scale, used to turn cosine similarities into probabilities
+LOGIT_SCALE = 100.0
+
+
+def _softmax(scores):
+    scores = scores * LOGIT_SCALE
+    scores = np.exp(scores - scores.max())
+    return scores / scores.sum()
+
+
+class ZeroShotTagger:
+    """Tags apparel images from their FashionCLIP embedding alone.
+
+    Prompt embeddings are encoded once, on first use; tagging an image is
+    then a few dot products against the image embedding that ingest computes
+    anyway, so a local ingest costs a single image forward pass.
+    """
+
+    def __init__(self, fclip):
+        self.fclip = fclip
+        self._prompts = None
+        self._lock = threading.Lock()
+
+    def _encode(self, prompts):
+        embeddings = np.asarray(self.fclip.encode_text(prompts, batch_size=len(prompts)))
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def _prompt_embeddings(self):
+        with self._lock:
+            if self._prompts is None:
+                garments = [(category, garment) for category, names in GARMENTS.items() for garment in names]
+                self._prompts = {
+                    'garments': garments,
+                    'garment': self._encode([f"a photo of a {garment}" for _, garment in garments]),
+                    'color': self._encode([f"a photo of a {color} piece of clothing" for color in COLORS]),
+                    'pattern': self._encode([f"a photo of a {pattern} piece of clothing" for pattern in PATTERNS]),
+                }
+            return self._prompts
+
+    def tag(self, image_embedding):
+        """apparel_type, title, description and confidence for one normalized embedding"""
+        prompts = self._prompt_embeddings()
+        embedding = np.asarray(image_embedding, dtype=np.float32)
+
+        garment_probs = _softmax(prompts['garment'] @ embedding)
+        category_probs = {}
+        for (category, _), prob in zip(prompts['garments'], garment_probs):
+            category_probs[category] = category_probs.get(category, 0.0) + float(prob)
+        apparel_type = max(category_probs, key=category_probs.get)
+        # Best garment within the chosen category
+        garment = max((entry for entry in zip(prompts['garments'], garment_probs) if entry[0][0] == apparel_type),
+                      key=lambda entry: entry[1])[0][1]
+        color = COLORS[int(np.argmax(prompts['color'] @ embedding))]
+        pattern = PATTERNS[int(np.argmax(prompts['pattern'] @ embedding))]
+
+        words = ' '.join([color] + ([] if pattern == 'solid' else [pattern]) + [garment])
+        return {
+            'apparel_type': apparel_type,
+            'title': words.title(),
+            'description': f"{'An' if words[0] in 'aeiou' else 'A'} {words}",
+            'confidence': round(category_probs[apparel_type], 3),
+        }
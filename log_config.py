@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import itertools
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+
+# Correlation IDs attached to every record logged while they are set
+request_id_var = contextvars.ContextVar("request_id", default=None)
+job_id_var = contextvars.ContextVar("job_id", default=None)
+
+_listener = None
+_sample_counters = {}
+
+
+@contextmanager
+def correlation(request_id=None, job_id=None):
+    """Tag log records emitted inside the block with request/job IDs"""
+    tokens = []
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    if job_id is not None:
+        tokens.append((job_id_var, job_id_var.set(job_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class CorrelationFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.job_id = job_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in N records logged with ``extra={'sample': key}``.
+
+    Rates come from WEARWIZ_LOG_SAMPLE ("key=N,key=N"); keys without an
+    explicit rate use WEARWIZ_LOG_SAMPLE_DEFAULT (100). Records without a
+    sample key always pass.
+    """
+
+    def __init__(self, rates, default_rate):
+        super().__init__()
+        self.rates = rates
+        self.default_rate = default_rate
+
+    def filter(self, record):
+        key = getattr(record, 'sample', None)
+        if key is None:
+            return True
+        rate = self.rates.get(key, self.default_rate)
+        counter = _sample_counters.setdefault(key, itertools.count())
+        return next(counter) % rate == 0
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if record.request_id:
+            entry['request_id'] = record.request_id
+        if record.job_id:
+            entry['job_id'] = record.job_id
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s%(ids)s %(message)s')
+
+    def format(self, record):
+        ids = ''.join(f" {name}={value}" for name, value in
+                      (('request', record.request_id), ('job', record.job_id)) if value)
+        record.ids = ids
+        return super().format(record)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records unformatted so message formatting happens on the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+
+def _parse_pairs(spec):
+    pairs = {}
+    for part in filter(None, (chunk.strip() for chunk in spec.split(','))):
+        key, _, value = part.partition('=')
+        pairs[key.strip()] = value.strip()
+    return pairs
+
+
+def configure_logging(service):
+    """Route all logging through a background queue listener.
+
+    Callers only enqueue records and formatting happens on the listener
+    thread, so slow stdout never blocks request or ingest threads.
+    Configured from the environment:
+
+    WEARWIZ_LOG_LEVEL     root level (default INFO)
+    WEARWIZ_LOG_LEVELS    per-module overrides, e.g. "ai_handler=DEBUG,vector_store=WARNING"
+    WEARWIZ_LOG_FORMAT    "text" (default) or "json"
+    WEARWIZ_LOG_SAMPLE    sampling rates for high-frequency events, e.g. "owner_scan=100"
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.environ.get("WEARWIZ_LOG_FORMAT", "text") == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationFilter())
+    sample_rates = {key: max(1, int(rate)) for key, rate in
+                    _parse_pairs(os.environ.get("WEARWIZ_LOG_SAMPLE", "")).items()}
+    queue_handler.addFilter(SamplingFilter(sample_rates,
+                                           max(1, int(os.environ.get("WEARWIZ_LOG_SAMPLE_DEFAULT", "100")))))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(os.environ.get("WEARWIZ_LOG_LEVEL", "INFO").upper())
+    for module, level in _parse_pairs(os.environ.get("WEARWIZ_LOG_LEVELS", "")).items():
+        logging.getLogger(module).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    logging.getLogger(service).debug("Logging configured for %s", service)
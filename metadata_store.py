@@ -0,0 +1,106 @@
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+from vector_store import FileLock
+
+METADATA_DIR = 'user_metadata'
+ID_COUNTER_FILE = '.next_image_id'
+
+
+def metadata_path(username):
+    os.makedirs(METADATA_DIR, exist_ok=True)
+    return os.path.join(METADATA_DIR, f'{username}_metadata.json')
+
+
+def load(username):
+    """A user's wardrobe items; empty if the file is missing or unreadable"""
+    try:
+        with open(metadata_path(username), 'r') as f:
+            data = json.load(f)
+            return data if isinstance(data, list) else []
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def _write_atomic(path, data, indent=2):
+    """Write JSON via a temp file and rename, so readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=indent)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save(username, data):
+    """Replace a user's items. Prefer ``update`` for read-modify-write changes."""
+    path = metadata_path(username)
+    with FileLock(path + '.lock'):
+        _write_atomic(path, data)
+
+
+@contextmanager
+def update(username):
+    """Read-modify-write a user's items under their lock.
+
+    Yields the current list; it is written back atomically when the block
+    exits without an exception. Every writer in the web app, the API workers
+    and the tools goes through this lock, so concurrent changes to different
+    items of the same user are never lost.
+    """
+    path = metadata_path(username)
+    with FileLock(path + '.lock'):
+        items = load(username)
+        yield items
+        _write_atomic(path, items)
+
+
+def update_item(username, image_id, **fields):
+    """Set fields on one item; returns False if the item no longer exists"""
+    with update(username) as items:
+        for item in items:
+            if str(item.get('image_id')) == str(image_id):
+                item.update(fields)
+                return True
+    return False
+
+
+def _max_existing_id():
+    highest = 0
+    if os.path.exists(METADATA_DIR):
+        for name in os.listdir(METADATA_DIR):
+            if not name.endswith('_metadata.json'):
+                continue
+            try:
+                with open(os.path.join(METADATA_DIR, name), 'r') as f:
+                    items = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            for item in items if isinstance(items, list) else []:
+                if str(item.get('image_id', '')).isdigit():
+                    highest = max(highest, int(item['image_id']))
+    return highest
+
+
+def allocate_image_id():
+    """Next globally unique image ID, safe across threads, processes and deletions.
+
+    IDs come from a counter file under a file lock and never repeat. The
+    counter starts above the highest ID already in use, so it can be added
+    to an existing deployment.
+    """
+    os.makedirs(METADATA_DIR, exist_ok=True)
+    counter_path = os.path.join(METADATA_DIR, ID_COUNTER_FILE)
+    with FileLock(counter_path + '.lock'):
+        try:
+            with open(counter_path, 'r') as f:
+                next_id = int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            next_id = _max_existing_id() + 1
+        _write_atomic(counter_path, next_id + 1)
+    return str(next_id)
@@ -0,0 +1,179 @@
+import os
+import time
+import threading
+from contextlib import nullcontext
+
+# Metrics are collected only when WEARWIZ_METRICS=1; otherwise every helper
+# below returns immediately so instrumented hot paths cost a function call.
+METRICS_ENABLED = os.environ.get("WEARWIZ_METRICS", "0") == "1"
+
+# Histogram buckets in seconds, spanning fast vector queries to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_help = {}
+_NOOP = nullcontext()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name, text):
+    """Register the HELP text shown for a metric family"""
+    _help[name] = text
+
+
+def inc(name, value=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def add_gauge(name, delta, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def observe(name, value, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(DEFAULT_BUCKETS), 0, 0.0]
+        buckets = histogram[0]
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                buckets[i] += 1
+        histogram[1] += 1
+        histogram[2] += value
+
+
+class _Span:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            inc(self.name.replace('_seconds', '_errors_total'), **self.labels)
+        return False
+
+
+def timed(name, **labels):
+    """Context manager recording the block's duration in histogram ``name``"""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Span(name, labels)
+
+
+def stage(stage_name):
+    """Time one pipeline stage (vision call, embedding, vector query, ...)"""
+    return timed("wearwiz_stage_seconds", stage=stage_name)
+
+
+def cache_lookup(cache, hit):
+    """Count a cache hit or miss; hit rate = hits / (hits + misses)"""
+    inc("wearwiz_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render():
+    """Prometheus text exposition of everything recorded in this process"""
+    lines = []
+    with _lock:
+        families = {}
+        for kind, store in (('counter', _counters), ('gauge', _gauges), ('histogram', _histograms)):
+            for (name, labels), value in store.items():
+                families.setdefault((name, kind), []).append((labels, value))
+
+    for (name, kind), samples in sorted(families.items()):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(samples):
+            if kind != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            buckets, count, total = value
+            for bound, bucket_count in zip(DEFAULT_BUCKETS, buckets):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+class InstrumentedExecutor:
+    """Wraps a ThreadPoolExecutor and tracks queue depth and busy workers"""
+
+    def __init__(self, executor, name):
+        self.executor = executor
+        self.name = name
+        set_gauge("wearwiz_executor_workers", executor._max_workers, executor=name)
+
+    def __getattr__(self, attr):
+        return getattr(self.executor, attr)
+
+    def submit(self, fn, *args, **kwargs):
+        if not METRICS_ENABLED:
+            return self.executor.submit(fn, *args, **kwargs)
+
+        add_gauge("wearwiz_executor_queued", 1, executor=self.name)
+
+        def run():
+            add_gauge("wearwiz_executor_queued", -1, executor=self.name)
+            add_gauge("wearwiz_executor_busy", 1, executor=self.name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add_gauge("wearwiz_executor_busy", -1, executor=self.name)
+
+        return self.executor.submit(run)
+
+
+describe("wearwiz_stage_seconds", "Duration of ingest and recommendation pipeline stages")
+describe("wearwiz_groq_request_seconds", "Latency of Groq chat completion calls")
+describe("wearwiz_groq_request_errors_total", "Groq chat completion calls that raised")
+describe("wearwiz_http_request_seconds", "HTTP request latency by service and route")
+describe("wearwiz_cache_requests_total", "Cache lookups by cache and result")
+describe("wearwiz_executor_workers", "Configured worker threads per executor")
+describe("wearwiz_executor_queued", "Tasks waiting for a worker thread")
+describe("wearwiz_executor_busy", "Worker threads currently running a task")
+describe("wearwiz_processing_tasks", "Image processing jobs queued or running on this host")
+describe("wearwiz_ingest_total", "Finished image ingest jobs by result")
+describe("wearwiz_ingest_duplicates_total", "Uploads found to be near-duplicates of an existing item, by action")
@@ -0,0 +1,151 @@
+import os
+import math
+import time
+from sqlite_store import SQLiteStore
+
+# Which items were recommended together, shared by every worker process on the host
+PAIRING_DB_PATH = os.environ.get("WEARWIZ_PAIRING_DB", "./pairings.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pairings (
+    username TEXT NOT NULL,
+    item_a TEXT NOT NULL,
+    item_b TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (username, item_a, item_b)
+);
+CREATE INDEX IF NOT EXISTS pairings_item_b ON pairings (username, item_b);
+CREATE INDEX IF NOT EXISTS pairings_count ON pairings (username, count DESC, last_used DESC);
+CREATE TABLE IF NOT EXISTS seeded_users (
+    username TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS versions (
+    username TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+_BUMP = ("INSERT INTO versions (username, version) VALUES (?, 1) "
+         "ON CONFLICT (username) DO UPDATE SET version = version + 1")
+
+
+def _edge(first, second):
+    """Undirected edges are stored once, smaller ID first"""
+    first, second = str(first), str(second)
+    return (first, second) if first <= second else (second, first)
+
+
+def boost(stats, weight, half_life_days, now=None):
+    """Ranking bonus for a candidate worn ``stats = (count, last_used)`` with the
+    base item: ``weight * log(1 + count)``, halved every ``half_life_days``
+    since they were last worn together (0 if never)"""
+    if not stats:
+        return 0.0
+    count, last_used = stats
+    age_days = max(0.0, (time.time() if now is None else now) - last_used) / 86400
+    return weight * math.log1p(count) * 0.5 ** (age_days / half_life_days)
+
+
+class PairingGraph(SQLiteStore):
+    """Per-user graph of items worn together, with counts and last-used times.
+
+    Recording a pairing is a single upsert, and looking up an item's partners
+    is an index lookup, so neither touches the wardrobe metadata file. Users
+    from before the graph existed are imported from their items' ``pairs``
+    arrays the first time they are used (see ``seed``).
+    """
+
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path=PAIRING_DB_PATH):
+        self._seeded = set()
+        super().__init__(path)
+
+    def record(self, username, first, second, when=None, count=1):
+        """Count ``count`` more outfits of ``first`` with ``second``"""
+        item_a, item_b = _edge(first, second)
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO pairings (username, item_a, item_b, count, last_used) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (username, item_a, item_b) DO UPDATE SET count = count + excluded.count, "
+                "last_used = MAX(last_used, excluded.last_used)",
+                (username, item_a, item_b, count, time.time() if when is None else when)
+            )
+            connection.execute(_BUMP, (username,))
+
+    def version(self, username):
+        """Counter bumped by every change to the user's pairings, for cache keys"""
+        row = self._connection().execute(
+            "SELECT version FROM versions WHERE username = ?", (username,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def partners(self, username, image_id):
+        """``{partner_id: (count, last_used)}`` for every item paired with ``image_id``"""
+        image_id = str(image_id)
+        rows = self._connection().execute(
+            "SELECT item_b, count, last_used FROM pairings WHERE username = ? AND item_a = ? "
+            "UNION ALL "
+            "SELECT item_a, count, last_used FROM pairings WHERE username = ? AND item_b = ?",
+            (username, image_id, username, image_id)
+        )
+        return {partner: (count, last_used) for partner, count, last_used in rows}
+
+    def most_worn(self, username, limit=10):
+        """The user's most frequent combinations as ``(item_a, item_b, count, last_used)``"""
+        return self._connection().execute(
+            "SELECT item_a, item_b, count, last_used FROM pairings WHERE username = ? "
+            "ORDER BY count DESC, last_used DESC LIMIT ?",
+            (username, limit)
+        ).fetchall()
+
+    def edges(self, username):
+        """Every ``(item_a, item_b, count, last_used)`` of the user, read lazily"""
+        return self._connection().execute(
+            "SELECT item_a, item_b, count, last_used FROM pairings WHERE username = ?", (username,)
+        )
+
+    def paired_items(self, username):
+        """IDs of the user's items that have been paired at least once"""
+        rows = self._connection().execute(
+            "SELECT item_a FROM pairings WHERE username = ? UNION SELECT item_b FROM pairings WHERE username = ?",
+            (username, username)
+        )
+        return {row[0] for row in rows}
+
+    def remove_items(self, username, image_ids):
+        """Forget every pairing involving ``image_ids`` (e.g. once they are deleted)"""
+        image_ids = [str(image_id) for image_id in image_ids]
+        with self._transaction() as connection:
+            for start in range(0, len(image_ids), 500):
+                batch = image_ids[start:start + 500]
+                placeholders = ', '.join('?' * len(batch))
+                connection.execute(
+                    f"DELETE FROM pairings WHERE username = ? AND (item_a IN ({placeholders}) "
+                    f"OR item_b IN ({placeholders}))",
+                    (username, *batch, *batch)
+                )
+            connection.execute(_BUMP, (username,))
+
+    def seeded(self, username):
+        if username in self._seeded:
+            return True
+        row = self._connection().execute("SELECT 1 FROM seeded_users WHERE username = ?", (username,)).fetchone()
+        if row:
+            self._seeded.add(username)
+        return row is not None
+
+    def seed(self, username, items, when):
+        """Import pairings from items' legacy ``pairs`` arrays, once per user"""
+        edges = {_edge(item['image_id'], partner) for item in items for partner in item.get('pairs', [])}
+        with self._transaction() as connection:
+            if not connection.execute("SELECT 1 FROM seeded_users WHERE username = ?", (username,)).fetchone():
+                connection.executemany(
+                    "INSERT OR IGNORE INTO pairings (username, item_a, item_b, count, last_used) "
+                    "VALUES (?, ?, ?, 1, ?)",
+                    [(username, item_a, item_b, when) for item_a, item_b in edges]
+                )
+                connection.execute("INSERT INTO seeded_users (username) VALUES (?)", (username,))
+                connection.execute(_BUMP, (username,))
+        self._seeded.add(username)
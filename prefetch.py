@@ -0,0 +1,139 @@
+import time
+import threading
+from collections import deque
+import metrics
+import rate_limit
+
+# Longest interval (seconds) between sweeps for expired entries and idle users
+EVICT_INTERVAL = 60
+
+
+class RecommendationPrefetcher:
+    """Computes upcoming recommendations ahead of time, per user.
+
+    ``fill(username)`` keeps up to ``depth`` random outfits in flight or ready
+    for the user, plus one apparel-based suggestion for each of their
+    ``recent_items`` most recently added items. ``take_*`` hands out a
+    finished prefetched future or None; one still running is left alone, as
+    waiting on it would hold an interactive request at prefetch priority.
+    Entries older than ``ttl`` seconds are dropped so new uploads show up in
+    time, and users with nothing fresh left are forgotten.
+
+    Jobs run on their own executor so speculative work never queues ahead
+    of requests a user is actually waiting for, and their Groq calls are
+    admitted at the lowest priority. The generator callables are called with
+    ``record_pairing=False``; pairings are saved when served.
+    """
+
+    def __init__(self, executor, random_fn, apparel_fn, load_items, depth=2, recent_items=2, ttl=600):
+        self.executor = executor
+        self.random_fn = random_fn
+        self.apparel_fn = apparel_fn
+        self.load_items = load_items
+        self.depth = depth
+        self.recent_items = recent_items
+        self.ttl = ttl
+        self._random = {}
+        self._apparel = {}
+        self._lock = threading.Lock()
+        self._evicted_at = time.monotonic()
+
+    def _submit(self, fn, username, *args):
+        def run():
+            with rate_limit.scope(user=username, priority=rate_limit.PREFETCH):
+                return fn(username, *args, record_pairing=False)
+        return self.executor.submit(run)
+
+    @property
+    def enabled(self):
+        return self.depth > 0 or self.recent_items > 0
+
+    def _fresh(self, created):
+        return time.monotonic() - created < self.ttl
+
+    def _evict(self, now):
+        """Drop expired entries, and users left with none; at most once per EVICT_INTERVAL"""
+        if now - self._evicted_at < min(self.ttl, EVICT_INTERVAL):
+            return
+        self._evicted_at = now
+        for username in list(self._random):
+            queue = self._random[username]
+            fresh = deque(entry for entry in queue if self._fresh(entry[1]))
+            if fresh:
+                self._random[username] = fresh
+            else:
+                del self._random[username]
+        for key in [key for key, entry in self._apparel.items() if not self._fresh(entry[1])]:
+            del self._apparel[key]
+
+    def fill(self, username):
+        """Top up the user's queue and prefetch suggestions for their newest items.
+
+        Never blocks: reading the user's items happens on the executor.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            queue = self._random.setdefault(username, deque())
+            while queue and not self._fresh(queue[0][1]):
+                queue.popleft()
+            for _ in range(self.depth - len(queue)):
+                queue.append((self._submit(self.random_fn, username), now))
+
+        if self.recent_items > 0:
+            self.executor.submit(self._fill_apparel, username)
+
+    def _fill_apparel(self, username):
+        now = time.monotonic()
+        completed = [item for item in self.load_items(username)
+                     if item.get('processing_status', 'completed') == 'completed']
+        with self._lock:
+            for item in completed[-self.recent_items:]:
+                key = (username, str(item['image_id']))
+                entry = self._apparel.get(key)
+                if entry and self._fresh(entry[1]) and entry[2] == (item['description'], item['apparel_type']):
+                    continue
+                future = self._submit(self.apparel_fn, username, item['image_id'],
+                                      item['description'], item['apparel_type'])
+                self._apparel[key] = (future, now, (item['description'], item['apparel_type']))
+
+    def take_random(self, username):
+        """A finished random outfit for the user, or None; running ones stay queued"""
+        with self._lock:
+            queue = self._random.get(username)
+            if queue:
+                kept = deque()
+                found = None
+                while queue:
+                    future, created = queue.popleft()
+                    if not self._fresh(created) or (future.done() and future.exception()):
+                        continue
+                    if found is None and future.done():
+                        found = future
+                    else:
+                        kept.append((future, created))
+                queue.extend(kept)
+                if found is not None:
+                    metrics.cache_lookup("prefetch_random", True)
+                    return found
+        metrics.cache_lookup("prefetch_random", False)
+        return None
+
+    def take_apparel(self, username, image_id, description, apparel_type):
+        """The finished suggestion for this item, or None; a running one stays in place"""
+        key = (username, str(image_id))
+        with self._lock:
+            entry = self._apparel.get(key)
+            if entry:
+                future, created, inputs = entry
+                if not self._fresh(created) or inputs != (description, apparel_type) \
+                        or (future.done() and future.exception()):
+                    del self._apparel[key]
+                elif future.done():
+                    del self._apparel[key]
+                    metrics.cache_lookup("prefetch_apparel", True)
+                    return future
+        metrics.cache_lookup("prefetch_apparel", False)
+        return None
@@ -0,0 +1,215 @@
+import time
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import metrics
+from sqlite_store import SQLiteStore
+
+# Admission priorities, most urgent first. Interactive recommendations are
+# served before background ingest, and speculative prefetches come last.
+INTERACTIVE = 0
+INGEST = 1
+PREFETCH = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", INGEST: "ingest", PREFETCH: "prefetch"}
+
+# (username, priority) of the work running in this context
+_scope = contextvars.ContextVar("groq_scope", default=(None, INTERACTIVE))
+
+
+class AdmissionTimeout(Exception):
+    """Raised when a call cannot be admitted before its deadline"""
+
+
+@contextmanager
+def scope(user=None, priority=None):
+    """Attribute rate-limited calls made inside the block to ``user`` at ``priority``"""
+    current_user, current_priority = _scope.get()
+    token = _scope.set((current_user if user is None else user,
+                        current_priority if priority is None else priority))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope():
+    return _scope.get()
+
+
+def retry_after(error):
+    """Seconds the provider asked us to wait, from a 429 response's headers"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    for header in ('retry-after', 'x-ratelimit-reset-requests'):
+        value = headers.get(header)
+        if not value:
+            continue
+        try:
+            return float(value.rstrip('s'))
+        except ValueError:
+            continue
+    return None
+
+
+class SharedTokens(SQLiteStore):
+    """Token count and provider pause of a bucket, kept in SQLite so every
+    process using the same file draws from one quota.
+
+    Times are wall-clock, since monotonic clocks are not comparable across
+    processes.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (
+        name TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL,
+        paused_until REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path, name='groq'):
+        self.name = name
+        super().__init__(path)
+
+    def _update(self, change):
+        """Apply ``change(tokens, updated, paused_until, now)`` -> (state, result) in one transaction"""
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT tokens, updated, paused_until FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            state, result = change(*(row or (None, now, 0.0)), now)
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated, paused_until) VALUES (?, ?, ?, ?)",
+                (self.name, *state)
+            )
+        return result
+
+    def take(self, rate, burst):
+        """Take a token if one is available: 0.0, else seconds until one may be"""
+        def change(tokens, updated, paused_until, now):
+            tokens = burst if tokens is None else tokens
+            if now > updated:
+                tokens = min(burst, tokens + (now - updated) * rate)
+                updated = now
+            if now < paused_until:
+                wait = paused_until - now
+            elif tokens >= 1:
+                tokens, wait = tokens - 1, 0.0
+            else:
+                wait = (1 - tokens) / rate
+            return (tokens, updated, paused_until), wait
+        return self._update(change)
+
+    def pause(self, seconds):
+        def change(tokens, updated, paused_until, now):
+            paused_until = max(paused_until, now + seconds)
+            return (0.0, paused_until, paused_until), None
+        self._update(change)
+
+
+class FairTokenBucket:
+    """Token bucket that admits waiters by priority, then round-robin by user.
+
+    ``rate`` tokens per second refill a bucket holding at most ``burst``.
+    Waiters queue per (priority, user); the head of the most urgent
+    non-empty priority is served from whichever user was served least
+    recently, so one user's bulk upload cannot starve everyone else.
+    With ``shared`` (a SharedTokens) the tokens come from a quota shared
+    with other processes; priorities and fairness still apply per process.
+    """
+
+    def __init__(self, rate, burst, shared=None):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.shared = shared
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._queues = {}
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        if now < self.updated:
+            return
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _take(self, now):
+        """Take a token for the queue head: 0.0, else seconds until one may be"""
+        if self.shared is not None:
+            return self.shared.take(self.rate, self.burst)
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return max(self.updated, now) - now + (1 - self.tokens) / self.rate
+
+    def _head(self):
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _remove(self, priority, user, ticket):
+        users = self._queues[priority]
+        tickets = users[user]
+        tickets.remove(ticket)
+        if tickets:
+            users.move_to_end(user)
+        else:
+            del users[user]
+
+    def acquire(self, user, priority, deadline):
+        """Block until a token is available to this caller or ``deadline`` (monotonic) passes"""
+        if self.rate <= 0:
+            return
+        ticket = object()
+        enqueued = time.monotonic()
+        with self._cond:
+            self._queues.setdefault(priority, OrderedDict()).setdefault(user, deque()).append(ticket)
+            metrics.add_gauge("wearwiz_groq_waiting", 1, priority=PRIORITY_NAMES.get(priority, priority))
+            try:
+                while True:
+                    now = time.monotonic()
+                    is_head = self._head() is ticket
+                    ready_in = self._take(now) if is_head else None
+                    if ready_in == 0:
+                        self._remove(priority, user, ticket)
+                        self._cond.notify_all()
+                        metrics.observe("wearwiz_groq_queue_seconds", now - enqueued,
+                                        priority=PRIORITY_NAMES.get(priority, priority))
+                        return
+                    if now >= deadline:
+                        self._remove(priority, user, ticket)
+                        self._cond.notify_all()
+                        metrics.inc("wearwiz_groq_rejected_total", priority=PRIORITY_NAMES.get(priority, priority))
+                        raise AdmissionTimeout(
+                            f"Groq call for {user or 'anonymous'} not admitted within its deadline"
+                        )
+                    wait = deadline - now if ready_in is None else min(deadline - now, ready_in)
+                    self._cond.wait(max(wait, 0.001))
+            finally:
+                metrics.add_gauge("wearwiz_groq_waiting", -1, priority=PRIORITY_NAMES.get(priority, priority))
+
+    def pause(self, seconds):
+        """Stop admitting anyone for ``seconds``, e.g. after the provider returned 429"""
+        with self._cond:
+            if self.shared is not None:
+                self.shared.pause(seconds)
+            else:
+                self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+                # Refill restarts when the pause ends, so admission resumes at the steady rate, not a burst
+                self.tokens = 0.0
+                self.updated = self.paused_until
+            self._cond.notify_all()
+
+
+metrics.describe("wearwiz_groq_queue_seconds", "Time Groq calls waited for admission by priority")
+metrics.describe("wearwiz_groq_waiting", "Groq calls waiting for admission by priority")
+metrics.describe("wearwiz_groq_rejected_total", "Groq calls rejected after missing their admission deadline")
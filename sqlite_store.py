@@ -0,0 +1,72 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStore:
+    """Base for the stores kept in one SQLite file shared by every worker process on the host.
+
+    Each thread uses its own autocommit connection; WAL mode lets readers
+    proceed during writes, and ``_transaction`` groups statements that must
+    apply together. Subclasses set ``SCHEMA`` (and optionally ``ROW_FACTORY``).
+    """
+
+    SCHEMA = ""
+    ROW_FACTORY = None
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            if self.ROW_FACTORY is not None:
+                connection.row_factory = self.ROW_FACTORY
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction taken up front, so concurrent writers queue instead of deadlocking"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+def import_legacy_json(path, load, what):
+    """Pass the parsed JSON file at ``path`` to ``load``, which returns how many
+    records it imported, then rename the file to ``.imported`` so it is not
+    imported again. Returns the count (0 if there was no file)."""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except json.JSONDecodeError as e:
+        logger.error("Could not import %s: %s", path, e)
+        return 0
+    imported = load(data)
+    try:
+        os.replace(path, path + '.imported')
+    except FileNotFoundError:
+        pass  # another worker finished the import first
+    logger.info("Imported %d %s from %s", imported, what, path)
+    return imported
@@ -0,0 +1,34 @@
+import os
+import sys
+import types
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# What api_service imports from ai_handler; the real module loads FashionCLIP
+AI_HANDLER_NAMES = (
+    'process_in_background', 'generate_outfit_recommendation', 'generate_outfit_recommendation_for_apparel',
+    'generate_outfit_recommendation_based_on_text', 'stream_outfit_recommendation_based_on_text',
+    'save_pairing', 'cached_outfit', 'pairing_summary', 'mark_for_deletion', 'delete_items',
+    'find_similar_items',
+)
+
+
+@pytest.fixture
+def api_service(tmp_path, monkeypatch):
+    """api_service with its stores in ``tmp_path`` and ai_handler replaced by
+    a module of no-op functions, for tests of request handling and scheduling"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("WEARWIZ_JOB_DB", str(tmp_path / "jobs.db"))
+    handler = types.ModuleType('ai_handler')
+    for name in AI_HANDLER_NAMES:
+        setattr(handler, name, lambda *args, **kwargs: None)
+    monkeypatch.setitem(sys.modules, 'ai_handler', handler)
+    monkeypatch.delitem(sys.modules, 'api_service', raising=False)
+    import api_service
+    yield api_service
+    api_service.executor.shutdown(wait=False, cancel_futures=True)
+    api_service.job_executor.shutdown(wait=False, cancel_futures=True)
+    sys.modules.pop('api_service', None)
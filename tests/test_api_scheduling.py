@@ -0,0 +1,38 @@
+import asyncio
+import threading
+import time
+import rate_limit
+
+
+def test_interactive_call_admitted_while_ingest_is_backlogged(api_service):
+    limiter = rate_limit.FairTokenBucket(rate=5, burst=1)
+    release = threading.Event()
+
+    def ingest(*args, on_progress=None):
+        # An ingest job holding its thread while it waits for Groq admission
+        with rate_limit.scope(user='bulk', priority=rate_limit.INGEST):
+            while not release.is_set():
+                limiter.acquire('bulk', rate_limit.INGEST, time.monotonic() + 30)
+                time.sleep(0.05)
+        return True
+
+    for i in range(api_service.JOB_WORKERS * 3):
+        api_service.jobs.create(f"job-{i}", 'ingest')
+        api_service.submit_job(f"job-{i}", ingest)
+
+    def recommend():
+        user, priority = rate_limit.current_scope()
+        limiter.acquire(user, priority, time.monotonic() + 2)
+        return priority
+
+    async def request():
+        start = time.monotonic()
+        priority = await asyncio.wait_for(api_service.run_in_executor(recommend, user='alice'), 3)
+        return priority, time.monotonic() - start
+
+    try:
+        priority, elapsed = asyncio.run(request())
+    finally:
+        release.set()
+    assert priority == rate_limit.INTERACTIVE
+    assert elapsed < 1.5
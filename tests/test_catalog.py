@@ -0,0 +1,66 @@
+import json
+import os
+import sqlite3
+import numpy as np
+from catalog import CatalogIndex
+from vector_store import NumpyBackend
+
+
+def unit(seed, dim=8):
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_membership_is_one_row_per_item(tmp_path):
+    catalog = CatalogIndex(NumpyBackend(str(tmp_path)), str(tmp_path))
+    catalog.add_member('h1', 'alice', 1, 'top')
+    catalog.add_members('alice', {2: ('h2', 'bottom'), 3: ('h1', 'top')})
+    catalog.add_member('h2', 'bob', 7, 'bottom')
+
+    assert catalog.user_items('alice') == {'1': 'h1', '2': 'h2', '3': 'h1'}
+    assert catalog.user_items('alice', 'top') == {'1': 'h1', '3': 'h1'}
+    assert catalog.remove_member('alice', 2) == {'hash': 'h2', 'category': 'bottom'}
+    assert catalog.remove_member('alice', 2) is None
+
+    rows = sqlite3.connect(catalog.members_path).execute("SELECT COUNT(*) FROM members").fetchone()[0]
+    assert rows == 3
+    assert not os.path.exists(os.path.join(str(tmp_path), 'catalog_members.json'))
+
+
+def test_remove_unowned_keeps_hashes_other_users_own(tmp_path):
+    catalog = CatalogIndex(NumpyBackend(str(tmp_path)), str(tmp_path))
+    catalog.add_items(['h1', 'h2'], [unit(1), unit(2)], ['a', 'b'], ['top', 'top'])
+    catalog.add_member('h1', 'alice', 1, 'top')
+    catalog.add_member('h1', 'bob', 2, 'top')
+    catalog.add_member('h2', 'alice', 3, 'top')
+
+    catalog.remove_member('alice', 1)
+    catalog.remove_member('alice', 3)
+    assert catalog.remove_unowned(['h1', 'h2']) == 1
+    assert catalog.get_embedding('h1') is not None
+    assert catalog.get_embedding('h2') is None
+
+
+def test_legacy_json_membership_is_imported_once(tmp_path):
+    legacy = os.path.join(str(tmp_path), 'catalog_members.json')
+    with open(legacy, 'w') as f:
+        json.dump({'users': {'alice': {'1': {'hash': 'h1', 'category': 'top'}}}}, f)
+
+    catalog = CatalogIndex(NumpyBackend(str(tmp_path)), str(tmp_path))
+    assert catalog.user_items('alice') == {'1': 'h1'}
+    assert os.path.exists(legacy + '.imported') and not os.path.exists(legacy)
+
+
+def test_user_query_narrows_through_the_hash_index(tmp_path):
+    catalog = CatalogIndex(NumpyBackend(str(tmp_path)), str(tmp_path))
+    hashes = [f'h{i}' for i in range(20)]
+    catalog.add_items(hashes, [unit(i) for i in range(20)], hashes, ['top'] * 20)
+    catalog.add_members('alice', {1: ('h3', 'top'), 2: ('h11', 'top')})
+
+    hits = catalog.query(unit(11), n_results=5, username='alice', category='top')
+    assert [content_hash for content_hash, _ in hits] == ['h11', 'h3']
+    assert hits[0][1] > 0.99
+
+    collection = catalog.collection
+    assert collection._rows_for('content_hash', {'$in': ['h3', 'h11', 'missing']}) == [3, 11]
+    assert collection.get(where={'content_hash': {'$in': ['h11', 'h3']}}, include=[])['ids'] == ['h3', 'h11']
@@ -0,0 +1,82 @@
+import threading
+import time
+import pytest
+import deadlines
+
+
+def test_unbounded_by_default():
+    assert deadlines.remaining() is None
+    assert deadlines.to_header() is None
+    deadlines.check('anything')
+
+
+def test_budget_counts_down_and_expires():
+    with deadlines.budget(0.05):
+        left = deadlines.remaining()
+        assert 0 < left <= 0.05
+        assert 0 < int(deadlines.to_header()) <= 50
+        deadlines.check('before sleeping')
+        time.sleep(0.06)
+        assert deadlines.remaining() == 0.0
+        with pytest.raises(deadlines.DeadlineExceeded):
+            deadlines.check('after sleeping')
+    assert deadlines.remaining() is None
+
+
+def test_inner_budget_never_extends_outer():
+    with deadlines.budget(0.1):
+        outer = deadlines.expires_at()
+        with deadlines.budget(60):
+            assert deadlines.expires_at() == outer
+        with deadlines.budget(0.01):
+            assert deadlines.expires_at() < outer
+        with deadlines.until(None):
+            assert deadlines.remaining() is None
+
+
+@pytest.mark.parametrize('value, seconds', [
+    ('1500', 1.5),
+    ('0', 0.0),
+    ('-200', 0.0),
+    ('2.5', 0.0025),
+    (None, None),
+    ('', None),
+    ('soon', None),
+])
+def test_from_header(value, seconds):
+    assert deadlines.from_header(value) == seconds
+
+
+def test_tiny_budget_serves_cached_outfit_instead_of_failing(api_service):
+    from fastapi.testclient import TestClient
+
+    release = threading.Event()
+    cached = {"status": "success", "degraded": True, "recommended_item": {"image_id": "3"}}
+
+    def slow_recommendation(username, record_pairing=True):
+        release.wait(5)
+        return {"status": "success"}
+
+    api_service.generate_outfit_recommendation = slow_recommendation
+    api_service.cached_outfit = lambda username, image_id=None: cached
+    try:
+        with TestClient(api_service.app) as client:
+            start = time.monotonic()
+            response = client.post("/generate-recommendation", json={"username": "alice"},
+                                   headers={deadlines.HEADER: "50"})
+            elapsed = time.monotonic() - start
+    finally:
+        release.set()
+    assert response.status_code == 200
+    assert response.json() == cached
+    assert elapsed < 2
+
+
+def test_invalid_budget_header_falls_back_to_the_default(api_service):
+    from fastapi.testclient import TestClient
+
+    api_service.generate_outfit_recommendation = lambda username, record_pairing=True: {"status": "success"}
+    with TestClient(api_service.app) as client:
+        response = client.post("/generate-recommendation", json={"username": "alice"},
+                               headers={deadlines.HEADER: "not-a-number"})
+    assert response.json() == {"status": "success"}
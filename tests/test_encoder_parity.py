@@ -0,0 +1,63 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+pytest.importorskip('torch')
+pytest.importorskip('fashion_clip')
+pytest.importorskip('onnxruntime')
+pytest.importorskip('transformers')
+
+from encoders import ONNX_FILES, create_encoder  # noqa: E402
+from benchmarks.encoder_parity import PROMPTS, compare  # noqa: E402
+
+MODEL = os.environ.get("WEARWIZ_EMBEDDING_MODEL", "fashion-clip")
+ONNX_DIR = os.environ.get("WEARWIZ_ONNX_DIR",
+                          os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'onnx'))
+# Minimum mean cosine to the torch embeddings: the fp32 export should match
+# to rounding, the int8 one within quantization error
+MIN_COSINE = {'onnx': 0.99, 'onnx-int8': 0.97}
+
+if not os.path.exists(os.path.join(ONNX_DIR, 'export.json')):
+    pytest.skip(f"no ONNX export in {ONNX_DIR} (run python -m tools.export_onnx)", allow_module_level=True)
+
+
+def fixed_images():
+    """A few deterministic garment-like images, so the test needs no uploads"""
+    images = []
+    for i, (colour, shape) in enumerate([((20, 40, 120), 'shirt'), ((200, 30, 30), 'dress'),
+                                         ((30, 30, 30), 'trousers'), ((230, 230, 220), 'shoe')]):
+        image = Image.new('RGB', (224, 224), (245, 245, 245))
+        draw = ImageDraw.Draw(image)
+        if shape == 'shirt':
+            draw.polygon([(50, 40), (174, 40), (200, 90), (170, 100), (170, 200), (54, 200), (54, 100),
+                          (24, 90)], fill=colour)
+        elif shape == 'dress':
+            draw.polygon([(90, 30), (134, 30), (190, 210), (34, 210)], fill=colour)
+        elif shape == 'trousers':
+            draw.polygon([(60, 20), (164, 20), (180, 210), (125, 210), (112, 80), (99, 210), (44, 210)],
+                         fill=colour)
+        else:
+            draw.ellipse([(30, 110), (200, 170)], fill=colour)
+        images.append(image)
+    return images
+
+
+@pytest.fixture(scope='module')
+def reference():
+    encoder = create_encoder('torch', MODEL)
+    return {'images': np.asarray(encoder.encode_images(fixed_images(), batch_size=4), dtype=np.float32),
+            'texts': np.asarray(encoder.encode_text(PROMPTS, batch_size=16), dtype=np.float32)}
+
+
+@pytest.mark.parametrize('variant', sorted(MIN_COSINE))
+def test_onnx_embeddings_match_torch(reference, variant):
+    if not all(os.path.exists(os.path.join(ONNX_DIR, name)) for name in ONNX_FILES[variant]):
+        pytest.skip(f"no {variant} export in {ONNX_DIR}")
+    encoder = create_encoder(variant, MODEL, onnx_dir=ONNX_DIR)
+    candidate = {'images': np.asarray(encoder.encode_images(fixed_images(), batch_size=4), dtype=np.float32),
+                 'texts': np.asarray(encoder.encode_text(PROMPTS, batch_size=16), dtype=np.float32)}
+
+    parity = compare(reference, candidate)
+    assert parity['image_cosine_mean'] >= MIN_COSINE[variant], parity
+    assert parity['text_cosine_mean'] >= MIN_COSINE[variant], parity
@@ -0,0 +1,46 @@
+import io
+import os
+import stat
+import pytest
+from PIL import Image
+import image_io
+
+
+def png_bytes(colour=(200, 30, 30), size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, colour).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_same_bytes_resolve_to_one_file(tmp_path):
+    data = png_bytes()
+    first = image_io.save_upload(io.BytesIO(data), str(tmp_path), '.jpg', chunk_size=256)
+    second = image_io.save_upload(io.BytesIO(data), str(tmp_path), '.jpg')
+    other = image_io.save_upload(io.BytesIO(png_bytes((0, 0, 0))), str(tmp_path), '.jpg')
+
+    assert first['filename'] == second['filename'] and first['filename'].endswith('.png')
+    assert (first['duplicate'], second['duplicate']) == (False, True)
+    assert other['filename'] != first['filename']
+    assert (first['width'], first['height'], first['format'], first['size']) == (64, 48, 'PNG', len(data))
+    assert sorted(os.listdir(str(tmp_path))) == sorted([first['filename'], other['filename']])
+    with open(os.path.join(str(tmp_path), first['filename']), 'rb') as f:
+        assert f.read() == data
+
+
+def test_oversized_upload_is_rejected(tmp_path):
+    data = png_bytes(size=(512, 512)) + os.urandom(4096)
+    with pytest.raises(image_io.UploadTooLarge):
+        image_io.save_upload(io.BytesIO(data), str(tmp_path), '.png', chunk_size=1024, max_bytes=2048)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_non_image_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="not a readable image"):
+        image_io.save_upload(io.BytesIO(b"%PDF-1.4 definitely not a picture" * 100), str(tmp_path), '.jpg')
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_saved_file_is_world_readable(tmp_path):
+    saved = image_io.save_upload(io.BytesIO(png_bytes()), str(tmp_path), '.png')
+    mode = stat.S_IMODE(os.stat(os.path.join(str(tmp_path), saved['filename'])).st_mode)
+    assert mode == 0o644
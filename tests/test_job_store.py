@@ -0,0 +1,70 @@
+import subprocess
+import sys
+import job_store
+from job_store import JobStore
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_job_moves_from_queued_through_running_to_completed(tmp_path):
+    jobs = JobStore(str(tmp_path / 'jobs.db'))
+    jobs.create(7, 'ingest', username='alice')
+    job = jobs.get(7)
+    assert (job['status'], job['kind'], job['username'], job['result']) == (job_store.QUEUED, 'ingest', 'alice', None)
+
+    jobs.update(7, status=job_store.RUNNING)
+    jobs.update(7, stage='describing')
+    job = jobs.get('7')
+    assert (job['status'], job['stage']) == (job_store.RUNNING, 'describing')
+    assert jobs.count() == 1
+
+    jobs.update(7, status=job_store.COMPLETED, result={'items': 3})
+    job = jobs.get(7)
+    assert (job['status'], job['stage'], job['result']) == (job_store.COMPLETED, 'describing', {'items': 3})
+    assert jobs.count() == 0 and jobs.count(job_store.COMPLETED) == 1
+
+
+def test_failed_job_keeps_its_error(tmp_path):
+    jobs = JobStore(str(tmp_path / 'jobs.db'))
+    jobs.create('delete-1', 'delete')
+    jobs.update('delete-1', status=job_store.RUNNING)
+    jobs.update('delete-1', status=job_store.ERROR, error='disk full')
+    job = jobs.get('delete-1')
+    assert (job['status'], job['error']) == (job_store.ERROR, 'disk full')
+    assert jobs.get('unknown') is None
+
+
+def test_job_is_visible_to_another_worker(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    JobStore(path).create(1, 'ingest')
+    JobStore(path).update(1, status=job_store.RUNNING)
+    assert JobStore(path).get(1)['status'] == job_store.RUNNING
+
+
+def test_running_job_of_a_dead_worker_is_reported_failed_after_restart(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    jobs = JobStore(path)
+    jobs.create(1, 'ingest')
+    jobs.update(1, status=job_store.RUNNING)
+    jobs.create(2, 'ingest')
+    pid = dead_pid()
+    jobs._connection().execute("UPDATE jobs SET pid = ?", (pid,))
+
+    restarted = JobStore(path)
+    for job_id in (1, 2):
+        job = restarted.get(job_id)
+        assert job['status'] == job_store.ERROR
+        assert str(pid) in job['error']
+
+
+def test_finished_jobs_are_pruned_after_retention(tmp_path):
+    jobs = JobStore(str(tmp_path / 'jobs.db'), retention=0)
+    jobs.create(1, 'ingest')
+    jobs.update(1, status=job_store.COMPLETED, result={'ok': True})
+    jobs.create(2, 'ingest')
+    assert jobs.get(1) is None
+    assert jobs.get(2)['status'] == job_store.QUEUED
@@ -0,0 +1,61 @@
+import multiprocessing
+import threading
+import pytest
+import metadata_store
+
+
+def upload_many(count, results=None):
+    """What each /upload does: allocate an ID, then append the item under the user's lock"""
+    ids = []
+    for _ in range(count):
+        image_id = metadata_store.allocate_image_id()
+        with metadata_store.update('alice') as items:
+            items.append({'image_id': image_id, 'filename': f'{image_id}.png'})
+        ids.append(image_id)
+    if results is not None:
+        results.put(ids)
+    return ids
+
+
+def test_concurrent_threads_get_unique_ids_and_lose_no_update(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    allocated = []
+    lock = threading.Lock()
+
+    def worker():
+        ids = upload_many(25)
+        with lock:
+            allocated.extend(ids)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(allocated) == len(set(allocated)) == 200
+    assert sorted(item['image_id'] for item in metadata_store.load('alice')) == sorted(allocated)
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_processes_get_unique_ids_and_lose_no_update(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=upload_many, args=(20, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    allocated = [image_id for _ in processes for image_id in results.get(timeout=60)]
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    assert len(allocated) == len(set(allocated)) == 80
+    assert sorted(item['image_id'] for item in metadata_store.load('alice')) == sorted(allocated)
+
+
+def test_ids_start_above_existing_items(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    metadata_store.save('bob', [{'image_id': '41'}, {'image_id': 'legacy'}])
+    assert metadata_store.allocate_image_id() == '42'
+    assert metadata_store.allocate_image_id() == '43'
@@ -0,0 +1,86 @@
+import math
+import pytest
+import pairing_graph
+from pairing_graph import PairingGraph
+
+DAY = 86400
+
+
+def test_record_accumulates_count_and_keeps_latest_use(tmp_path):
+    graph = PairingGraph(str(tmp_path / 'pairings.db'))
+    graph.record('alice', 2, 1, when=100.0)
+    graph.record('alice', '1', '2', when=300.0)
+    graph.record('alice', 1, 2, when=200.0, count=3)
+
+    assert graph.partners('alice', 1) == {'2': (5, 300.0)}
+    assert graph.partners('alice', 2) == {'1': (5, 300.0)}
+    assert graph.partners('bob', 1) == {}
+
+
+def test_edges_and_most_worn(tmp_path):
+    graph = PairingGraph(str(tmp_path / 'pairings.db'))
+    graph.record('alice', 1, 2, when=10.0)
+    graph.record('alice', 3, 1, when=20.0, count=4)
+    graph.record('alice', 4, 5, when=30.0, count=4)
+    graph.record('bob', 1, 2, when=10.0)
+
+    assert sorted(graph.edges('alice')) == [('1', '2', 1, 10.0), ('1', '3', 4, 20.0), ('4', '5', 4, 30.0)]
+    assert graph.most_worn('alice', limit=2) == [('4', '5', 4, 30.0), ('1', '3', 4, 20.0)]
+    assert graph.paired_items('alice') == {'1', '2', '3', '4', '5'}
+
+    graph.remove_items('alice', [1])
+    assert sorted(graph.edges('alice')) == [('4', '5', 4, 30.0)]
+    assert list(graph.edges('bob')) == [('1', '2', 1, 10.0)]
+
+
+def test_seed_imports_legacy_pairs_once(tmp_path):
+    graph = PairingGraph(str(tmp_path / 'pairings.db'))
+    items = [{'image_id': 1, 'pairs': [2, 3]}, {'image_id': 2, 'pairs': [1]}]
+    assert not graph.seeded('alice')
+    graph.seed('alice', items, when=50.0)
+    graph.seed('alice', items, when=60.0)
+    assert graph.seeded('alice')
+    assert graph.partners('alice', 1) == {'2': (1, 50.0), '3': (1, 50.0)}
+
+
+def test_boost_grows_with_count_and_halves_with_age():
+    now = 1000 * DAY
+    assert pairing_graph.boost(None, 0.02, 30, now=now) == 0.0
+    assert pairing_graph.boost((1, now), 0.02, 30, now=now) == pytest.approx(0.02 * math.log(2))
+    assert pairing_graph.boost((7, now), 0.02, 30, now=now) == pytest.approx(0.02 * math.log(8))
+    assert pairing_graph.boost((7, now - 30 * DAY), 0.02, 30, now=now) == pytest.approx(0.01 * math.log(8))
+    assert pairing_graph.boost((7, now), -0.02, 30, now=now) < 0
+
+
+def test_often_worn_candidate_outranks_a_slightly_closer_one(tmp_path):
+    """The re-ranking find_best_match applies: similarity plus the pairing boost"""
+    now = 1000 * DAY
+    graph = PairingGraph(str(tmp_path / 'pairings.db'))
+    graph.record('alice', 'top', 'jeans', when=now - DAY, count=6)
+    graph.record('alice', 'top', 'chinos', when=now - 365 * DAY, count=6)
+    partners = graph.partners('alice', 'top')
+    candidates = [('skirt', 0.81), ('chinos', 0.80), ('jeans', 0.79)]
+
+    def best(weight):
+        return max(candidates, key=lambda hit: hit[1] + pairing_graph.boost(partners.get(hit[0]), weight, 30,
+                                                                            now=now))[0]
+
+    assert best(0.02) == 'jeans'
+    assert best(0.0) == 'skirt'
+    assert best(-0.02) == 'skirt'
+
+
+def test_version_changes_with_every_change_to_a_users_pairings(tmp_path):
+    graph = PairingGraph(str(tmp_path / 'pairings.db'))
+    assert graph.version('alice') == 0
+    graph.seed('alice', [{'image_id': 1, 'pairs': [2]}], when=1.0)
+    seeded = graph.version('alice')
+    graph.record('alice', 1, 3)
+    recorded = graph.version('alice')
+    graph.remove_items('alice', [3])
+    removed = graph.version('alice')
+    assert 0 < seeded < recorded < removed
+
+    graph.record('bob', 1, 2)
+    assert graph.version('alice') == removed
+    assert PairingGraph(str(tmp_path / 'pairings.db')).version('bob') == 1
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import prefetch
+from prefetch import RecommendationPrefetcher
+
+
+def make_prefetcher(random_fn, load_items=lambda username: [], **kwargs):
+    apparel_fn = lambda username, image_id, description, apparel_type, record_pairing: {"status": "success"}
+    return RecommendationPrefetcher(ThreadPoolExecutor(max_workers=2), random_fn, apparel_fn, load_items, **kwargs)
+
+
+def test_running_future_is_not_handed_out():
+    release = threading.Event()
+
+    def slow(username, record_pairing):
+        release.wait(5)
+        return {"status": "success"}
+
+    prefetcher = make_prefetcher(slow, depth=1, recent_items=0)
+    prefetcher.fill('alice')
+    assert prefetcher.take_random('alice') is None
+
+    release.set()
+    deadline = time.monotonic() + 5
+    future = None
+    while future is None and time.monotonic() < deadline:
+        future = prefetcher.take_random('alice')
+        time.sleep(0.01)
+    assert future is not None and future.done()
+    assert future.result() == {"status": "success"}
+
+
+def test_running_apparel_suggestion_stays_in_place():
+    release = threading.Event()
+    items = [{"image_id": 1, "description": "jeans", "apparel_type": "bottom"}]
+    prefetcher = make_prefetcher(lambda username, record_pairing: None, lambda username: items,
+                                 depth=0, recent_items=1)
+    prefetcher.apparel_fn = lambda *args, record_pairing: release.wait(5)
+    prefetcher.fill('alice')
+    deadline = time.monotonic() + 5
+    while ('alice', '1') not in prefetcher._apparel and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert prefetcher.take_apparel('alice', 1, "jeans", "bottom") is None
+    assert ('alice', '1') in prefetcher._apparel
+    release.set()
+
+
+def test_fill_reads_items_off_the_calling_thread():
+    callers = []
+
+    def load_items(username):
+        callers.append(threading.current_thread())
+        return []
+
+    prefetcher = make_prefetcher(lambda username, record_pairing: None, load_items, depth=0, recent_items=1)
+    prefetcher.fill('alice')
+    prefetcher.executor.shutdown(wait=True)
+    assert callers and threading.current_thread() not in callers
+
+
+def test_idle_users_are_evicted(monkeypatch):
+    monkeypatch.setattr(prefetch, 'EVICT_INTERVAL', 0)
+    prefetcher = make_prefetcher(lambda username, record_pairing: {"status": "success"},
+                                 depth=1, recent_items=0, ttl=0.05)
+    for i in range(20):
+        prefetcher.fill(f"user{i}")
+    time.sleep(0.1)
+    prefetcher.fill('bob')
+    assert list(prefetcher._random) == ['bob']
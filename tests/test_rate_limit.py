@@ -0,0 +1,43 @@
+import time
+import pytest
+import rate_limit
+from rate_limit import AdmissionTimeout, FairTokenBucket, SharedTokens
+
+
+def admitted(bucket, calls, timeout=0.2):
+    count = 0
+    for _ in range(calls):
+        try:
+            bucket.acquire('alice', rate_limit.INTERACTIVE, time.monotonic() + timeout)
+            count += 1
+        except AdmissionTimeout:
+            pass
+    return count
+
+
+def test_local_bucket_admits_burst_then_rate():
+    bucket = FairTokenBucket(rate=0.01, burst=3)
+    assert admitted(bucket, 5) == 3
+
+
+def test_workers_sharing_a_database_draw_from_one_quota(tmp_path):
+    path = str(tmp_path / 'limit.db')
+    worker_a = FairTokenBucket(rate=0.01, burst=3, shared=SharedTokens(path))
+    worker_b = FairTokenBucket(rate=0.01, burst=3, shared=SharedTokens(path))
+
+    assert admitted(worker_a, 2) == 2
+    assert admitted(worker_b, 3) == 1
+    assert admitted(worker_a, 1) == 0
+
+
+def test_pause_in_one_worker_stops_the_others(tmp_path):
+    path = str(tmp_path / 'limit.db')
+    worker_a = FairTokenBucket(rate=100, burst=5, shared=SharedTokens(path))
+    worker_b = FairTokenBucket(rate=100, burst=5, shared=SharedTokens(path))
+
+    worker_a.pause(0.5)
+    with pytest.raises(AdmissionTimeout):
+        worker_b.acquire('bob', rate_limit.INGEST, time.monotonic() + 0.1)
+    start = time.monotonic()
+    worker_b.acquire('bob', rate_limit.INGEST, time.monotonic() + 5)
+    assert time.monotonic() - start < 1.0
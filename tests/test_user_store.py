@@ -0,0 +1,76 @@
+import json
+import os
+import sqlite3
+import pytest
+from user_store import UserStore, valid_username
+
+
+def test_create_and_authenticate(tmp_path):
+    users = UserStore(str(tmp_path / 'users.db'))
+    assert users.create('alice', 'secret', email='alice@example.com')
+    assert users.exists('alice') and not users.exists('bob')
+    assert users.authenticate('alice', 'secret')
+    assert not users.authenticate('alice', 'wrong')
+    assert not users.authenticate('bob', 'secret')
+    assert users.get('alice') == {'email': 'alice@example.com', 'username': 'alice'}
+    assert users.get('bob') is None
+
+
+def test_duplicate_username_is_rejected(tmp_path):
+    users = UserStore(str(tmp_path / 'users.db'))
+    assert users.create('alice', 'first')
+    assert not users.create('alice', 'second')
+    assert users.authenticate('alice', 'first')
+    assert not users.authenticate('alice', 'second')
+
+
+def test_passwords_are_stored_as_salted_hashes(tmp_path):
+    path = str(tmp_path / 'users.db')
+    users = UserStore(path)
+    users.create('alice', 'secret')
+    users.create('bob', 'secret')
+    hashes = dict(sqlite3.connect(path).execute("SELECT username, password_hash FROM users"))
+    assert 'secret' not in hashes['alice']
+    assert hashes['alice'] != hashes['bob']
+    assert 'password_hash' not in users.get('alice')
+
+
+def test_import_legacy_hashes_passwords_and_renames_the_file(tmp_path):
+    legacy = str(tmp_path / 'users.json')
+    with open(legacy, 'w') as f:
+        json.dump({'users': [{'username': 'alice', 'password': 'secret', 'email': 'a@example.com'},
+                             {'username': 'bob', 'password': 'hunter2'}]}, f)
+    users = UserStore(str(tmp_path / 'users.db'))
+    users.create('bob', 'already-registered')
+
+    assert users.import_legacy(legacy) == 1
+    assert not os.path.exists(legacy) and os.path.exists(legacy + '.imported')
+    assert users.authenticate('alice', 'secret')
+    assert users.get('alice')['email'] == 'a@example.com'
+    assert users.authenticate('bob', 'already-registered')
+    assert users.import_legacy(legacy) == 0
+
+
+def test_import_legacy_leaves_a_corrupt_file_in_place(tmp_path):
+    legacy = str(tmp_path / 'users.json')
+    with open(legacy, 'w') as f:
+        f.write('{not json')
+    assert UserStore(str(tmp_path / 'users.db')).import_legacy(legacy) == 0
+    assert os.path.exists(legacy)
+
+
+@pytest.mark.parametrize('username, valid', [
+    ('Jinav', True),
+    ('darshit_503', True),
+    ('a.b-c', True),
+    ('', False),
+    ('.', False),
+    ('..', False),
+    ('../../x', False),
+    ('a/b', False),
+    ('.hidden', False),
+    ('x' * 65, False),
+    (None, False),
+])
+def test_valid_username(username, valid):
+    assert valid_username(username) is valid
@@ -0,0 +1,52 @@
+import os
+import numpy as np
+import pytest
+from vector_store import NumpyBackend
+
+
+def unit(seed, dim=8):
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_collection_deleted_by_another_backend_stays_usable(tmp_path):
+    worker_a = NumpyBackend(str(tmp_path))
+    worker_b = NumpyBackend(str(tmp_path))
+    stale = worker_b.get_or_create_collection('fashion_items_alice_top')
+    stale.add(ids=['1', '2'], embeddings=[unit(1), unit(2)], metadatas=[{'n': 1}, {'n': 2}])
+    assert worker_a.get_or_create_collection('fashion_items_alice_top').count() == 2
+
+    worker_a.delete_collection('fashion_items_alice_top')
+    assert worker_a.list_collection_names() == []
+    assert stale.count() == 0
+    assert stale.query([unit(1)], n_results=1)['ids'] == [[]]
+    assert worker_b.list_collection_names() == []
+
+    stale.add(ids=['3'], embeddings=[unit(3, dim=4)], metadatas=[{'n': 3}])
+    assert stale.query([unit(3, dim=4)], n_results=1)['ids'] == [['3']]
+    assert worker_a.list_collection_names() == ['fashion_items_alice_top']
+    fresh = NumpyBackend(str(tmp_path)).get_or_create_collection('fashion_items_alice_top')
+    assert fresh.get(include=['metadatas'])['metadatas'] == [{'n': 3}]
+    assert fresh.query([unit(3, dim=4)], n_results=1)['ids'] == [['3']]
+
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="needs /proc to count file descriptors")
+def test_open_collections_are_bounded(tmp_path):
+    backend = NumpyBackend(str(tmp_path), max_open=4)
+    for i in range(8):
+        backend.get_or_create_collection(f'warmup_{i}').add(ids=['1'], embeddings=[unit(i)])
+    baseline = open_fds()
+
+    for i in range(40):
+        collection = backend.get_or_create_collection(f'fashion_items_user{i}_top')
+        collection.add(ids=['1'], embeddings=[unit(i)])
+        assert collection.query([unit(i)], n_results=1)['ids'] == [['1']]
+    assert open_fds() <= baseline
+    assert len(backend._collections) == 4
+
+    reopened = backend.get_or_create_collection('fashion_items_user0_top')
+    assert reopened.query([unit(0)], n_results=1)['ids'] == [['1']]
@@ -0,0 +1,87 @@
+"""Enrich locally tagged wardrobe items with the vision model.
+
+Items ingested with WEARWIZ_INGEST_MODE=local (or by the auto mode's fallback
+while Groq was unavailable) carry ``ingest_source: local`` and a template
+title/description from FashionCLIP zero-shot tagging. This replaces them with
+the vision model's description, title and category, and moves the item's
+vector when the category changes.
+
+    python -m tools.enrich                  # all users
+    python -m tools.enrich --user Jinav --limit 50
+    python -m tools.enrich --min-confidence 0.9   # leave confident tags alone
+
+Each item is saved as soon as it is enriched, so the tool can be stopped and
+rerun at any time; Groq calls go through the ingest-priority rate limiter.
+"""
+import argparse
+import os
+import time
+import ai_handler
+import metadata_store
+import rate_limit
+from tools.reindex import list_users, UPLOADS_DIR
+
+
+def pending_items(username, min_confidence=None):
+    metadata = metadata_store.load(username)
+    return [item for item in metadata
+            if item.get('ingest_source') == 'local'
+            and item.get('processing_status', 'completed') == 'completed'
+            and (min_confidence is None or item.get('tag_confidence', 0) < min_confidence)]
+
+
+def enrich_item(username, item):
+    """Describe one item with the vision model and re-index it; returns its new category"""
+    image_path = os.path.join(UPLOADS_DIR, username, item['filename'])
+    image = ai_handler.ImageInput(image_path)
+    description, title, apparel_type = ai_handler.describe_with_vision(image, item['image_id'], strict=True)
+    item_hash = item.get('content_hash') or image.content_hash
+    embedding = ai_handler.image_embedding_for(image, item['image_id'], item_hash)
+    ai_handler.index_item_embedding(
+        username, item['image_id'], item['filename'], description, apparel_type, embedding, item_hash,
+        previous_category=item.get('indexed_category', item['apparel_type'])
+    )
+
+    # Update only this item, so edits made while the vision calls ran are kept
+    with metadata_store.update(username) as metadata:
+        for entry in metadata:
+            if str(entry.get('image_id')) == str(item['image_id']):
+                entry.update(description=description, title=title, apparel_type=apparel_type,
+                             indexed_category=apparel_type, content_hash=item_hash, ingest_source='vision')
+                entry.pop('tag_confidence', None)
+                break
+    return apparel_type
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--user', action='append', help='only enrich these users')
+    parser.add_argument('--limit', type=int, help='stop after this many items')
+    parser.add_argument('--min-confidence', type=float,
+                        help='skip items whose local category confidence is at least this')
+    args = parser.parse_args()
+
+    enriched, failed, recategorized = 0, 0, 0
+    start = time.perf_counter()
+    for username in args.user or list_users():
+        for item in pending_items(username, args.min_confidence):
+            if args.limit is not None and enriched + failed >= args.limit:
+                break
+            try:
+                with rate_limit.scope(user=username, priority=rate_limit.INGEST):
+                    apparel_type = enrich_item(username, item)
+            except Exception as e:
+                print(f"{username}: could not enrich image {item['image_id']}: {e}")
+                failed += 1
+                continue
+            enriched += 1
+            if apparel_type != item['apparel_type']:
+                recategorized += 1
+                print(f"{username}: image {item['image_id']} moved {item['apparel_type']} -> {apparel_type}")
+
+    print(f"Enriched {enriched} items ({recategorized} recategorized, {failed} failed) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Export the FashionCLIP image and text towers to ONNX for WEARWIZ_ENCODER=onnx.
+
+Writes ``image.onnx`` / ``text.onnx`` (fp32), their dynamically quantized
+``*.int8.onnx`` variants, the CLIPProcessor files used for preprocessing,
+and ``export.json`` recording the source checkpoint:
+
+    python -m tools.export_onnx                          # fashion-clip -> models/onnx
+    python -m tools.export_onnx --model fashion-clip --out models/onnx --no-quantize
+
+Needs torch, fashion_clip and onnxruntime at export time only. Check the
+result with ``python -m benchmarks.encoder_parity``.
+"""
+import argparse
+import json
+import os
+import time
+
+
+def export(model_name, out_dir, opset=17, quantize=True):
+    import torch
+    from fashion_clip.fashion_clip import FashionCLIP
+
+    fclip = FashionCLIP(model_name)
+    model = fclip.model.to('cpu').eval()
+    processor = fclip.preprocess
+    os.makedirs(out_dir, exist_ok=True)
+
+    class ImageTower(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    class TextTower(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    size = processor.image_processor.crop_size
+    pixel_values = torch.zeros(1, 3, size['height'], size['width'])
+    text = processor(text=["a photo of a shirt"], return_tensors='pt',
+                     max_length=77, padding='max_length', truncation=True)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            ImageTower(), (pixel_values,), os.path.join(out_dir, 'image.onnx'),
+            input_names=['pixel_values'], output_names=['image_embeds'],
+            dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+            opset_version=opset
+        )
+        torch.onnx.export(
+            TextTower(), (text['input_ids'], text['attention_mask']), os.path.join(out_dir, 'text.onnx'),
+            input_names=['input_ids', 'attention_mask'], output_names=['text_embeds'],
+            dynamic_axes={'input_ids': {0: 'batch'}, 'attention_mask': {0: 'batch'},
+                          'text_embeds': {0: 'batch'}},
+            opset_version=opset
+        )
+    processor.save_pretrained(out_dir)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        for tower in ('image', 'text'):
+            quantize_dynamic(os.path.join(out_dir, f'{tower}.onnx'), os.path.join(out_dir, f'{tower}.int8.onnx'),
+                             weight_type=QuantType.QInt8)
+
+    with open(os.path.join(out_dir, 'export.json'), 'w') as f:
+        json.dump({'model': model_name, 'opset': opset, 'quantized': quantize}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.environ.get("WEARWIZ_EMBEDDING_MODEL", "fashion-clip"))
+    parser.add_argument('--out', default=os.environ.get("WEARWIZ_ONNX_DIR", "./models/onnx"))
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--no-quantize', action='store_true', help='skip the int8 variants')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    export(args.model, args.out, opset=args.opset, quantize=not args.no_quantize)
+    sizes = {name: os.path.getsize(os.path.join(args.out, name)) / 2 ** 20
+             for name in sorted(os.listdir(args.out)) if name.endswith('.onnx')}
+    print(f"Exported {args.model} to {args.out} in {time.perf_counter() - start:.1f}s")
+    for name, megabytes in sizes.items():
+        print(f"  {name:<20} {megabytes:>8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
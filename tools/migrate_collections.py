@@ -0,0 +1,105 @@
+"""Move wardrobe vectors between collection layouts.
+
+    python -m tools.migrate_collections --to shared          # per-user -> per-category
+    python -m tools.migrate_collections --to per_user        # and back
+    python -m tools.migrate_collections --to shared --delete-source
+
+Copies are upserts, so an interrupted run can simply be restarted. Source
+collections are only dropped (with --delete-source) after their rows have
+been copied and counted. Set WEARWIZ_COLLECTION_LAYOUT to the new layout
+before restarting the API.
+"""
+import argparse
+import os
+import time
+import numpy as np
+from vector_store import create_backend, parse_collection_name, user_category_collection, LAYOUTS
+
+
+def iter_batches(collection, batch_size):
+    """Yield ``get`` results of ``batch_size`` rows including embeddings"""
+    offset = 0
+    while True:
+        batch = collection.get(include=['embeddings', 'documents', 'metadatas'],
+                               limit=batch_size, offset=offset)
+        if not batch['ids']:
+            return
+        yield batch
+        offset += len(batch['ids'])
+
+
+def copy_rows(batch, target_for):
+    """Upsert one batch, routing each row to ``target_for(metadata)``"""
+    groups = {}
+    for i, item_id in enumerate(batch['ids']):
+        target = target_for(batch['metadatas'][i])
+        group = groups.setdefault(id(target), (target, [], [], [], []))
+        group[1].append(item_id)
+        group[2].append(np.asarray(batch['embeddings'][i], dtype=np.float32).tolist())
+        group[3].append(batch['documents'][i])
+        group[4].append(batch['metadatas'][i])
+    for target, ids, embeddings, documents, metadatas in groups.values():
+        target.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+
+def migrate(backend, to_layout, batch_size=500, delete_source=False):
+    from_layout = 'per_user' if to_layout == 'shared' else 'shared'
+    sources = []
+    for name in backend.list_collection_names():
+        username, category = parse_collection_name(name)
+        if category is None:
+            continue
+        if (from_layout == 'per_user') == (username is not None):
+            sources.append((name, username, category))
+
+    start = time.perf_counter()
+    total = 0
+    for name, username, category in sources:
+        source = backend.get_or_create_collection(name)
+        if from_layout == 'per_user':
+            target = user_category_collection(backend, username, category, 'shared')
+            target_for = lambda metadata: target
+        else:
+            targets = {}
+
+            def target_for(metadata, category=category, targets=targets):
+                owner = metadata['username']
+                if owner not in targets:
+                    targets[owner] = user_category_collection(backend, owner, category, 'per_user')
+                return targets[owner]
+
+        copied = 0
+        for batch in iter_batches(source, batch_size):
+            copy_rows(batch, target_for)
+            copied += len(batch['ids'])
+
+        if copied != source.count():
+            print(f"WARNING: {name} changed during migration, keeping source collection")
+        elif delete_source:
+            backend.delete_collection(name)
+        total += copied
+        print(f"Migrated {copied} vectors from {name}")
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed else 0.0
+    print(f"Migrated {total} vectors from {len(sources)} collections to the {to_layout} "
+          f"layout in {elapsed:.1f}s ({rate:.0f} vectors/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--to', choices=LAYOUTS, required=True, help='target collection layout')
+    parser.add_argument('--backend', default=os.environ.get("WEARWIZ_VECTOR_BACKEND", "chroma"))
+    parser.add_argument('--vector-db', default="./vector_db")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--delete-source', action='store_true',
+                        help='drop source collections once they have been copied')
+    args = parser.parse_args()
+
+    backend = create_backend(args.backend, args.vector_db,
+                             dtype=os.environ.get("WEARWIZ_EMBEDDING_DTYPE", "float32"))
+    migrate(backend, args.to, batch_size=args.batch_size, delete_source=args.delete_source)
+
+
+if __name__ == '__main__':
+    main()
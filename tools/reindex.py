@@ -0,0 +1,155 @@
+"""Re-embed and re-file wardrobe items whose index entry is stale.
+
+An item is stale when its ``embedding_model`` differs from the configured
+WEARWIZ_EMBEDDING_MODEL (or was never recorded), or when its
+``apparel_type`` was corrected after it was indexed under
+``indexed_category``. Stale items are filed in the right category
+collection; items that only changed category keep their stored vector, so
+only items embedded by another model (or without a stored vector) are
+re-embedded, in batches.
+
+    python -m tools.reindex                      # all users
+    python -m tools.reindex --user Jinav --batch-size 32
+    python -m tools.reindex --dry-run
+
+Each user's metadata file is rewritten after every batch with the new
+``embedding_model`` / ``indexed_category``, so an interrupted run resumes
+where it stopped when started again.
+"""
+import argparse
+import os
+import time
+import ai_handler
+import metadata_store
+from catalog import content_hash
+
+METADATA_DIR = 'user_metadata'
+UPLOADS_DIR = os.path.join('static', 'uploads')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+
+def list_users():
+    users = set()
+    if os.path.exists(METADATA_DIR):
+        users.update(name[:-len('_metadata.json')] for name in os.listdir(METADATA_DIR)
+                     if name.endswith('_metadata.json'))
+    if os.path.exists(UPLOADS_DIR):
+        users.update(name for name in os.listdir(UPLOADS_DIR)
+                     if os.path.isdir(os.path.join(UPLOADS_DIR, name)))
+    return sorted(users)
+
+
+def stale_reason(item, force=False):
+    if item.get('processing_status', 'completed') != 'completed':
+        return None
+    if force:
+        return 'forced'
+    if item.get('embedding_model') != ai_handler.EMBEDDING_MODEL:
+        return 'model'
+    if item.get('indexed_category', item['apparel_type']) != item['apparel_type']:
+        return 'category'
+    return None
+
+
+def save_metadata(username, updates):
+    """Apply {image_id: fields} to the user's current metadata under their lock"""
+    with metadata_store.update(username) as metadata:
+        for item in metadata:
+            fields = updates.get(str(item.get('image_id')))
+            if fields:
+                item.update(fields)
+
+
+def reindex_user(username, batch_size, force=False, dry_run=False):
+    """Re-embed one user's stale items; returns (reindexed, skipped, seconds)"""
+    metadata = metadata_store.load(username)
+
+    upload_dir = os.path.join(UPLOADS_DIR, username)
+    known_files = {item['filename'] for item in metadata}
+    if os.path.exists(upload_dir):
+        orphans = [name for name in os.listdir(upload_dir)
+                   if name.lower().endswith(IMAGE_EXTENSIONS) and name not in known_files]
+        if orphans:
+            print(f"{username}: {len(orphans)} uploaded files have no metadata entry")
+
+    stale, skipped = [], 0
+    for item in metadata:
+        reason = stale_reason(item, force)
+        if reason is None:
+            continue
+        if not os.path.exists(os.path.join(upload_dir, item['filename'])):
+            print(f"{username}: image {item['image_id']} is missing {item['filename']}, skipping")
+            skipped += 1
+            continue
+        stale.append((item, reason))
+
+    if dry_run:
+        for item, reason in stale:
+            print(f"{username}: would reindex image {item['image_id']} ({reason})")
+        return len(stale), skipped, 0.0
+
+    start = time.perf_counter()
+    for offset in range(0, len(stale), batch_size):
+        batch = stale[offset:offset + batch_size]
+        paths = [os.path.join(upload_dir, item['filename']) for item, _ in batch]
+        embeddings = [None] * len(batch)
+        moved = [i for i, (_, reason) in enumerate(batch) if reason == 'category']
+        if moved:
+            # A corrected category does not change the image: move the stored vector
+            stored = ai_handler.stored_item_embeddings(username, [batch[i][0] for i in moved])
+            for i, embedding in zip(moved, stored):
+                embeddings[i] = embedding
+        encode = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if encode:
+            encoded = ai_handler.embed_images([paths[i] for i in encode], batch_size=batch_size)
+            for i, embedding in zip(encode, encoded):
+                embeddings[i] = embedding
+
+        updates = {}
+        for (item, reason), path, embedding in zip(batch, paths, embeddings):
+            item_hash = item.get('content_hash') or content_hash(path)
+            ai_handler.index_item_embedding(
+                username, item['image_id'], item['filename'], item['description'],
+                item['apparel_type'], embedding, item_hash,
+                previous_category=item.get('indexed_category', item['apparel_type']),
+                replace=reason != 'category'
+            )
+            updates[str(item['image_id'])] = {
+                'content_hash': item_hash,
+                'embedding_model': ai_handler.EMBEDDING_MODEL,
+                'indexed_category': item['apparel_type']
+            }
+
+        # Checkpoint: finished items are no longer stale on the next run
+        save_metadata(username, updates)
+        done = offset + len(batch)
+        elapsed = time.perf_counter() - start
+        print(f"{username}: {done}/{len(stale)} items ({done / elapsed:.1f} items/s)")
+
+    return len(stale), skipped, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--user', action='append', help='only reindex these users')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--force', action='store_true', help='re-embed every completed item')
+    parser.add_argument('--dry-run', action='store_true', help='only report stale items')
+    args = parser.parse_args()
+
+    total, skipped, seconds = 0, 0, 0.0
+    for username in args.user or list_users():
+        user_total, user_skipped, user_seconds = reindex_user(
+            username, args.batch_size, force=args.force, dry_run=args.dry_run
+        )
+        total += user_total
+        skipped += user_skipped
+        seconds += user_seconds
+
+    rate = total / seconds if seconds else 0.0
+    verb = 'Found' if args.dry_run else 'Reindexed'
+    print(f"{verb} {total} stale items ({skipped} skipped) in {seconds:.1f}s ({rate:.1f} items/s)")
+
+
+if __name__ == '__main__':
+    main()
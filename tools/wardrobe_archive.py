@@ -0,0 +1,242 @@
+"""Export a user's wardrobe to a single archive, or import one, without re-running any model.
+
+    python -m tools.wardrobe_archive export --user Jinav --out jinav.tar
+    python -m tools.wardrobe_archive export --user Jinav --out - | ssh host 'cat > jinav.tar.gz'
+    python -m tools.wardrobe_archive import jinav.tar --as-user Jinav2
+
+The archive is a tar (gzipped when the name ends in .gz/.tgz) written and
+read as a stream, so neither side holds more than one batch in memory::
+
+    manifest.json            user, embedding model, vector dtype, number of
+                             items selected (those without a stored vector
+                             are left out of the batches)
+    images/<filename>        each content-addressed upload once
+    batches/NNNNN.jsonl      the items of one batch, one metadata dict per line
+    batches/NNNNN.vectors    their embeddings as one contiguous little-endian
+                             (items x dim) array, in the same order
+    pairings.jsonl           the user's pairing graph edges
+
+Only indexed (completed) items are exported. Import gives items fresh image
+IDs, bulk-adds each batch's vectors with one upsert per collection, and marks
+them ``imported_from`` their original user and ID; items already imported
+are skipped, so an interrupted import can simply be rerun. Items embedded by a different WEARWIZ_EMBEDDING_MODEL keep their
+recorded model and are picked up by ``python -m tools.reindex``.
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import numpy as np
+import ai_handler
+import metadata_store
+from catalog import content_hash
+from user_store import valid_username
+from tools.reindex import UPLOADS_DIR
+
+ARCHIVE_FORMAT = 1
+DTYPES = ('float32', 'float16')
+
+
+def _add_bytes(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    archive.addfile(info, io.BytesIO(data))
+
+
+def export_user(username, out, batch_size=500, dtype='float32'):
+    """Stream ``username``'s wardrobe into the archive ``out`` (a path or '-'); returns the item count"""
+    upload_dir = os.path.join(UPLOADS_DIR, username)
+    items = [item for item in metadata_store.load(username)
+             if item.get('processing_status', 'completed') == 'completed'
+             and os.path.exists(os.path.join(upload_dir, item['filename']))]
+    mode = 'w|gz' if out.endswith(('.gz', '.tgz')) else 'w|'
+    fileobj = sys.stdout.buffer if out == '-' else None
+    exported, skipped = 0, 0
+    with tarfile.open(None if out == '-' else out, mode, fileobj=fileobj) as archive:
+        _add_bytes(archive, 'manifest.json', json.dumps({
+            'format': ARCHIVE_FORMAT,
+            'username': username,
+            'embedding_model': ai_handler.EMBEDDING_MODEL,
+            'dtype': dtype,
+            'items_selected': len(items),
+            'created': time.time()
+        }).encode())
+
+        for filename in sorted({item['filename'] for item in items}):
+            archive.add(os.path.join(upload_dir, filename), arcname=f'images/{filename}')
+
+        for batch_number, start in enumerate(range(0, len(items), batch_size)):
+            batch = items[start:start + batch_size]
+            embeddings = ai_handler.stored_item_embeddings(username, batch)
+            rows = [(item, embedding) for item, embedding in zip(batch, embeddings) if embedding is not None]
+            skipped += len(batch) - len(rows)
+            if not rows:
+                continue
+            lines = []
+            for item, _ in rows:
+                item = {key: value for key, value in item.items() if key not in ('pairs', 'path')}
+                item.setdefault('content_hash', content_hash(os.path.join(upload_dir, item['filename'])))
+                lines.append(json.dumps(item))
+            vectors = np.stack([embedding for _, embedding in rows]).astype(np.dtype(dtype).newbyteorder('<'))
+            _add_bytes(archive, f'batches/{batch_number:05d}.jsonl', '\n'.join(lines).encode())
+            _add_bytes(archive, f'batches/{batch_number:05d}.vectors', vectors.tobytes())
+            exported += len(rows)
+            print(f"{username}: exported {exported}/{len(items)} items", file=sys.stderr)
+
+        edges = [json.dumps({'items': [item_a, item_b], 'count': count, 'last_used': last_used})
+                 for item_a, item_b, count, last_used in ai_handler.user_pairings(username).edges(username)]
+        _add_bytes(archive, 'pairings.jsonl', '\n'.join(edges).encode())
+
+    if skipped:
+        print(f"{username}: {skipped} items had no stored vector and were not exported", file=sys.stderr)
+    return exported
+
+
+class _Importer:
+    """State of one import: the target user and the archive's ID mapping"""
+
+    def __init__(self, manifest, username):
+        if manifest.get('format') != ARCHIVE_FORMAT:
+            raise ValueError(f"Unsupported archive format {manifest.get('format')!r}")
+        self.dtype = np.dtype(manifest['dtype']).newbyteorder('<')
+        self.username = username or manifest['username']
+        if not valid_username(self.username):
+            raise ValueError(f"Invalid username {self.username!r}; pass --as-user with a valid one")
+        self.upload_dir = os.path.join(UPLOADS_DIR, self.username)
+        os.makedirs(self.upload_dir, exist_ok=True)
+        if manifest['embedding_model'] != ai_handler.EMBEDDING_MODEL:
+            print(f"Archive was embedded with {manifest['embedding_model']}, not {ai_handler.EMBEDDING_MODEL}; "
+                  f"run python -m tools.reindex after importing", file=sys.stderr)
+        self.source = manifest['username']
+        self.id_map = {}
+        self.new_ids = set()
+        self.imported = 0
+        self.skipped = 0
+        self.pending = None
+
+    def add_image(self, member, data):
+        filename = os.path.basename(member.name)
+        path = os.path.join(self.upload_dir, filename)
+        if not filename or os.path.exists(path):
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.upload_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(data, f, 1024 * 1024)
+        # mkstemp creates the file owner-only; uploads are served as static files
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+
+    def add_batch(self, items, vectors):
+        """Index one batch and add its items: rows first (as 'importing'), then
+        vectors, then mark them completed, so a rerun finishes a half-done batch"""
+        existing = {item['imported_from']: item for item in metadata_store.load(self.username)
+                    if item.get('imported_from')}
+        batch_items, batch_vectors = [], []
+        for item, vector in zip(items, vectors):
+            source = f"{self.source}/{item['image_id']}"
+            current = existing.get(source)
+            if current is not None and current.get('processing_status') == 'completed':
+                self.id_map[str(item['image_id'])] = str(current['image_id'])
+                self.skipped += 1
+                continue
+            image_id = str(current['image_id']) if current is not None else metadata_store.allocate_image_id()
+            self.id_map[str(item['image_id'])] = image_id
+            self.new_ids.add(image_id)
+            filename = os.path.basename(item['filename'])
+            item = dict(item, id=image_id, image_id=image_id, username=self.username, imported_from=source,
+                        filename=filename, path=f"uploads/{self.username}/{filename}",
+                        processing_status='importing')
+            if item.get('duplicate_of') is not None:
+                item['duplicate_of'] = self.id_map.get(str(item['duplicate_of']))
+            batch_items.append(item)
+            batch_vectors.append(vector)
+        if not batch_items:
+            return
+
+        batch_ids = {item['image_id'] for item in batch_items}
+        with metadata_store.update(self.username) as metadata:
+            metadata[:] = [item for item in metadata if str(item['image_id']) not in batch_ids] + batch_items
+        ai_handler.index_item_embeddings(self.username, batch_items, batch_vectors)
+        with metadata_store.update(self.username) as metadata:
+            for item in metadata:
+                if str(item['image_id']) in batch_ids:
+                    item['processing_status'] = 'completed'
+        self.imported += len(batch_items)
+        print(f"{self.username}: imported {self.imported} items ({self.skipped} already present)",
+              file=sys.stderr)
+
+    def add_pairings(self, data):
+        """Add the archive's edges that involve an item imported by this run, so a
+        rerun does not count the same outfits twice"""
+        graph = ai_handler.user_pairings(self.username)
+        for line in data:
+            if not line.strip():
+                continue
+            edge = json.loads(line)
+            item_a, item_b = (self.id_map.get(str(image_id)) for image_id in edge['items'])
+            if item_a and item_b and (item_a in self.new_ids or item_b in self.new_ids):
+                graph.record(self.username, item_a, item_b, when=edge['last_used'], count=edge['count'])
+
+
+def import_archive(path, username=None):
+    """Stream an archive into ``username`` (default: the exporting user); returns the item count"""
+    importer = None
+    fileobj = sys.stdin.buffer if path == '-' else None
+    with tarfile.open(None if path == '-' else path, 'r|*', fileobj=fileobj) as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            data = archive.extractfile(member)
+            if member.name == 'manifest.json':
+                importer = _Importer(json.load(data), username)
+            elif importer is None:
+                raise ValueError("Archive does not start with manifest.json")
+            elif member.name.startswith('images/'):
+                importer.add_image(member, data)
+            elif member.name.endswith('.jsonl') and member.name.startswith('batches/'):
+                importer.pending = [json.loads(line) for line in data if line.strip()]
+            elif member.name.endswith('.vectors'):
+                vectors = np.frombuffer(data.read(), dtype=importer.dtype).reshape(len(importer.pending), -1)
+                importer.add_batch(importer.pending, vectors.astype(np.float32))
+                importer.pending = None
+            elif member.name == 'pairings.jsonl':
+                importer.add_pairings(data)
+    if importer is None:
+        raise ValueError("Archive is empty")
+    return importer.imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="write a user's wardrobe to an archive")
+    export_parser.add_argument('--user', required=True)
+    export_parser.add_argument('--out', required=True, help="archive path, or - for stdout")
+    export_parser.add_argument('--batch-size', type=int, default=500)
+    export_parser.add_argument('--dtype', choices=DTYPES, default='float32',
+                               help='float16 halves the vectors at a small precision cost')
+    import_parser = commands.add_parser('import', help='add an archived wardrobe to this deployment')
+    import_parser.add_argument('archive', help="archive path, or - for stdin")
+    import_parser.add_argument('--as-user', help="import into this user instead of the exporting one")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'export':
+        count = export_user(args.user, args.out, batch_size=args.batch_size, dtype=args.dtype)
+        verb = 'Exported'
+    else:
+        count = import_archive(args.archive, username=args.as_user)
+        verb = 'Imported'
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0.0
+    print(f"{verb} {count} items in {elapsed:.1f}s ({rate:.0f} items/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Single-process deployment: the Flask UI and the API in one ASGI app.
+
+    uvicorn unified:app --host 0.0.0.0 --port 5000
+
+The web routes call the API handlers directly on the server's event loop
+instead of over HTTP to a separate uvicorn, so a request is no longer
+serialized twice or held by a worker on each side. Sessions and routes are
+unchanged; the API itself stays reachable under ``/api`` (e.g. for
+``benchmarks.e2e --api-url http://localhost:5000/api``).
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+import log_config
+
+log_config.configure_logging("unified")
+
+import api_service
+import app as web
+
+try:
+    # Streams request bodies; the Starlette fallback buffers them
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from fastapi.middleware.wsgi import WSGIMiddleware
+
+
+async def _next_line(lines):
+    line = await anext(lines, None)
+    return line.encode() if isinstance(line, str) else line
+
+
+class InProcessApi:
+    """Drop-in for ``app.HttpApi`` that awaits the API handlers on ``loop``.
+
+    Flask runs on WSGI worker threads, so each call is submitted to the event
+    loop and waited for; the request's context (and request ID) goes with it.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def _run(self, coroutine):
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+        except HTTPException as e:
+            # Same body the HTTP client would have received
+            return {"detail": e.detail}
+
+    def process_image(self, image_id, filename, image_path, content_hash):
+        self._run(api_service.process_image(image_id, filename, image_path, content_hash))
+
+    def processing_status(self, image_id):
+        return self._run(api_service.get_processing_status(image_id))
+
+    def prefetch(self, username):
+        self._run(api_service.prefetch_recommendations(api_service.RecommendationRequest(username=username)))
+
+    def similar_items(self, username, image_id, limit=10, offset=0):
+        return self._run(api_service.similar_items(api_service.SimilarItemsRequest(
+            username=username, image_id=image_id, limit=limit, offset=offset)))
+
+    def pairings(self, username, limit=10):
+        return self._run(api_service.pairings(api_service.PairingsRequest(username=username, limit=limit)))
+
+    def delete_items(self, username, image_ids=None):
+        return self._run(api_service.delete_wardrobe_items(
+            api_service.DeleteRequest(username=username, image_ids=image_ids)))
+
+    def recommend(self, username):
+        return self._run(api_service.generate_recommendation(
+            api_service.RecommendationRequest(username=username)))
+
+    def recommend_for_apparel(self, username, image_id, description, apparel_type):
+        return self._run(api_service.generate_recommendation_for_apparel(api_service.ApparelRecommendationRequest(
+            username=username, image_id=image_id, description=description, apparel_type=apparel_type)))
+
+    def recommend_for_text(self, username, input_text):
+        return self._run(api_service.generate_recommendation_based_on_text(
+            api_service.TextRecommendationRequest(username=username, input_text=input_text)))
+
+    def stream_recommendation_for_text(self, username, input_text):
+        response = self._run(api_service.stream_recommendation_based_on_text(
+            api_service.TextRecommendationRequest(username=username, input_text=input_text)))
+        body = response.body_iterator
+
+        def lines():
+            try:
+                while True:
+                    line = asyncio.run_coroutine_threadsafe(_next_line(body), self.loop).result()
+                    if line is None:
+                        break
+                    yield line
+            finally:
+                asyncio.run_coroutine_threadsafe(body.aclose(), self.loop).result()
+
+        return lines()
+
+
+@asynccontextmanager
+async def lifespan(_):
+    previous = web.api
+    web.api = InProcessApi(asyncio.get_running_loop())
+    yield
+    web.api = previous
+
+
+os.makedirs(web.UPLOAD_FOLDER, exist_ok=True)
+os.makedirs('user_metadata', exist_ok=True)
+
+app = FastAPI(lifespan=lifespan)
+app.mount("/api", api_service.app)
+app.mount("/", WSGIMiddleware(web.app))
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
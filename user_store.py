@@ -0,0 +1,93 @@
+import os
+import re
+import json
+import time
+import sqlite3
+from werkzeug.security import generate_password_hash, check_password_hash
+from sqlite_store import SQLiteStore, import_legacy_json
+
+# Registered users, shared by every web worker process on the host
+USER_DB_PATH = os.environ.get("WEARWIZ_USER_DB", "./users.db")
+# Plain-text registry of earlier versions, imported (and renamed) on first start
+LEGACY_USERS_PATH = 'users.json'
+# Usernames name upload directories and metadata files, so no separators or dot-names
+USERNAME_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,63}')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Checked against when the username is unknown, so a failed login takes as
+# long whether or not the user exists
+_DUMMY_HASH = generate_password_hash('wearwiz')
+
+
+def valid_username(username):
+    """Whether ``username`` is safe to use as a path component"""
+    return isinstance(username, str) and USERNAME_PATTERN.fullmatch(username) is not None
+
+
+class UserStore(SQLiteStore):
+    """Users keyed by username in SQLite, with salted password hashes.
+
+    A login is one primary-key lookup plus one hash check, independent of how
+    many users are registered, and a registration is a single insert that
+    fails atomically if another worker took the username first. Passwords are
+    hashed before the database is touched, so no lock is held while hashing.
+    """
+
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path=USER_DB_PATH):
+        super().__init__(path)
+
+    def create(self, username, password, **profile):
+        """Register a user; False if the username is already taken"""
+        password_hash = generate_password_hash(password)
+        try:
+            self._connection().execute(
+                "INSERT INTO users (username, password_hash, profile, created_at) VALUES (?, ?, ?, ?)",
+                (username, password_hash, json.dumps(profile), time.time())
+            )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def exists(self, username):
+        return self._connection().execute(
+            "SELECT 1 FROM users WHERE username = ?", (username,)
+        ).fetchone() is not None
+
+    def get(self, username):
+        """The user's profile fields and username, or None (never the password hash)"""
+        row = self._connection().execute(
+            "SELECT profile FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return None if row is None else dict(json.loads(row[0]), username=username)
+
+    def authenticate(self, username, password):
+        row = self._connection().execute(
+            "SELECT password_hash FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            check_password_hash(_DUMMY_HASH, password)
+            return False
+        return check_password_hash(row[0], password)
+
+    def import_legacy(self, path=LEGACY_USERS_PATH):
+        """Move users from a plain-text users.json into the store, hashing their
+        passwords, then rename the file so it is not imported again"""
+        return import_legacy_json(path, self._import_users, 'users')
+
+    def _import_users(self, data):
+        imported = 0
+        for user in data.get('users', []):
+            profile = {key: value for key, value in user.items() if key not in ('username', 'password')}
+            if not self.exists(user['username']) and self.create(user['username'], user.get('password', ''), **profile):
+                imported += 1
+        return imported
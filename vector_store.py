@@ -0,0 +1,564 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import embedding_codec
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+APPAREL_TYPES = ['top', 'bottom', 'outerwear', 'full-body']
+
+# Collection layouts: one collection per (user, category), or one per category
+# shared by all users and filtered on the ``username`` metadata field.
+LAYOUTS = ('per_user', 'shared')
+
+# NumPy collections kept open per process; each holds one or two memory maps
+# (and their file descriptors), so the least recently used are closed
+MAX_OPEN_COLLECTIONS = int(os.environ.get("WEARWIZ_NUMPY_OPEN_COLLECTIONS", "256"))
+
+
+class ChromaBackend:
+    """Vector backend backed by a persistent ChromaDB client"""
+
+    def __init__(self, persist_directory):
+        import chromadb
+        from chromadb.config import Settings
+        self.client = chromadb.Client(Settings(
+            persist_directory=persist_directory,
+            is_persistent=True
+        ))
+
+    def get_or_create_collection(self, name, metadata=None):
+        try:
+            return self.client.get_collection(name=name)
+        except Exception:
+            logger.info("Collection %s not found.. creating the collection", name)
+            return self.client.create_collection(name=name, metadata=metadata)
+
+    def list_collection_names(self):
+        return [c if isinstance(c, str) else c.name for c in self.client.list_collections()]
+
+    def delete_collection(self, name):
+        self.client.delete_collection(name=name)
+
+
+class NumpyBackend:
+    """Exact cosine search over per-collection embedding matrices on disk.
+
+    Each collection lives in its own directory under ``root`` and is meant for
+    the small (tens to hundreds of items) per-user wardrobes, where a single
+    matrix-vector product beats an HNSW index and its persistence overhead.
+    ``dtype`` selects how new collections store vectors (see embedding_codec).
+    At most ``max_open`` collections stay open; older ones are closed and
+    reopened from disk when next used.
+    """
+
+    def __init__(self, persist_directory, dtype='float32', max_open=MAX_OPEN_COLLECTIONS):
+        embedding_codec.storage_dtype(dtype)
+        self.root = os.path.join(persist_directory, 'numpy')
+        self.dtype = dtype
+        self.max_open = max(1, max_open)
+        os.makedirs(self.root, exist_ok=True)
+        self._collections = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name, metadata=None):
+        evicted = []
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = NumpyCollection(os.path.join(self.root, name), name, metadata, self.dtype)
+                self._collections[name] = collection
+                while len(self._collections) > self.max_open:
+                    evicted.append(self._collections.popitem(last=False)[1])
+            else:
+                self._collections.move_to_end(name)
+        for old in evicted:
+            old.close()
+        return collection
+
+    def list_collection_names(self):
+        return sorted(
+            entry for entry in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, entry, 'collection.json'))
+        )
+
+    def delete_collection(self, name):
+        with self._lock:
+            collection = self._collections.pop(name, None)
+        if collection is None:
+            collection = NumpyCollection(os.path.join(self.root, name), name)
+        # The directory and its lock file stay, so workers still holding the
+        # collection keep locking the same file and see it as emptied
+        collection.drop()
+
+
+class NumpyCollection:
+    """A single collection: contiguous vectors plus one JSON record per row.
+
+    ``vectors.<f32|f16|i8>`` holds L2-normalized rows in the collection's
+    storage dtype and is memory-mapped for queries (int8 rows also have a
+    float32 scale in ``scales.f32``); ``records.jsonl`` holds the id, document
+    and metadata of each row in the same order. Adds append to the files,
+    deletes rewrite them. The dtype is fixed when the collection is created.
+    """
+
+    def __init__(self, path, name, metadata=None, dtype='float32'):
+        self.path = path
+        self.name = name
+        self._lock = threading.RLock()
+        self._records_path = os.path.join(path, 'records.jsonl')
+        self._scales_path = os.path.join(path, 'scales.f32')
+        self._info_path = os.path.join(path, 'collection.json')
+        os.makedirs(path, exist_ok=True)
+
+        if os.path.exists(self._info_path):
+            with open(self._info_path, 'r') as f:
+                self._info = json.load(f)
+        else:
+            self._info = {'name': name, 'dim': None, 'dtype': dtype, 'metadata': metadata or {}}
+            self._write_info()
+
+        self.metadata = self._info.get('metadata', {})
+        self.dtype = self._info.get('dtype', 'float32')
+        self._vectors_path = os.path.join(path, f'vectors.{embedding_codec.file_suffix(self.dtype)}')
+        self._matrix = None
+        self._scales = None
+        self._records = []
+        self._id_to_row = {}
+        self._field_index = {}
+        self._loaded_sizes = None
+
+    # -- persistence -------------------------------------------------------
+
+    def _write_info(self):
+        tmp_path = self._info_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._info, f)
+        os.replace(tmp_path, self._info_path)
+
+    def _file_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        return FileLock(os.path.join(self.path, '.lock'))
+
+    def _file_sizes(self):
+        sizes = []
+        for file_path in (self._vectors_path, self._records_path):
+            try:
+                stat = os.stat(file_path)
+                sizes.append((stat.st_size, stat.st_mtime_ns, stat.st_ino))
+            except FileNotFoundError:
+                sizes.append(None)
+        return tuple(sizes)
+
+    def _refresh(self, have_file_lock=False):
+        """Reload rows if another worker appended to or rewrote the files"""
+        if self._file_sizes() == self._loaded_sizes:
+            return
+        if not have_file_lock:
+            with self._file_lock():
+                return self._refresh(have_file_lock=True)
+
+        records = []
+        if os.path.exists(self._records_path):
+            with open(self._records_path, 'r') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+
+        if not os.path.exists(self._info_path):
+            # Dropped by another worker: carry on empty, the next add writes the info again
+            self._info['dim'] = None
+        elif self._info.get('dim') is None:
+            with open(self._info_path, 'r') as f:
+                self._info = json.load(f)
+
+        self._records = records
+        self._id_to_row = {record['id']: row for row, record in enumerate(records)}
+        self._field_index = {}
+        self._remap()
+        self._loaded_sizes = self._file_sizes()
+
+    def _remap(self):
+        """Memory-map the first ``len(self._records)`` rows of the vector files"""
+        dim = self._info.get('dim')
+        storage_dtype = embedding_codec.storage_dtype(self.dtype)
+        if self._records and dim:
+            self._matrix = np.memmap(self._vectors_path, dtype=storage_dtype, mode='r',
+                                     shape=(len(self._records), dim))
+            if self.dtype == 'int8':
+                self._scales = np.memmap(self._scales_path, dtype=np.float32, mode='r',
+                                         shape=(len(self._records),))
+        else:
+            self._matrix = np.zeros((0, dim or 0), dtype=storage_dtype)
+            self._scales = np.zeros((0,), dtype=np.float32) if self.dtype == 'int8' else None
+
+    def _rewrite(self, keep_rows):
+        """Compact the collection down to ``keep_rows`` (called with locks held)"""
+        matrix = np.ascontiguousarray(self._matrix[keep_rows])
+        records = [self._records[row] for row in keep_rows]
+
+        tmp_vectors = self._vectors_path + '.tmp'
+        tmp_records = self._records_path + '.tmp'
+        matrix.tofile(tmp_vectors)
+        with open(tmp_records, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        if self._scales is not None:
+            tmp_scales = self._scales_path + '.tmp'
+            np.ascontiguousarray(self._scales[keep_rows]).tofile(tmp_scales)
+            os.replace(tmp_scales, self._scales_path)
+        os.replace(tmp_vectors, self._vectors_path)
+        os.replace(tmp_records, self._records_path)
+        self._loaded_sizes = None
+
+    def _vectors(self, rows):
+        """Decoded float32 vectors for ``rows``"""
+        scales = self._scales[rows] if self._scales is not None else None
+        return embedding_codec.decode(self._matrix[rows], scales)
+
+    def close(self):
+        """Release the memory maps; the next call reloads the collection from disk"""
+        with self._lock:
+            self._matrix = None
+            self._scales = None
+            self._records = []
+            self._id_to_row = {}
+            self._field_index = {}
+            self._loaded_sizes = None
+
+    def drop(self):
+        with self._lock, self._file_lock():
+            for file_path in (self._vectors_path, self._scales_path, self._records_path, self._info_path):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            self._info['dim'] = None
+            self._matrix = None
+            self._scales = None
+            self._records = []
+            self._id_to_row = {}
+            self._field_index = {}
+            self._loaded_sizes = None
+
+    # -- collection API ----------------------------------------------------
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._records)
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+
+        with self._lock, self._file_lock():
+            self._refresh(have_file_lock=True)
+            if self._info.get('dim') is None:
+                self._info['dim'] = int(vectors.shape[1])
+                self._write_info()
+            elif vectors.shape[1] != self._info['dim']:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match "
+                    f"collection {self.name} dimension {self._info['dim']}"
+                )
+
+            new_rows = []
+            for i, item_id in enumerate(ids):
+                if item_id in self._id_to_row:
+                    logger.warning("Skipping existing embedding ID %s in collection %s", item_id, self.name)
+                    continue
+                new_rows.append(i)
+            if not new_rows:
+                return
+
+            codes, scales = embedding_codec.encode(vectors[new_rows], self.dtype)
+            with open(self._vectors_path, 'ab') as f:
+                f.write(codes.tobytes())
+            if scales is not None:
+                with open(self._scales_path, 'ab') as f:
+                    f.write(scales.tobytes())
+            records = [{'id': ids[i], 'document': documents[i], 'metadata': metadatas[i]}
+                       for i in new_rows]
+            with open(self._records_path, 'a') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+
+            # Extend the in-memory view instead of re-reading the whole collection
+            for record in records:
+                row = len(self._records)
+                self._records.append(record)
+                self._id_to_row[record['id']] = row
+                for key, index in self._field_index.items():
+                    field_value = (record['metadata'] or {}).get(key)
+                    if isinstance(field_value, (str, int, float, bool)):
+                        index.setdefault(field_value, []).append(row)
+            self._remap()
+            self._loaded_sizes = self._file_sizes()
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        with self._lock:
+            self.delete(ids=ids)
+            self.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None):
+        with self._lock, self._file_lock():
+            self._refresh(have_file_lock=True)
+            drop = set(self._select_rows(ids, where))
+            if not drop:
+                return
+            keep_rows = [row for row in range(len(self._records)) if row not in drop]
+            self._rewrite(keep_rows)
+
+    def get(self, ids=None, where=None, include=('metadatas', 'documents'), limit=None, offset=None):
+        with self._lock:
+            self._refresh()
+            rows = self._select_rows(ids, where)
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            result = {'ids': [self._records[row]['id'] for row in rows]}
+            if 'metadatas' in include:
+                result['metadatas'] = [self._records[row]['metadata'] for row in rows]
+            if 'documents' in include:
+                result['documents'] = [self._records[row]['document'] for row in rows]
+            if 'embeddings' in include:
+                result['embeddings'] = list(self._vectors(rows)) if rows else []
+            return result
+
+    def query(self, query_embeddings, n_results=10, where=None,
+              include=('metadatas', 'documents', 'distances')):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self._refresh()
+            rows = np.asarray(self._select_rows(None, where), dtype=np.int64)
+            result = {key: [] for key in ('ids', 'metadatas', 'documents', 'distances')
+                      if key == 'ids' or key in include}
+
+            if len(rows) == 0:
+                for key in result:
+                    result[key] = [[] for _ in range(len(queries))]
+                return result
+
+            if len(rows) == len(self._records):
+                matrix, scales = self._matrix, self._scales
+            else:
+                matrix = self._matrix[rows]
+                scales = self._scales[rows] if self._scales is not None else None
+            similarities = embedding_codec.dot(queries, matrix, scales)
+            k = min(n_results, len(rows))
+
+            for scores in similarities:
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                hits = [self._records[row] for row in rows[top]]
+                result['ids'].append([hit['id'] for hit in hits])
+                if 'metadatas' in result:
+                    result['metadatas'].append([hit['metadata'] for hit in hits])
+                if 'documents' in result:
+                    result['documents'].append([hit['document'] for hit in hits])
+                if 'distances' in result:
+                    result['distances'].append((1.0 - scores[top]).tolist())
+            return result
+
+    def _select_rows(self, ids, where):
+        indexed = _indexable_clause(where) if where else None
+        if ids is not None:
+            rows = [self._id_to_row[item_id] for item_id in ids if item_id in self._id_to_row]
+        elif indexed:
+            # Equality and $in filters (e.g. the shared layout's username) narrow via an index
+            rows = list(self._rows_for(*indexed))
+        else:
+            rows = list(range(len(self._records)))
+        if where:
+            where = _compile_where(where)
+            rows = [row for row in rows if _matches(self._records[row]['metadata'] or {}, where)]
+        return rows
+
+    def _rows_for(self, key, value):
+        """Rows whose metadata ``key`` equals ``value`` (or one of its ``$in`` values), via a lazily built index"""
+        if key not in self._field_index:
+            index = {}
+            for row, record in enumerate(self._records):
+                field_value = (record['metadata'] or {}).get(key)
+                if isinstance(field_value, (str, int, float, bool)):
+                    index.setdefault(field_value, []).append(row)
+            self._field_index[key] = index
+        index = self._field_index[key]
+        if isinstance(value, dict) and '$in' in value:
+            return sorted({row for member in value['$in'] for row in index.get(member, [])})
+        if isinstance(value, dict):
+            value = value['$eq']
+        return index.get(value, [])
+
+
+class UserScopedCollection:
+    """View of a shared per-category collection restricted to one user"""
+
+    def __init__(self, collection, username):
+        self.collection = collection
+        self.username = username
+        self.name = collection.name
+        self.metadata = collection.metadata
+
+    def _where(self, where):
+        scope = {"username": self.username}
+        return {"$and": [scope, where]} if where else scope
+
+    def count(self):
+        return len(self.collection.get(where=self._where(None), include=[])['ids'])
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        metadatas = [dict(metadata or {}, username=self.username) for metadata in (metadatas or [None] * len(ids))]
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        metadatas = [dict(metadata or {}, username=self.username) for metadata in (metadatas or [None] * len(ids))]
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None):
+        self.collection.delete(ids=ids, where=self._where(where))
+
+    def get(self, ids=None, where=None, include=('metadatas', 'documents'), limit=None, offset=None):
+        return self.collection.get(ids=ids, where=self._where(where), include=list(include),
+                                   limit=limit, offset=offset)
+
+    def query(self, query_embeddings, n_results=10, where=None,
+              include=('metadatas', 'documents', 'distances')):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results,
+                                     where=self._where(where), include=list(include))
+
+
+def collection_name(username, category, layout='per_user'):
+    if layout == 'shared':
+        return f"fashion_items_{category}"
+    return f"fashion_items_{username}_{category}"
+
+
+def parse_collection_name(name):
+    """Split a collection name into ``(username, category)``.
+
+    Shared-layout names give ``(None, category)``; names that are not wardrobe
+    collections give ``(None, None)``.
+    """
+    if not name.startswith("fashion_items_"):
+        return None, None
+    rest = name[len("fashion_items_"):]
+    if rest in APPAREL_TYPES:
+        return None, rest
+    for category in APPAREL_TYPES:
+        if rest.endswith(f"_{category}"):
+            return rest[:-len(category) - 1], category
+    return None, None
+
+
+def user_category_collection(backend, username, category, layout='per_user'):
+    """Get or create the collection holding a user's items of one category"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown collection layout '{layout}', expected one of {list(LAYOUTS)}")
+    if layout == 'shared':
+        collection = backend.get_or_create_collection(
+            collection_name(username, category, layout),
+            metadata={"hnsw:space": "cosine", "category": category}
+        )
+        return UserScopedCollection(collection, username)
+    return backend.get_or_create_collection(
+        collection_name(username, category, layout),
+        metadata={"hnsw:space": "cosine", "username": username, "category": category}
+    )
+
+
+def _indexable_clause(where):
+    """First top-level (or ``$and``-nested) equality or ``$in`` clause as ``(key, value)``"""
+    for key, condition in where.items():
+        if key == '$and':
+            for clause in condition:
+                indexed = _indexable_clause(clause)
+                if indexed:
+                    return indexed
+        elif not isinstance(condition, dict) or set(condition) in ({'$eq'}, {'$in'}):
+            return key, condition
+    return None
+
+
+def _compile_where(where):
+    """Copy of ``where`` with each ``$in`` list turned into a set, so matching a row is O(1) per clause"""
+    compiled = {}
+    for key, condition in where.items():
+        if key == '$and':
+            compiled[key] = [_compile_where(clause) for clause in condition]
+        elif isinstance(condition, dict) and '$in' in condition:
+            compiled[key] = dict(condition, **{'$in': frozenset(condition['$in'])})
+        else:
+            compiled[key] = condition
+    return compiled
+
+
+def _matches(metadata, where):
+    """Evaluate the equality / ``$in`` / ``$and`` subset of Chroma's ``where`` filters"""
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            if '$eq' in condition and metadata.get(key) != condition['$eq']:
+                return False
+            if '$in' in condition and metadata.get(key) not in condition['$in']:
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class FileLock:
+    """Exclusive advisory lock so several API workers can share a collection"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        return False
+
+
+BACKENDS = {
+    'chroma': ChromaBackend,
+    'numpy': NumpyBackend,
+}
+
+
+def create_backend(name, persist_directory, dtype='float32'):
+    """Instantiate the vector backend selected by configuration.
+
+    ``dtype`` only affects the NumPy backend; ChromaDB always stores float32.
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown vector backend '{name}', expected one of {sorted(BACKENDS)}")
+    if backend_class is NumpyBackend:
+        return backend_class(persist_directory, dtype=dtype)
+    return backend_class(persist_directory)